@@ -0,0 +1,91 @@
+"""
+This module defines the route exposing the metrics of the application to Prometheus.
+"""
+
+from typing import List
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from app.dependencies import rate_limit_storage
+from app.metrics import REGISTRY, CallbackMetric, Metric
+
+metrics_router = APIRouter()
+
+
+def application_metrics(request: Request) -> List[Metric]:
+    """
+    Builds the metrics read from the objects owned by the application at scrape time.
+
+    Args:
+        request: The scrape request, giving access to the application state.
+
+    Returns:
+        Metrics of the starred repositories cache, the stored response bodies, the GitHub circuit breaker, the refresh scheduler, the GitHub requests in flight and the rate limiter storage.
+    """
+    state = request.app.state
+    cache_stats = state.starred_cache.stats()
+    metrics: List[Metric] = [
+        CallbackMetric(
+            "star_retriever_cache_events_total", "Lookups, coalesced loads and evictions of the starred repositories cache, by event.",
+            ["event"], "counter",
+            lambda: {(event,): cache_stats[key] for event, key in [("hit", "hits"), ("stale_hit", "stale_hits"), ("miss", "misses"), ("coalesced", "coalesced"), ("eviction", "evictions")]},
+        ),
+        CallbackMetric(
+            "star_retriever_cache_entries", "Users whose starred repositories are cached.", [], "gauge",
+            lambda: {(): cache_stats["entries"]},
+        ),
+        CallbackMetric(
+            "star_retriever_cache_repositories", "Repositories held in the starred repositories cache.", [], "gauge",
+            lambda: {(): cache_stats["size"]},
+        ),
+        CallbackMetric(
+            "star_retriever_response_bodies_bytes", "Bytes of the encoded and compressed response bodies kept for cached lists.", [], "gauge",
+            lambda: {(): state.body_store.size},
+        ),
+        CallbackMetric(
+            "star_retriever_response_body_evictions_total", "Response bodies evicted to stay within the byte budget or the number of users.", [], "counter",
+            lambda: {(): state.body_store.evictions},
+        ),
+        CallbackMetric(
+            "star_retriever_github_circuit_open", "Whether calls to GitHub are failing fast, 1 while the circuit breaker is open.", [], "gauge",
+            lambda: {(): int(state.circuit_breaker.state == "open")},
+        ),
+        CallbackMetric(
+            "star_retriever_github_circuit_trips_total", "Times the circuit breaker of GitHub calls has opened.", [], "counter",
+            lambda: {(): state.circuit_breaker.trips},
+        ),
+        CallbackMetric(
+            "star_retriever_refresh_active_users", "Active users whose lists are refreshed in the background.", [], "gauge",
+            lambda: {(): len(state.refresh_scheduler)},
+        ),
+        CallbackMetric(
+            "star_retriever_http_requests_in_flight", "GitHub requests of the shared HTTP client sent and whose response is not closed yet.",
+            [], "gauge",
+            lambda: {(): state.github_transport.in_flight},
+        ),
+    ]
+    storage_stats = getattr(rate_limit_storage, "stats", None)
+    if storage_stats is not None:
+        rate_limit_stats = storage_stats()
+        metrics += [
+            CallbackMetric(
+                "star_retriever_rate_limit_checks_total", "Checks made against the rate limit storage.", [], "counter",
+                lambda: {(): rate_limit_stats["checks"]},
+            ),
+            CallbackMetric(
+                "star_retriever_rate_limit_check_seconds_total", "Time spent in checks against the rate limit storage.", [], "counter",
+                lambda: {(): rate_limit_stats["check_seconds"]},
+            ),
+        ]
+    return metrics
+
+
+@metrics_router.get("/metrics",
+    summary="Prometheus metrics",
+    description="Returns the metrics of the worker process that handles the request, in the Prometheus text format.",
+    response_class=PlainTextResponse,
+    include_in_schema=False)
+async def metrics(request: Request):
+    """
+    Renders the registered metrics and the metrics of the application state in the Prometheus text format.
+    """
+    return PlainTextResponse(REGISTRY.render(application_metrics(request)), media_type="text/plain; version=0.0.4; charset=utf-8")
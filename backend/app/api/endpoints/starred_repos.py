@@ -2,15 +2,32 @@
 This module defines the routes used for retrieving starred repositories.
 """
 
+import asyncio
+import hmac
 import logging
-from fastapi import APIRouter, Depends, HTTPException, Request
-from fastapi.responses import RedirectResponse
+import math
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Literal, MutableMapping, Optional, Union
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 import httpx
-from pydantic import ValidationError
 from fastapi import Query
-from app.schemas import Repository, StarredRepositoriesResponse
-from app.dependencies import get_http_client, limiter, get_settings
+from app.schemas import BatchRequest, SearchResponse, StarredRepositoriesResponse
+from app.cache import CachedPage, ETagStore, StarredReposCache
+from app.dependencies import get_batch_semaphore, get_etag_store, get_http_client, get_body_store, get_refresh_scheduler, get_circuit_breaker, get_index_store, get_rate_limits, get_repository_store, get_search_index_store, get_session_store, get_starred_cache, get_sync_store, limiter, get_settings
+from app.compression import BodyStore, respond_with_body
 from app.config import Settings
+from app.metrics import STAGE_SECONDS
+from app.github import fetch_user_id, iter_starred_pages, iter_starred_pages_graphql
+from app.query import IndexStore, RepositoryQuery, decode_cursor, encode_cursor
+from app.scheduler import RefreshScheduler
+from app.search import SearchIndexStore
+from app.store import RepositoryStore
+from app.sync import SyncStore, sync_starred_repos
+from app.upstream import CircuitBreaker, GitHubRateLimitedError, GitHubUnavailableError, RateLimitTracker
+from app.sessions import SESSION_COOKIE_NAME, SESSION_HEADER_NAME, Session, SessionStore
+from app.serialization import FastJSONResponse, dumps, project_graphql_repositories, project_repositories, starred_repositories_response
+from app.streaming import STREAM_MEDIA_TYPES, iter_pages, stream_chunks
 
 logger = logging.getLogger("uvicorn.error")
 
@@ -19,8 +36,8 @@ starred_repos_router = APIRouter()
 @starred_repos_router.get("/getStarredRepos",
     summary="Start OAuth Flow",
     description="Redirects the user to GitHub for OAuth authorization. This is the initial step in the OAuth flow, where the user is asked to authorize the application. Upon authorization, GitHub redirects back to the `/callback` endpoint with an authorization code.",
-    tags=["Starred Repos"])
-@limiter.limit("30/minute")
+    tags=["Starred Repos"],
+    dependencies=[Depends(limiter.limit("30/minute"))])
 async def getStarredRepos(request: Request, settings: Settings = Depends(get_settings)):
     """
     Redirects the user to GitHub for authorization.
@@ -34,47 +51,597 @@ async def getStarredRepos(request: Request, settings: Settings = Depends(get_set
     redirect_uri = settings.redirect_uri
     
     scope = "read:user,user:email"
-    return RedirectResponse(url=f"https://github.com/login/oauth/authorize?client_id={client_id}&redirect_uri={redirect_uri}&scope={scope}")
+    return RedirectResponse(url=f"{settings.github_oauth_url}/login/oauth/authorize?client_id={client_id}&redirect_uri={redirect_uri}&scope={scope}")
+
+def upstream_unavailable(error: GitHubUnavailableError) -> HTTPException:
+    """
+    Turns an error raised instead of calling GitHub into an HTTP error telling the client when to retry.
+
+    Args:
+        error: The error.
+
+    Returns:
+        An `HTTPException` with status 429 if the rate limit of the access token is exhausted and 503 otherwise,
+        with a `Retry-After` header.
+    """
+    status_code = 429 if isinstance(error, GitHubRateLimitedError) else 503
+    return HTTPException(status_code=status_code, detail=str(error), headers={"Retry-After": str(math.ceil(error.retry_after))})
+
+@contextmanager
+def github_fetch_errors() -> Iterator[None]:
+    """
+    Turns errors raised while fetching and parsing starred repositories into HTTP errors.
+
+    Raises:
+        HTTPException: With status 502 for a `ValueError`, which includes invalid JSON and invalid
+                       repository objects, or for a server error of GitHub that persisted through the retries,
+                       429 or 503 while GitHub is not called, see `upstream_unavailable`, 401 or 403 when GitHub
+                       rejects the access token of the user, for instance after it was revoked, and 500 for any other error.
+    """
+    try:
+        yield
+    except ValueError as e:
+        logger.error(f"Error parsing GitHub response: {e}")
+        raise HTTPException(status_code=502, detail=f"Error parsing GitHub response: {e}")
+    except GitHubUnavailableError as e:
+        logger.warning(f"Not fetching starred repositories from GitHub: {e}")
+        raise upstream_unavailable(e)
+    except httpx.HTTPStatusError as e:
+        logger.error(f"Failed to fetch starred repositories from GitHub: {e}")
+        if e.response.status_code >= 500:
+            raise HTTPException(status_code=502, detail="GitHub failed to return the starred repositories.")
+        if e.response.status_code == 401:
+            raise HTTPException(status_code=401, detail="GitHub rejected the access token of the user. Authorize the application again.")
+        if e.response.status_code == 403:
+            raise HTTPException(status_code=403, detail="GitHub denied the access token of the user access to the starred repositories.")
+        raise HTTPException(status_code=500, detail="Failed to fetch starred repositories from GitHub.")
+    except Exception as e:
+        logger.error(f"Failed to fetch starred repositories from GitHub: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch starred repositories from GitHub.")
+
+def page_concurrency(access_token: str, settings: Settings, rate_limits: Optional[RateLimitTracker]) -> Union[int, Callable[[], int]]:
+    """
+    Returns the concurrency of page requests for a user, shrinking with the rate limit left to the access token when it is tracked.
+
+    Args:
+        access_token: OAuth access token of the user.
+        settings: The application settings.
+        rate_limits: The tracker of the rate limits of access tokens, or None to always use `settings.github_page_concurrency`.
+    """
+    if rate_limits is None:
+        return settings.github_page_concurrency
+    return lambda: rate_limits.concurrency(access_token, settings.github_page_concurrency)
+
+def starred_pages(client: httpx.AsyncClient, access_token: str, settings: Settings, page_cache: Optional[MutableMapping[int, CachedPage]] = None, rate_limits: Optional[RateLimitTracker] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Fetches the projected pages of a user's starred repositories with the backend chosen in `settings.github_fetch_backend`.
+
+    Args:
+        client: The HTTP client used for GitHub requests.
+        access_token: OAuth access token of the user.
+        settings: The application settings.
+        page_cache: Previously fetched pages of the user with their ETags. Only used by the REST backend.
+        rate_limits: The tracker of the rate limits of access tokens, with which the REST backend adapts its concurrency.
+
+    Returns:
+        An async iterator over the pages, in the order GitHub returns them.
+    """
+    if settings.github_fetch_backend == "graphql":
+        return iter_starred_pages_graphql(client, access_token, per_page=settings.github_per_page, parse_page=project_graphql_repositories)
+    return iter_starred_pages(
+        client,
+        access_token,
+        per_page=settings.github_per_page,
+        concurrency=page_concurrency(access_token, settings, rate_limits),
+        parse_page=project_repositories,
+        page_cache=page_cache
+    )
+
+async def load_starred_repos(client: httpx.AsyncClient, access_token: str, settings: Settings, page_cache: Optional[MutableMapping[int, CachedPage]] = None, rate_limits: Optional[RateLimitTracker] = None) -> Dict[str, Any]:
+    """
+    Fetches the starred repositories of a user from GitHub and projects them into StarredRepositoriesResponse form.
+
+    Args:
+        client: The HTTP client used for GitHub requests.
+        access_token: OAuth access token of the user.
+        settings: The application settings.
+        page_cache: Previously fetched pages of the user with their ETags, used for conditional requests.
+        rate_limits: The tracker of the rate limits of access tokens, see `starred_pages`.
+
+    Returns:
+        The starred repositories, as a dictionary of the `StarredRepositoriesResponse` shape.
+
+    Raises:
+        HTTPException: As raised by `github_fetch_errors`.
+    """
+    # Attempt to fetch and parse every page of starred repositories
+    with github_fetch_errors(), STAGE_SECONDS.labels("fetch").time():
+        repositories = [item async for page in starred_pages(client, access_token, settings, page_cache, rate_limits) for item in page]
+
+    return starred_repositories_response(repositories)
+
+async def sync_starred_repos_of_user(client: httpx.AsyncClient, access_token: str, settings: Settings, sync_store: SyncStore, user_id: int, rate_limits: Optional[RateLimitTracker] = None) -> Dict[str, Any]:
+    """
+    Brings the starred repositories of a user up to date with an incremental sync and projects them into StarredRepositoriesResponse form.
+
+    Args:
+        client: The HTTP client used for GitHub requests.
+        access_token: OAuth access token of the user.
+        settings: The application settings.
+        sync_store: The store of sync states, updated with the new state of the user.
+        user_id: The GitHub user id.
+        rate_limits: The tracker of the rate limits of access tokens, see `starred_pages`.
+
+    Returns:
+        The starred repositories, as a dictionary of the `StarredRepositoriesResponse` shape.
+
+    Raises:
+        HTTPException: As raised by `github_fetch_errors`.
+    """
+    with github_fetch_errors(), STAGE_SECONDS.labels("fetch").time():
+        state = await sync_starred_repos(
+            client,
+            access_token,
+            sync_store.get(user_id),
+            per_page=settings.github_per_page,
+            concurrency=page_concurrency(access_token, settings, rate_limits),
+            full_sweep_interval=settings.github_full_sweep_interval
+        )
+    sync_store.set(user_id, state)
+    return starred_repositories_response(state.repositories)
+
+async def stream_starred_repos(client: httpx.AsyncClient, access_token: str, settings: Settings, cache: StarredReposCache, user_id: int, page_cache: MutableMapping[int, CachedPage], stream: str, get: Callable[[], Awaitable[Dict[str, Any]]], load_first: bool = False, on_loaded: Optional[Callable[[Dict[str, Any]], None]] = None, rate_limits: Optional[RateLimitTracker] = None) -> StreamingResponse:
+    """
+    Streams the starred repositories of a user in the requested format.
+
+    A list already in the cache or being loaded by another request, or any list when `load_first` is set, is
+    streamed from what `get` returns. Otherwise the pages are streamed as they arrive from GitHub and the assembled
+    list is cached once the last page has been fetched. The first page is fetched before the response starts, so
+    that a failure to reach GitHub is still reported with an error status.
+
+    Args:
+        client: The HTTP client used for GitHub requests.
+        access_token: OAuth access token of the user.
+        settings: The application settings.
+        cache: The cache of starred repositories.
+        user_id: The GitHub user id.
+        page_cache: Previously fetched pages of the user with their ETags.
+        stream: The streaming format, one of the keys of `STREAM_MEDIA_TYPES`.
+        get: Coroutine function returning the whole list from the cache, loading it if needed.
+        load_first: Whether to get the whole list with `get` on a cache miss instead of streaming the pages.
+        on_loaded: Called with the assembled list once every page has been fetched.
+        rate_limits: The tracker of the rate limits of access tokens, see `starred_pages`.
+
+    Returns:
+        A streaming response of the repositories.
+
+    Raises:
+        HTTPException: As raised by `github_fetch_errors`.
+    """
+    media_type = STREAM_MEDIA_TYPES[stream]
+    if load_first or cache.has(user_id) or cache.loading(user_id):
+        cached = await get()
+        return StreamingResponse(stream_chunks(stream, iter_pages(cached["repositories"], settings.github_per_page)), media_type=media_type)
+
+    # The fetch runs as the in-flight load of the user, so it completes and is cached even if the client
+    # disconnects, and concurrent requests for the user wait for it instead of fetching the list again
+    published: "asyncio.Queue[Optional[List[Dict[str, Any]]]]" = asyncio.Queue()
+
+    async def fetch_and_publish() -> Dict[str, Any]:
+        repositories = []
+        try:
+            with github_fetch_errors():
+                async for page in starred_pages(client, access_token, settings, page_cache, rate_limits):
+                    repositories.extend(page)
+                    published.put_nowait(page)
+        finally:
+            published.put_nowait(None)
+        starred_repos = starred_repositories_response(repositories)
+        if on_loaded is not None:
+            on_loaded(starred_repos)
+        return starred_repos
+
+    flight = cache.load(user_id, fetch_and_publish)
+    first_page = await published.get()
+    if first_page is None:
+        # Nothing was published, so the fetch failed before its first page or the list is empty
+        cached = await asyncio.shield(flight)
+        return StreamingResponse(stream_chunks(stream, iter_pages(cached["repositories"], settings.github_per_page)), media_type=media_type)
+
+    async def published_pages() -> AsyncIterator[List[Dict[str, Any]]]:
+        page = first_page
+        while page is not None:
+            yield page
+            page = await published.get()
+        # Raises the error of a fetch that failed after its first page
+        await asyncio.shield(flight)
+
+    return StreamingResponse(stream_chunks(stream, published_pages()), media_type=media_type)
+
+def repository_query(
+    topic: List[str] = Query([], description="Only return repositories with this topic. Repeat to require several topics."),
+    license: Optional[str] = Query(None, description="Only return repositories with this license name, for example `MIT License`."),
+    q: Optional[str] = Query(None, min_length=1, description="Only return repositories whose name or description contains this text."),
+    sort: Literal["starred", "-starred", "name", "-name"] = Query("starred", description="`starred` for the most recently starred first, `name` for alphabetical order, with a leading `-` to reverse."),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Maximum number of repositories to return."),
+    cursor: Optional[str] = Query(None, description="The `next_cursor` of the previous page."),
+) -> Optional[RepositoryQuery]:
+    """
+    Reads the filtering, sorting and pagination parameters of a request.
+
+    Returns:
+        The query, or None when no parameter is given and the whole list is requested.
+    """
+    query = RepositoryQuery(topics=topic, license=license, q=q, sort=sort, limit=limit, cursor=cursor)
+    return None if query == RepositoryQuery() else query
+
+def respond_with_query(starred_repos: Dict[str, Any], index_store: IndexStore, user_id: int, query: RepositoryQuery, stream: Optional[str], page_size: int) -> Response:
+    """
+    Builds the response with the page of a user's starred repositories matching a query.
+
+    The number of matching repositories and the cursor of the next page are returned in the
+    `X-Total-Count` and `X-Next-Cursor` headers, and in the body too unless the response is streamed.
+
+    Args:
+        starred_repos: The starred repositories of the user, of the `StarredRepositoriesResponse` shape.
+        index_store: The store of repository indexes.
+        user_id: The GitHub user id.
+        query: The query.
+        stream: The streaming format, or None for a single JSON response.
+        page_size: Number of repositories per streamed chunk.
+
+    Returns:
+        A JSON or streaming response of the matching repositories.
+
+    Raises:
+        HTTPException: With status 400 if the cursor is invalid.
+    """
+    try:
+        result = index_store.get(user_id, starred_repos["repositories"]).search(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"X-Total-Count": str(result.total)}
+    if result.next_cursor:
+        headers["X-Next-Cursor"] = result.next_cursor
+    if stream:
+        return StreamingResponse(stream_chunks(stream, iter_pages(result.repositories, page_size)), media_type=STREAM_MEDIA_TYPES[stream], headers=headers)
+    return FastJSONResponse({
+        "count": len(result.repositories),
+        "total": result.total,
+        "next_cursor": result.next_cursor,
+        "repositories": result.repositories,
+    }, headers=headers)
+
+async def restore_starred_repos(repository_store: RepositoryStore, cache: StarredReposCache, user_id: int) -> None:
+    """
+    Puts the list of a user saved in the repository store into the cache, if it is young enough to be served.
+
+    The list keeps its age, so a list older than the cache TTL is served stale and refreshed in the background.
+    Failures to read the store are logged and leave the cache untouched.
+
+    Args:
+        repository_store: The repository store.
+        cache: The cache of starred repositories.
+        user_id: The GitHub user id.
+    """
+    try:
+        stored = await repository_store.load(user_id)
+    except Exception as e:
+        logger.warning(f"Reading the starred repositories of user {user_id} from the repository store failed: {e}")
+        return
+    if stored is not None and stored[1] < cache.ttl + cache.stale_ttl:
+        repositories, age = stored
+        cache.set(user_id, starred_repositories_response(repositories), age=age)
+
+class StarredRepos:
+    """
+    Provides the starred repositories of users to the routes, from the cache when possible.
+
+    Injected as a dependency, it holds the settings and the shared stores a route needs to load, cache
+    and respond with the repositories of a user.
+
+    With a repository store, a list missing from the cache is looked up in the store before GitHub, and
+    every list fetched from GitHub is saved to the store. Every fetched list also updates the search
+    index of the user, if the user has one. When `settings.github_incremental_sync` is set, lists missing
+    from the cache are loaded with an incremental sync.
+
+    While GitHub fails, or is not called because the circuit breaker is open or the rate limit of the access
+    token is exhausted, the last known list of the user is served however old it is, if there is one.
+
+    Every user whose list is requested is marked as active, so that the refresh scheduler keeps their list fresh.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        settings: Settings = Depends(get_settings),
+        client: httpx.AsyncClient = Depends(get_http_client),
+        cache: StarredReposCache = Depends(get_starred_cache),
+        etag_store: ETagStore = Depends(get_etag_store),
+        sync_store: SyncStore = Depends(get_sync_store),
+        index_store: IndexStore = Depends(get_index_store),
+        search_index_store: SearchIndexStore = Depends(get_search_index_store),
+        repository_store: Optional[RepositoryStore] = Depends(get_repository_store),
+        rate_limits: RateLimitTracker = Depends(get_rate_limits),
+        circuit_breaker: CircuitBreaker = Depends(get_circuit_breaker),
+        body_store: BodyStore = Depends(get_body_store),
+        refresh_scheduler: RefreshScheduler = Depends(get_refresh_scheduler),
+    ):
+        self.request = request
+        self.settings = settings
+        self.client = client
+        self.cache = cache
+        self.etag_store = etag_store
+        self.sync_store = sync_store
+        self.index_store = index_store
+        self.search_index_store = search_index_store
+        self.repository_store = repository_store
+        self.rate_limits = rate_limits
+        self.circuit_breaker = circuit_breaker
+        self.body_store = body_store
+        self.refresh_scheduler = refresh_scheduler
+
+    @property
+    def incremental(self) -> bool:
+        """
+        Whether lists are loaded with an incremental sync. Only the REST backend supports it.
+        """
+        return self.settings.github_incremental_sync and self.settings.github_fetch_backend == "rest"
+
+    def upstream_available(self, access_token: str) -> bool:
+        """
+        Tells whether GitHub would be called for a user, rather than failing fast.
+
+        Args:
+            access_token: OAuth access token of the user.
+        """
+        return self.circuit_breaker.state != "open" and self.rate_limits.retry_after(access_token) is None
+
+    def save(self, user_id: int, starred_repos: Dict[str, Any]) -> None:
+        """
+        Saves a list fetched from GitHub to the repository store and updates the search index of the user.
+
+        Args:
+            user_id: The GitHub user id.
+            starred_repos: The starred repositories, of the `StarredRepositoriesResponse` shape.
+        """
+        if self.repository_store is not None:
+            self.repository_store.save(user_id, starred_repos["repositories"])
+        self.search_index_store.refresh(user_id, starred_repos["repositories"])
+
+    async def load(self, user_id: int, access_token: str) -> Dict[str, Any]:
+        """
+        Fetches the starred repositories of a user from GitHub, bypassing the cache, and saves them.
+
+        Args:
+            user_id: The GitHub user id.
+            access_token: OAuth access token of the user.
+
+        Returns:
+            The starred repositories, as a dictionary of the `StarredRepositoriesResponse` shape.
+
+        Raises:
+            HTTPException: As raised by `github_fetch_errors`.
+        """
+        if self.incremental:
+            starred_repos = await sync_starred_repos_of_user(self.client, access_token, self.settings, self.sync_store, user_id, self.rate_limits)
+        else:
+            starred_repos = await load_starred_repos(self.client, access_token, self.settings, self.etag_store.pages(user_id), self.rate_limits)
+        self.save(user_id, starred_repos)
+        return starred_repos
+
+    async def restore(self, user_id: int) -> None:
+        """
+        Restores the list of a user missing from the cache from the repository store, if there is one.
+
+        Args:
+            user_id: The GitHub user id.
+        """
+        if self.repository_store is not None and not self.cache.has(user_id):
+            await restore_starred_repos(self.repository_store, self.cache, user_id)
+
+    async def last_known(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Returns the last known list of a user however old it is, from the cache or else from the repository store.
+
+        Args:
+            user_id: The GitHub user id.
+
+        Returns:
+            The starred repositories, as a dictionary of the `StarredRepositoriesResponse` shape, or None if none is known.
+        """
+        cached = self.cache.peek(user_id)
+        if cached is not None or self.repository_store is None:
+            return cached
+        try:
+            stored = await self.repository_store.load(user_id)
+        except Exception as e:
+            logger.warning(f"Reading the starred repositories of user {user_id} from the repository store failed: {e}")
+            return None
+        return starred_repositories_response(stored[0]) if stored is not None else None
+
+    async def get(self, user_id: int, access_token: str) -> Dict[str, Any]:
+        """
+        Returns the whole list of a user from the cache, loading it if needed.
+
+        Args:
+            user_id: The GitHub user id.
+            access_token: OAuth access token of the user.
+
+        Returns:
+            The starred repositories, as a dictionary of the `StarredRepositoriesResponse` shape.
+
+        Raises:
+            HTTPException: As raised by `github_fetch_errors`, except that the last known list is returned instead
+                           of an error with status 429, 502 or 503.
+        """
+        self.refresh_scheduler.touch(user_id, access_token)
+        await self.restore(user_id)
+        try:
+            return await self.cache.get_or_load(user_id, lambda: self.load(user_id, access_token))
+        except HTTPException as e:
+            if e.status_code not in (429, 502, 503):
+                raise
+            starred_repos = await self.last_known(user_id)
+            if starred_repos is None:
+                raise
+            logger.warning(f"Serving the last known starred repositories of user {user_id}: {e.detail}")
+            return starred_repos
+
+    async def respond(self, user_id: int, access_token: str, stream: Optional[str], query: Optional[RepositoryQuery] = None) -> Response:
+        """
+        Builds the response with the starred repositories of a user.
+
+        With a `query`, the whole list is loaded first and the matching page is returned with `respond_with_query`.
+        The whole list is sent as its stored encoded body, compressed as negotiated and with an ETag, see `app.compression`.
+
+        Args:
+            user_id: The GitHub user id.
+            access_token: OAuth access token of the user.
+            stream: The streaming format, or None for a single JSON response.
+            query: Filters, sort order and page of the request, or None for the whole list.
+
+        Returns:
+            A JSON or streaming response of the repositories.
+
+        Raises:
+            HTTPException: As raised by `get`, and with status 400 if the cursor of `query` is invalid.
+        """
+        if query is not None:
+            return respond_with_query(await self.get(user_id, access_token), self.index_store, user_id, query, stream, self.settings.github_per_page)
+
+        if stream:
+            self.refresh_scheduler.touch(user_id, access_token)
+            await self.restore(user_id)
+            return await stream_starred_repos(
+                self.client,
+                access_token,
+                self.settings,
+                self.cache,
+                user_id,
+                self.etag_store.pages(user_id),
+                stream,
+                lambda: self.get(user_id, access_token),
+                load_first=self.incremental or not self.upstream_available(access_token),
+                on_loaded=lambda starred_repos: self.save(user_id, starred_repos),
+                rate_limits=self.rate_limits,
+            )
+
+        return await respond_with_body(
+            self.body_store.get(user_id, await self.get(user_id, access_token)),
+            self.request.headers.get("Accept-Encoding", ""),
+            self.request.headers.get("If-None-Match"),
+            min_size=self.settings.response_compression_min_size,
+            offload_min_size=self.settings.response_compression_offload_min_size,
+        )
+
+def refresh_loader(app: FastAPI) -> Callable[[int, str], Awaitable[Dict[str, Any]]]:
+    """
+    Returns the loader with which the refresh scheduler of an application fetches lists, `StarredRepos.load` on the
+    shared state of the application.
+
+    Args:
+        app: The application, whose state is read when a list is loaded.
+
+    Returns:
+        A coroutine function taking the user id and access token of a user and returning their list.
+    """
+    async def load(user_id: int, access_token: str) -> Dict[str, Any]:
+        state = app.state
+        starred_repos = StarredRepos(
+            # Loading does not read the request, and background refreshes have none
+            request=None,
+            settings=get_settings(),
+            client=state.http_client,
+            cache=state.starred_cache,
+            etag_store=state.etag_store,
+            sync_store=state.sync_store,
+            index_store=state.index_store,
+            search_index_store=state.search_index_store,
+            repository_store=state.repository_store,
+            rate_limits=state.rate_limits,
+            circuit_breaker=state.circuit_breaker,
+            body_store=state.body_store,
+            refresh_scheduler=state.refresh_scheduler,
+        )
+        return await starred_repos.load(user_id, access_token)
+    return load
+
+async def current_session(request: Request, session_store: SessionStore = Depends(get_session_store)) -> Session:
+    """
+    Reads the session of a request from the session cookie or the session header.
+
+    Returns:
+        The session.
+
+    Raises:
+        HTTPException: With status 401 if the session is missing, invalid or expired.
+    """
+    token = request.cookies.get(SESSION_COOKIE_NAME) or request.headers.get(SESSION_HEADER_NAME)
+    session = await session_store.get(token) if token else None
+    if session is None:
+        raise HTTPException(status_code=401, detail="Missing, invalid or expired session.")
+    return session
 
 @starred_repos_router.get("/callback",
     summary="GitHub OAuth callback",
     description="Handles the callback from GitHub after user authorization. Exchanges the code for a token and fetches starred repos.",
     response_model=StarredRepositoriesResponse,
     responses={
+    200: {
+        "content": {"application/x-ndjson": {}},
+        "description": "The starred repositories. With `stream=ndjson` one repository per line, with `stream=json` the same document streamed incrementally."
+    },
     500: {
         "description": "Failed to connect to GitHub for access token or to fetch starred repositories."
     },
     502: {
-        "description": "Error parsing GitHub response."
+        "description": "Error parsing GitHub response, or GitHub kept failing."
+    },
+    429: {
+        "description": "The GitHub rate limit of the user is exhausted and no earlier list is known. See `Retry-After`."
+    },
+    503: {
+        "description": "GitHub is failing and no earlier list of the user is known. See `Retry-After`."
     },
     400: {
         "description": "Bad Request - issues with the request parameters."
     },
     },
-    tags=["Starred Repos"])
-@limiter.limit("30/minute")
-async def callback(request: Request, settings: Settings = Depends(get_settings), client: httpx.AsyncClient = Depends(get_http_client), code: str = Query(..., description="Authorization code for GitHub api")):
+    tags=["Starred Repos"],
+    dependencies=[Depends(limiter.limit("30/minute"))])
+async def callback(request: Request, settings: Settings = Depends(get_settings), client: httpx.AsyncClient = Depends(get_http_client), starred_repos: StarredRepos = Depends(), session_store: SessionStore = Depends(get_session_store), code: str = Query(..., description="Authorization code for GitHub api"), stream: Optional[Literal["ndjson", "json"]] = Query(None, description="Stream the repositories as they are fetched, as newline delimited JSON (`ndjson`) or as an incrementally written JSON document (`json`)"), query: Optional[RepositoryQuery] = Depends(repository_query)):
     """
     Handles the callback from GitHub OAuth flow.
 
     This endpoint is where GitHub redirects the user after they authorize the application. 
     It uses the provided `code` to obtain an access token from GitHub, which is then used to 
     fetch and return the user's starred repositories. These starred repos are then parsed into
-    StarredRepositoriesResponse form and returned.
+    StarredRepositoriesResponse form and returned. The fields are projected straight from the GitHub
+    JSON and encoded without revalidation, `response_model` only documents the schema. Parsed repositories are cached per GitHub user,
+    so repeated logins of the same user are served from the cache. Once the cached list expires,
+    pages are refetched conditionally with their stored ETags. With the `stream` parameter
+    the repositories are streamed page by page as they arrive from GitHub. The `topic`, `license`, `q`,
+    `sort`, `limit` and `cursor` parameters filter, sort and paginate the list on the server.
+
+    The response also starts a server-side session, handed to the client as a cookie and in the
+    `X-Session-Token` header, with which `/starred` returns the repositories again without a new OAuth flow.
     """
     client_id = settings.client_id
     client_secret = settings.client_secret
     # Attempt to get access token
     try:
-        response = await client.post(
-            'https://github.com/login/oauth/access_token',
-            data={
-                'client_id': client_id,
-                'client_secret': client_secret,
-                'code': code
-            },
-            headers={'Accept': 'application/json'}
-        )
+        with STAGE_SECONDS.labels("token_exchange").time():
+            response = await client.post(
+                f'{settings.github_oauth_url}/login/oauth/access_token',
+                data={
+                    'client_id': client_id,
+                    'client_secret': client_secret,
+                    'code': code
+                },
+                headers={'Accept': 'application/json'}
+            )
         response.raise_for_status()
     except Exception as e:
         logger.error(f"Failed to get access token from GitHub: {e}")
@@ -82,36 +649,251 @@ async def callback(request: Request, settings: Settings = Depends(get_settings),
     
     access_token = response.json()['access_token']
 
-    # Attempt to fetch starred repositories
+    # Attempt to identify the user, whose id is the key of the cache
     try:
-        starred_repos_response = await client.get(
-            'https://api.github.com/user/starred',
-            headers={'Authorization': f'token {access_token}'}
-        )
-        print(starred_repos_response)
-        starred_repos_response.raise_for_status()
+        with STAGE_SECONDS.labels("user").time():
+            user_id = await fetch_user_id(client, access_token)
+    except GitHubUnavailableError as e:
+        logger.warning(f"Not fetching user from GitHub: {e}")
+        raise upstream_unavailable(e)
     except Exception as e:
-        logger.error(f"Failed to fetch starred repositories from GitHub: {e}")
-        raise HTTPException(status_code=500, detail="Failed to fetch starred repositories from GitHub.")
+        logger.error(f"Failed to fetch user from GitHub: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch user from GitHub.")
 
-    starred_repos_data = starred_repos_response.json()
+    response = await starred_repos.respond(user_id, access_token, stream, query)
+
+    session_token = await session_store.create(user_id, access_token)
+    response.set_cookie(
+        SESSION_COOKIE_NAME,
+        session_token,
+        max_age=int(settings.session_ttl),
+        httponly=True,
+        samesite="lax",
+        secure=settings.redirect_uri.startswith("https://"),
+        path="/api",
+    )
+    response.headers[SESSION_HEADER_NAME] = session_token
+    return response
+
+@starred_repos_router.get("/starred",
+    summary="Starred repositories of the session",
+    description=f"Returns the starred repositories of the user of a session issued by `/callback`, without a new OAuth flow. The session token is read from the `{SESSION_COOKIE_NAME}` cookie or the `{SESSION_HEADER_NAME}` header.",
+    response_model=StarredRepositoriesResponse,
+    responses={
+    200: {
+        "content": {"application/x-ndjson": {}},
+        "description": "The starred repositories, streamed like in `/callback` when `stream` is given."
+    },
+    304: {
+        "description": "The list is unchanged since the response whose `ETag` was sent in `If-None-Match`."
+    },
+    400: {
+        "description": "Invalid cursor."
+    },
+    401: {
+        "description": "Missing, invalid or expired session, or GitHub rejected its access token."
+    },
+    403: {
+        "description": "GitHub denied the access token of the session access to the starred repositories."
+    },
+    500: {
+        "description": "Failed to fetch starred repositories."
+    },
+    502: {
+        "description": "Error parsing GitHub response, or GitHub kept failing."
+    },
+    429: {
+        "description": "The GitHub rate limit of the user is exhausted and no earlier list is known. See `Retry-After`."
+    },
+    503: {
+        "description": "GitHub is failing and no earlier list of the user is known. See `Retry-After`."
+    },
+    },
+    tags=["Starred Repos"],
+    dependencies=[Depends(limiter.limit("30/minute"))])
+async def starred(request: Request, starred_repos: StarredRepos = Depends(), session: Session = Depends(current_session), stream: Optional[Literal["ndjson", "json"]] = Query(None, description="Stream the repositories as in `/callback`"), query: Optional[RepositoryQuery] = Depends(repository_query)):
+    """
+    Returns the starred repositories of the user of a session.
 
-    # Parse and transform the response data
+    The access token stored in the session is used directly, so a refresh skips the redirect to GitHub
+    and the token exchange. It costs a single fetch of the starred list, or no upstream call at all when
+    the list is cached. The list can be filtered, sorted and paginated like in `/callback`.
+    """
+    return await starred_repos.respond(session.user_id, session.access_token, stream, query)
+
+@starred_repos_router.get("/search",
+    summary="Search the starred repositories of the session",
+    description="Returns the starred repositories of the user of a session containing every word of `q` in their name, description or topics, best matches first. The session is read like in `/starred`.",
+    response_model=SearchResponse,
+    responses={
+    400: {
+        "description": "Invalid cursor."
+    },
+    401: {
+        "description": "Missing, invalid or expired session, or GitHub rejected its access token."
+    },
+    403: {
+        "description": "GitHub denied the access token of the session access to the starred repositories."
+    },
+    500: {
+        "description": "Failed to fetch starred repositories."
+    },
+    502: {
+        "description": "Error parsing GitHub response, or GitHub kept failing."
+    },
+    429: {
+        "description": "The GitHub rate limit of the user is exhausted and no earlier list is known. See `Retry-After`."
+    },
+    503: {
+        "description": "GitHub is failing and no earlier list of the user is known. See `Retry-After`."
+    },
+    },
+    tags=["Starred Repos"],
+    dependencies=[Depends(limiter.limit("120/minute"))])
+async def search(request: Request, starred_repos: StarredRepos = Depends(), session: Session = Depends(current_session), q: str = Query(..., min_length=1, description="The words to search for. Every word must appear in the name, description or topics of a result."), limit: int = Query(20, ge=1, le=100, description="Maximum number of results to return."), cursor: Optional[str] = Query(None, description="The `next_cursor` of the previous page.")):
+    """
+    Searches the starred repositories of the user of a session.
+
+    Results are ranked with BM25 over an inverted index of the list of the user, built on the first search
+    and updated with the changed repositories whenever the list is fetched again. The list itself is
+    served from the cache like in `/starred`.
+    """
     try:
-        repositories = [
-            Repository(
-                name=repo['name'],
-                description=repo.get('description'),
-                url=repo['html_url'],
-                license=repo['license']['name'] if repo.get('license') else None,
-                topics=repo.get('topics', [])
-            ) for repo in starred_repos_data
-        ]
-        response_model = StarredRepositoriesResponse(
-            count=len(repositories),
-            repositories=repositories
-        )
-        return response_model
-    except ValidationError as e:
-        logger.error(f"Error parsing GitHub response: {e}")
-        raise HTTPException(status_code=502, detail=f"Error parsing GitHub response: {e}")
+        offset = decode_cursor(cursor, "relevance") if cursor else 0
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    repositories = (await starred_repos.get(session.user_id, session.access_token))["repositories"]
+    results, total = starred_repos.search_index_store.get(session.user_id, repositories).search(q, limit, offset)
+    end = offset + len(results)
+    return FastJSONResponse({
+        "count": len(results),
+        "total": total,
+        "next_cursor": encode_cursor("relevance", end) if end < total else None,
+        "repositories": [{**repository, "score": round(score, 4)} for score, repository in results],
+    })
+
+def batch_line(fields: Dict[str, Any], body: Optional[bytes] = None) -> bytes:
+    """
+    Encodes the result of one entry of a batch request as a line of newline delimited JSON.
+
+    Args:
+        fields: The fields of the line.
+        body: The encoded starred repositories of the user, spliced in as the `result` field without decoding them.
+
+    Returns:
+        The line.
+    """
+    line = dumps(fields)
+    if body is not None:
+        line = line[:-1] + b',"result":' + body + b"}"
+    return line + b"\n"
+
+async def batch_results(starred_repos: StarredRepos, semaphore: asyncio.Semaphore, entries: Dict[int, List[Dict[str, Any]]], access_tokens: Dict[int, Optional[str]]) -> AsyncIterator[bytes]:
+    """
+    Fetches the starred repositories of the users of a batch concurrently and yields a line per entry as each user completes.
+
+    Only users who need GitHub to be called hold a permit of `semaphore`, so that cached users and users whose
+    access token is rate limited, and who are answered from the last known list or with an error right away,
+    do not wait behind the others. Users without an access token are answered from their last known list.
+
+    Args:
+        starred_repos: The dependency providing the starred repositories.
+        semaphore: Bounds the number of users fetched at once over all batch requests.
+        entries: The fields identifying every entry of the request, keyed by the user id of the entry.
+        access_tokens: The access token of every user, or None if the user has no session.
+
+    Yields:
+        One line per entry, see `batch`.
+    """
+    async def starred_repos_of(user_id: int, access_token: Optional[str]) -> Dict[str, Any]:
+        if access_token is None:
+            starred = await starred_repos.last_known(user_id)
+            if starred is None:
+                raise HTTPException(status_code=404, detail="The user has no session and no known starred repositories.")
+            return starred
+        if starred_repos.cache.has(user_id) or not starred_repos.upstream_available(access_token):
+            return await starred_repos.get(user_id, access_token)
+        async with semaphore:
+            return await starred_repos.get(user_id, access_token)
+
+    tasks = {asyncio.ensure_future(starred_repos_of(user_id, access_tokens[user_id])): user_id for user_id in entries}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                user_id = tasks[task]
+                error = task.exception()
+                if error is None:
+                    body = starred_repos.body_store.get(user_id, task.result()).body
+                    yield b"".join(batch_line({**fields, "status": 200}, body) for fields in entries[user_id])
+                    continue
+                if not isinstance(error, HTTPException):
+                    logger.error(f"Fetching the starred repositories of user {user_id} for a batch failed: {error}")
+                    error = HTTPException(status_code=500, detail="Failed to fetch starred repositories.")
+                failure = {"status": error.status_code, "detail": error.detail}
+                if error.headers and "Retry-After" in error.headers:
+                    failure["retry_after"] = int(error.headers["Retry-After"])
+                yield b"".join(batch_line({**fields, **failure}) for fields in entries[user_id])
+    finally:
+        # The client went away or the response failed, so the remaining users are not needed anymore
+        for task in pending:
+            task.cancel()
+
+@starred_repos_router.post("/starred/batch",
+    summary="Starred repositories of many users",
+    description="Returns the starred repositories of many users in one response, as newline delimited JSON with a line per session and user id in the order in which they complete. Users are fetched concurrently, and a failure for one user is reported on its line instead of failing the whole batch.",
+    responses={
+    200: {
+        "content": {"application/x-ndjson": {}},
+        "description": "A line per entry with `session` (the index of the session in the request) or `user_id`, the `user_id` and a `status`. With status 200 the line holds the starred repositories as `result`, otherwise a `detail` and, when retrying later may help, `retry_after` in seconds."
+    },
+    400: {
+        "description": "Too many sessions and user ids in one request."
+    },
+    403: {
+        "description": "User ids were requested without the batch API key."
+    },
+    },
+    tags=["Starred Repos"],
+    dependencies=[Depends(limiter.limit("10/minute"))])
+async def batch(request: Request, batch_request: BatchRequest, starred_repos: StarredRepos = Depends(), session_store: SessionStore = Depends(get_session_store), semaphore: asyncio.Semaphore = Depends(get_batch_semaphore)):
+    """
+    Returns the starred repositories of the users of many sessions or user ids.
+
+    Sessions are the tokens issued by `/callback`. User ids are only accepted with the `X-API-Key` header set to
+    the batch API key, and are fetched with the access token of the latest session of the user.
+    Users without one are answered from their last known list, if there is one. Every user is fetched once
+    however many entries name them, and the users are fetched like in `/starred`, from the cache when possible,
+    with at most `batch_concurrency` users fetched from GitHub at once over all batch requests.
+    """
+    settings = starred_repos.settings
+    if len(batch_request.sessions) + len(batch_request.user_ids) > settings.batch_max_users:
+        raise HTTPException(status_code=400, detail=f"At most {settings.batch_max_users} sessions and user ids can be requested at once.")
+    if batch_request.user_ids and not (settings.batch_api_key and hmac.compare_digest(request.headers.get("X-API-Key", ""), settings.batch_api_key)):
+        raise HTTPException(status_code=403, detail="Requesting user ids requires the batch API key.")
+
+    invalid: List[bytes] = []
+    entries: Dict[int, List[Dict[str, Any]]] = {}
+    access_tokens: Dict[int, Optional[str]] = {}
+    for index, token in enumerate(batch_request.sessions):
+        session = await session_store.get(token)
+        if session is None:
+            invalid.append(batch_line({"session": index, "user_id": None, "status": 401, "detail": "Missing, invalid or expired session."}))
+            continue
+        entries.setdefault(session.user_id, []).append({"session": index, "user_id": session.user_id})
+        access_tokens.setdefault(session.user_id, session.access_token)
+    for user_id in batch_request.user_ids:
+        entries.setdefault(user_id, []).append({"user_id": user_id})
+        if access_tokens.get(user_id) is None:
+            session = await session_store.latest(user_id)
+            access_tokens[user_id] = session.access_token if session is not None else None
+
+    async def lines() -> AsyncIterator[bytes]:
+        if invalid:
+            yield b"".join(invalid)
+        async for chunk in batch_results(starred_repos, semaphore, entries, access_tokens):
+            yield chunk
+
+    return StreamingResponse(lines(), media_type=STREAM_MEDIA_TYPES["ndjson"])
@@ -0,0 +1,440 @@
+"""
+This module defines the server-side cache for starred repositories.
+
+Entries are keyed by GitHub user id. A fresh entry is served as is. An entry past its TTL but still within
+its stale window is served immediately while a refresh runs in the background (stale-while-revalidate).
+The cache is bounded both by the number of entries and by the total number of cached repositories, and the
+least recently used entries are evicted first.
+
+Loads are single-flight: concurrent requests for a key that is missing or being refreshed share one
+in-flight load and its result, instead of each fetching the same list from GitHub.
+
+Separately, `ETagStore` keeps the ETag of every fetched page of starred repositories together with the
+parsed page, so that pages can be refetched conditionally after the cached list has expired. It is bounded
+by the number of repositories on the stored pages as well, like the cache.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, Iterator, List, MutableMapping, Optional, TypeVar
+
+logger = logging.getLogger("uvicorn.error")
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """
+    Shares one in-flight load per key between concurrent callers.
+
+    Every load runs as a task of its own, so a caller that is cancelled, for example because its client
+    disconnected, neither cancels the load nor fails the other callers waiting for it. A failed load fails
+    every caller waiting for it, and the next caller starts a new load.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self._running(key) is not None
+
+    def __len__(self) -> int:
+        return sum(not flight.done() for flight in self._flights.values())
+
+    def _running(self, key: Hashable) -> Optional[asyncio.Future]:
+        # A finished flight stays registered until its done callbacks have run, and must not be joined
+        flight = self._flights.get(key)
+        return None if flight is None or flight.done() else flight
+
+    def run(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        """
+        Starts `loader` as a task unless a load for `key` is in flight.
+
+        Args:
+            key: The key of the load.
+            loader: Coroutine function producing the value.
+
+        Returns:
+            The in-flight load for `key`.
+        """
+        flight = self._running(key)
+        if flight is not None:
+            self.shared += 1
+            return flight
+        flight = self._flights[key] = asyncio.ensure_future(loader())
+        flight.add_done_callback(lambda done: self._finish(key, done))
+        return flight
+
+    def _finish(self, key: Hashable, flight: asyncio.Future) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Mark the exception as retrieved, since every caller waiting for the load may have gone away
+        if not flight.cancelled():
+            flight.exception()
+
+    async def join(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        """
+        Waits for the load of `key`, starting it with `loader` if none is in flight.
+
+        A load that was cancelled while the caller was waiting for it is started again.
+
+        Args:
+            key: The key of the load.
+            loader: Coroutine function producing the value.
+
+        Returns:
+            The loaded value.
+
+        Raises:
+            Exception: Whatever the load raised.
+        """
+        while True:
+            flight = self.run(key, loader)
+            # Unlike awaiting the flight, waiting for it does not cancel it when the caller is cancelled
+            await asyncio.wait([flight])
+            if not flight.cancelled():
+                return flight.result()
+
+    async def aclose(self) -> None:
+        """
+        Cancels the loads in flight.
+        """
+        flights = list(self._flights.values())
+        for flight in flights:
+            flight.cancel()
+        await asyncio.gather(*flights, return_exceptions=True)
+
+
+@dataclass
+class CacheEntry(Generic[T]):
+    """
+    A single cached value.
+
+    Attributes:
+        value: The cached value.
+        size: Size of the value as counted against the size bound of the cache.
+        expires_at: Monotonic time after which the value is stale.
+        stale_until: Monotonic time after which the value is no longer served at all.
+    """
+    value: T
+    size: int
+    expires_at: float
+    stale_until: float
+
+
+class StarredReposCache(Generic[T]):
+    """
+    An in-process TTL cache with LRU eviction and stale-while-revalidate.
+
+    Args:
+        ttl: Seconds a value is considered fresh.
+        stale_ttl: Seconds after expiry during which a stale value is still served while it is refreshed.
+        max_entries: Maximum number of cached entries.
+        max_size: Maximum total size of the cached values, as returned by `sizeof`.
+        sizeof: Function returning the size of a value. Defaults to counting every value as 1.
+        clock: Function returning the current monotonic time. Overridable for tests.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        stale_ttl: float,
+        max_entries: int,
+        max_size: int,
+        sizeof: Callable[[T], int] = lambda value: 1,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._sizeof = sizeof
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, CacheEntry[T]]" = OrderedDict()
+        self._size = 0
+        self._flights: SingleFlight[T] = SingleFlight()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def has(self, key: Hashable) -> bool:
+        """
+        Tells whether a value for `key` can be served, either fresh or stale.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            True if `get_or_load` would return without awaiting the loader.
+        """
+        entry = self._entries.get(key)
+        return entry is not None and self._clock() < entry.stale_until
+
+    def expires_in(self, key: Hashable) -> Optional[float]:
+        """
+        Returns the seconds until the value for `key` expires, negative once it has expired.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The seconds until expiry, or None if `key` is not cached.
+        """
+        entry = self._entries.get(key)
+        return entry.expires_at - self._clock() if entry is not None else None
+
+    def get(self, key: Hashable) -> Optional[T]:
+        """
+        Returns the value for `key` if it is fresh, without triggering a refresh.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or None if it is missing or stale.
+        """
+        entry = self._entries.get(key)
+        if entry is None or self._clock() >= entry.expires_at:
+            return None
+        self._entries.move_to_end(key)
+        return entry.value
+
+    def peek(self, key: Hashable) -> Optional[T]:
+        """
+        Returns the value for `key` however old it is, as long as it has not been evicted.
+
+        Args:
+            key: The cache key.
+
+        Returns:
+            The cached value, or None if it is missing.
+        """
+        entry = self._entries.get(key)
+        return entry.value if entry is not None else None
+
+    def set(self, key: Hashable, value: T, age: float = 0.0) -> None:
+        """
+        Stores `value` under `key` and evicts least recently used entries until the bounds hold.
+
+        Args:
+            key: The cache key.
+            value: The value to cache.
+            age: Seconds since the value was loaded, for values kept elsewhere before. They expire that much sooner.
+        """
+        now = self._clock() - age
+        self.discard(key)
+        entry = CacheEntry(value=value, size=self._sizeof(value), expires_at=now + self.ttl, stale_until=now + self.ttl + self.stale_ttl)
+        self._entries[key] = entry
+        self._size += entry.size
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._size > self.max_size):
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= evicted.size
+            self.evictions += 1
+
+    def discard(self, key: Hashable) -> None:
+        """
+        Removes `key` from the cache if present.
+
+        Args:
+            key: The cache key.
+        """
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry.size
+
+    def loading(self, key: Hashable) -> bool:
+        """
+        Tells whether a value for `key` is being loaded or refreshed.
+
+        Args:
+            key: The cache key.
+        """
+        return key in self._flights
+
+    def load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        """
+        Starts loading the value for `key` with `loader` and caching it, unless a load for `key` is in flight already.
+
+        Args:
+            key: The cache key.
+            loader: Coroutine function producing the value.
+
+        Returns:
+            The in-flight load, resolving to the loaded value.
+        """
+        return self._flights.run(key, lambda: self._load(key, loader))
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[T]]) -> T:
+        """
+        Returns the cached value for `key`, loading it with `loader` when needed.
+
+        A fresh value is returned directly. A stale value is returned directly and a background refresh
+        is started unless one is already running for `key`. Otherwise the value is loaded and cached, with
+        concurrent callers sharing a single call of `loader`.
+
+        Args:
+            key: The cache key.
+            loader: Coroutine function producing the value.
+
+        Returns:
+            The cached or freshly loaded value.
+        """
+        entry = self._entries.get(key)
+        now = self._clock()
+        if entry is not None and now < entry.expires_at:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry.value
+        if entry is not None and now < entry.stale_until:
+            self.stale_hits += 1
+            self._entries.move_to_end(key)
+            if key not in self._flights:
+                self.load(key, loader).add_done_callback(lambda refresh: self._log_failed_refresh(key, refresh))
+            return entry.value
+
+        self.misses += 1
+        return await self._flights.join(key, lambda: self._load(key, loader))
+
+    def _log_failed_refresh(self, key: Hashable, refresh: asyncio.Future) -> None:
+        if not refresh.cancelled() and refresh.exception() is not None:
+            logger.warning(f"Background refresh of cache entry {key} failed: {refresh.exception()}")
+
+    async def aclose(self) -> None:
+        """
+        Cancels running loads and background refreshes.
+        """
+        await self._flights.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the counters of the cache for monitoring.
+
+        Returns:
+            A dictionary with hit, stale hit, miss, coalesced load and eviction counts, the number of entries and their total size.
+        """
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self._flights.shared,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size": self._size,
+            "loading": len(self._flights),
+        }
+
+
+@dataclass
+class CachedPage:
+    """
+    A parsed page of starred repositories along with the validators needed to refetch it conditionally.
+
+    Attributes:
+        etag: The `ETag` header GitHub returned with the page.
+        last_page: Number of the last page, as read from the `Link` header of the page.
+        items: The parsed items of the page.
+    """
+    etag: Optional[str]
+    last_page: int
+    items: List[Any]
+
+
+class _UserPages(MutableMapping[int, CachedPage]):
+    """
+    The pages of one user in an `ETagStore`, reporting the change in their number of items to the store.
+    """
+
+    def __init__(self, on_resize: Callable[["_UserPages", int], None]):
+        self._pages: Dict[int, CachedPage] = {}
+        self._on_resize = on_resize
+        self.size = 0
+
+    def __getitem__(self, page: int) -> CachedPage:
+        return self._pages[page]
+
+    def __setitem__(self, page: int, cached: CachedPage) -> None:
+        replaced = self._pages.get(page)
+        self._pages[page] = cached
+        self._resize(len(cached.items) - (len(replaced.items) if replaced is not None else 0))
+
+    def __delitem__(self, page: int) -> None:
+        self._resize(-len(self._pages.pop(page).items))
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._pages)
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def _resize(self, delta: int) -> None:
+        self.size += delta
+        self._on_resize(self, delta)
+
+
+class ETagStore:
+    """
+    Stores the parsed pages of starred repositories and their ETags per user.
+
+    The store evicts the least recently used users while it holds the pages of more than `max_users` users or
+    more than `max_size` repositories over all pages.
+
+    Args:
+        max_users: Maximum number of users whose pages are kept.
+        max_size: Maximum number of repositories on the pages kept. The pages of the most recent user are kept even if they hold more.
+    """
+
+    def __init__(self, max_users: int, max_size: int):
+        self.max_users = max_users
+        self.max_size = max_size
+        self._users: "OrderedDict[Hashable, _UserPages]" = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def pages(self, user_id: Hashable) -> MutableMapping[int, CachedPage]:
+        """
+        Returns the stored pages of a user by page number, creating an empty mapping for a new user.
+
+        The returned mapping is owned by the store and is meant to be updated in place by the fetcher. Pages
+        stored in it count against `max_size` as they are stored.
+
+        Args:
+            user_id: The GitHub user id.
+
+        Returns:
+            The pages of the user.
+        """
+        pages = self._users.get(user_id)
+        if pages is None:
+            pages = self._users[user_id] = _UserPages(on_resize=lambda resized, delta: self._resize(user_id, resized, delta))
+            self._evict()
+        else:
+            self._users.move_to_end(user_id)
+        return pages
+
+    def _resize(self, user_id: Hashable, pages: _UserPages, delta: int) -> None:
+        # The pages may have been evicted while they were fetched
+        if self._users.get(user_id) is pages:
+            self.size += delta
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._users) > 1 and (len(self._users) > self.max_users or self.size > self.max_size):
+            _, evicted = self._users.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
@@ -0,0 +1,260 @@
+"""
+This module defines the compressed, conditionally served response bodies of cached starred repositories.
+
+The whole list of a user is served again and again while it is cached, so its JSON is encoded once per
+fetched list and kept in a `BodyStore` together with a strong ETag. Every compressed variant is made the
+first time a client asks for it and kept next to the JSON, so later responses send the stored bytes.
+Large bodies are compressed on a thread, so that compressing them does not block the event loop. The store
+is bounded by the bytes it holds, counting the JSON and the compressed variants of every body.
+
+The encoding is negotiated from `Accept-Encoding`. Brotli is offered when the `brotli` package is installed,
+gzip always. A request whose `If-None-Match` matches the ETag of the list is answered with 304 and no body.
+"""
+
+import asyncio
+import gzip
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from fastapi import Response
+from app.metrics import STAGE_SECONDS
+from app.serialization import dumps
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - depends on the environment
+    brotli = None
+
+ENCODINGS: Tuple[str, ...] = ("br", "gzip") if brotli is not None else ("gzip",)
+"""
+The supported content codings, most preferred first.
+"""
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """
+    Compresses a body with a content coding. gzip output carries no timestamp, so equal bodies compress to equal bytes.
+
+    Args:
+        body: The body.
+        encoding: One of `ENCODINGS`.
+
+    Returns:
+        The compressed body.
+    """
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Picks the content coding of a response from the `Accept-Encoding` header of the request.
+
+    Args:
+        accept_encoding: The header value, possibly empty.
+
+    Returns:
+        The accepted encoding of `ENCODINGS` with the highest quality, preferring the order of `ENCODINGS`
+        on ties, or None for an uncompressed response.
+    """
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, parameters = item.strip().partition(";")
+        quality = 1.0
+        name, _, value = parameters.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[coding.strip().lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    ranked = [(qualities.get(encoding, wildcard), -rank, encoding) for rank, encoding in enumerate(ENCODINGS)]
+    quality, _, encoding = max(ranked)
+    return encoding if quality > 0 else None
+
+
+class EncodedBody:
+    """
+    The JSON body of a response with its strong ETag and its compressed variants, made on demand.
+
+    Args:
+        content: The JSON serializable content of the body.
+        on_variant: Function called with the number of bytes of every compressed variant once it is made.
+    """
+
+    def __init__(self, content: Any, on_variant: Optional[Callable[[int], None]] = None):
+        with STAGE_SECONDS.labels("serialize").time():
+            self.body = dumps(content)
+        self.digest = hashlib.blake2b(self.body, digest_size=16).hexdigest()
+        self._variants: Dict[str, "asyncio.Future[bytes]"] = {}
+        self._on_variant = on_variant
+
+    def etag(self, encoding: Optional[str]) -> str:
+        """
+        Returns the strong ETag of the body in a content coding. Every coding has its own tag, sharing the digest of the JSON.
+        """
+        return f'"{self.digest}-{encoding}"' if encoding else f'"{self.digest}"'
+
+    def matches(self, if_none_match: str) -> bool:
+        """
+        Tells whether an `If-None-Match` header names this body in any of its codings.
+        """
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or any(tag.removeprefix("W/").strip('"').split("-")[0] == self.digest for tag in tags)
+
+    async def encoded(self, encoding: Optional[str], offload_min_size: int) -> bytes:
+        """
+        Returns the body in a content coding, compressing it the first time it is asked for.
+
+        Concurrent requests for a coding not compressed yet share one compression.
+
+        Args:
+            encoding: One of `ENCODINGS`, or None for the JSON.
+            offload_min_size: Size in bytes from which the body is compressed on a thread instead of the event loop.
+
+        Returns:
+            The encoded body.
+        """
+        if encoding is None:
+            return self.body
+        variant = self._variants.get(encoding)
+        if variant is None:
+            if len(self.body) >= offload_min_size:
+                variant = asyncio.ensure_future(asyncio.to_thread(compress, self.body, encoding))
+            else:
+                variant = asyncio.get_running_loop().create_future()
+                variant.set_result(compress(self.body, encoding))
+            self._variants[encoding] = variant
+            variant.add_done_callback(self._count_variant)
+        try:
+            # Shielded, so that a client going away does not cancel a compression other requests share
+            return await asyncio.shield(variant)
+        except Exception:
+            self._variants.pop(encoding, None)
+            raise
+
+    def _count_variant(self, variant: "asyncio.Future[bytes]") -> None:
+        if self._on_variant is not None and not variant.cancelled() and variant.exception() is None:
+            self._on_variant(len(variant.result()))
+
+    def size(self) -> int:
+        """
+        Returns the number of bytes held, counting the JSON and the compressed variants made so far.
+        """
+        return len(self.body) + sum(len(variant.result()) for variant in self._variants.values() if variant.done() and not variant.exception())
+
+
+async def respond_with_body(encoded_body: EncodedBody, accept_encoding: str, if_none_match: Optional[str], min_size: int, offload_min_size: int) -> Response:
+    """
+    Builds the response with an encoded body, compressed as negotiated, or a 304 response if the client has it already.
+
+    The responses are marked `private, no-cache`, so that clients keep them but revalidate them with their ETag.
+
+    Args:
+        encoded_body: The body.
+        accept_encoding: The `Accept-Encoding` header of the request.
+        if_none_match: The `If-None-Match` header of the request, if any.
+        min_size: Size in bytes below which the body is sent uncompressed.
+        offload_min_size: Size in bytes from which the body is compressed on a thread.
+
+    Returns:
+        The response.
+    """
+    encoding = negotiate_encoding(accept_encoding) if len(encoded_body.body) >= min_size else None
+    headers = {"ETag": encoded_body.etag(encoding), "Vary": "Accept-Encoding", "Cache-Control": "private, no-cache"}
+    if if_none_match and encoded_body.matches(if_none_match):
+        return Response(status_code=304, headers=headers)
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return Response(await encoded_body.encoded(encoding, offload_min_size), media_type="application/json", headers=headers)
+
+
+@dataclass
+class StoredBody:
+    """
+    The encoded body of the list of a user, as kept by `BodyStore`.
+
+    Attributes:
+        starred_repos: The list the body was encoded from.
+        encoded_body: The encoded body.
+        size: Number of bytes of the body counted against the bound of the store.
+    """
+    starred_repos: Dict[str, Any]
+    encoded_body: EncodedBody
+    size: int
+
+
+class BodyStore:
+    """
+    Keeps the encoded body of the latest list of every user, evicting the least recently used users while the store
+    holds more than `max_users` bodies or more than `max_bytes` bytes.
+
+    A body is encoded again when the list of the user has changed, compared as in `app.query.IndexStore`,
+    so the ETag of a list refetched without changes stays the same. The bytes of a body count its JSON and
+    every compressed variant from the moment it is made, so a stored body grows as clients ask for variants.
+
+    Args:
+        max_users: Maximum number of users whose body is kept.
+        max_bytes: Maximum number of bytes held over all bodies. The body of the most recent user is kept even if it is larger.
+    """
+
+    def __init__(self, max_users: int, max_bytes: int):
+        self.max_users = max_users
+        self.max_bytes = max_bytes
+        self._bodies: "OrderedDict[Hashable, StoredBody]" = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._bodies)
+
+    def get(self, user_id: Hashable, starred_repos: Dict[str, Any]) -> EncodedBody:
+        """
+        Returns the encoded body of a list, encoding it if the user has no body of that list.
+
+        Args:
+            user_id: The GitHub user id.
+            starred_repos: The current list of the user, of the `StarredRepositoriesResponse` shape.
+
+        Returns:
+            The encoded body of `starred_repos`.
+        """
+        stored = self._bodies.get(user_id)
+        if stored is not None and stored.starred_repos is not starred_repos and stored.starred_repos == starred_repos:
+            stored.starred_repos = starred_repos
+        if stored is None or stored.starred_repos is not starred_repos:
+            self.discard(user_id)
+            encoded_body = EncodedBody(starred_repos, on_variant=lambda size: self._grow(user_id, encoded_body, size))
+            stored = self._bodies[user_id] = StoredBody(starred_repos, encoded_body, len(encoded_body.body))
+            self.size += stored.size
+        self._bodies.move_to_end(user_id)
+        self._evict()
+        return stored.encoded_body
+
+    def discard(self, user_id: Hashable) -> None:
+        """
+        Removes the body of a user if present.
+
+        Args:
+            user_id: The GitHub user id.
+        """
+        stored = self._bodies.pop(user_id, None)
+        if stored is not None:
+            self.size -= stored.size
+
+    def _grow(self, user_id: Hashable, encoded_body: EncodedBody, size: int) -> None:
+        stored = self._bodies.get(user_id)
+        # The body may have been replaced or evicted while the variant was compressed
+        if stored is not None and stored.encoded_body is encoded_body:
+            stored.size += size
+            self.size += size
+            self._evict()
+
+    def _evict(self) -> None:
+        while len(self._bodies) > 1 and (len(self._bodies) > self.max_users or self.size > self.max_bytes):
+            _, evicted = self._bodies.popitem(last=False)
+            self.size -= evicted.size
+            self.evictions += 1
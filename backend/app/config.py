@@ -1,13 +1,36 @@
 """
 This module defines the configuration settings.
 """
-from pydantic import validator
+import os
+import tempfile
+from typing import Literal
+from pydantic import Field, validator
 from pydantic_settings import BaseSettings
 
-class Settings(BaseSettings):
+class RateLimitSettings(BaseSettings):
+    """
+    Configuration settings of the rate limiter, loaded from environment variables.
+
+    These are separate from `Settings` because the rate limiter is created when `app.dependencies` is imported,
+    before the OAuth credentials are necessarily available. `Settings` inherits them.
+
+    Attributes:
+        rate_limit_storage_uri (str): Storage of the rate limit counters. Defaults to a SQLite database in the temporary
+                                      directory, which all worker processes on the host share. `memory://` keeps the counters
+                                      in the process instead. Set with `RATE_LIMIT_STORAGE_URI`.
+
+        rate_limit_strategy (str): Rate limiting strategy of the `limits` package, `sliding-window-counter` by default.
+                                   Set with `RATE_LIMIT_STRATEGY`.
+    """
+    rate_limit_storage_uri: str = "sqlite:///" + os.path.join(tempfile.gettempdir(), "star-retriever-rate-limits.sqlite3")
+    rate_limit_strategy: str = "sliding-window-counter"
+
+class Settings(RateLimitSettings):
     """
     Configuration settings for the application, loaded from environment variables.
 
+    Includes the attributes of `RateLimitSettings`.
+
     Attributes:
         environment (str): Specifies the application's environment. Possible values are 'dev' for development and 'prod' for production. 
                            This setting determines various runtime behaviors, such as logging levels and database connection details. 
@@ -22,11 +45,189 @@ class Settings(BaseSettings):
 
         redirect_uri (str): The URI to which GitHub will redirect the user after authorization has been granted. 
                             It defaults to "http://localhost:8000/api/callback" but can be overridden by setting the `REDIRECT_URI` environment variable.
+
+        github_oauth_url (str): Root URL of the GitHub OAuth endpoints, "https://github.com" by default. Set with `GITHUB_OAUTH_URL`.
+
+        github_api_url (str): Root URL of the GitHub REST API, "https://api.github.com" by default. Set with `GITHUB_API_URL`.
+                              Together with `github_oauth_url` it allows pointing the application at a fake GitHub for load tests.
+
+        github_per_page (int): Number of starred repositories requested per page from the GitHub API. GitHub caps this at 100.
+                               Can be overridden with the `GITHUB_PER_PAGE` environment variable.
+
+        github_page_concurrency (int): Maximum number of starred repository pages fetched from GitHub at the same time.
+                                       Can be overridden with the `GITHUB_PAGE_CONCURRENCY` environment variable.
+
+        github_fetch_backend (str): API the starred repositories are fetched with, "rest" by default. "graphql" requests only the
+                                    returned fields through the GraphQL API at `{github_api_url}/graphql`, which transfers far less
+                                    data per repository but fetches the pages sequentially and without ETags. Set with `GITHUB_FETCH_BACKEND`.
+
+        github_incremental_sync (bool): Whether refreshes of users fetched before only page through their stars made since,
+                                        instead of fetching every page again. Applies to the REST backend only. Streamed
+                                        responses are then sent once the sync has finished. Set with `GITHUB_INCREMENTAL_SYNC`.
+
+        github_full_sweep_interval (float): Seconds after which an incremental sync fetches every page again, which is how
+                                            unstarred repositories are removed. Set with `GITHUB_FULL_SWEEP_INTERVAL`.
+
+        github_max_retries (int): Maximum number of retries of a GitHub API request failing with a server error, a connection
+                                  error or a secondary rate limit. Set with `GITHUB_MAX_RETRIES`.
+
+        github_retry_backoff (float): Upper bound in seconds of the jittered delay before the first retry, doubled for every
+                                      further retry. Set with `GITHUB_RETRY_BACKOFF`.
+
+        github_retry_max_wait (float): Longest delay in seconds waited before a retry. Requests GitHub asks to delay longer
+                                       with `Retry-After` fail instead. Set with `GITHUB_RETRY_MAX_WAIT`.
+
+        github_breaker_threshold (int): Number of consecutive GitHub API requests failing with a server or connection error after
+                                        which calls to GitHub fail fast. Rate limits of a token do not count.
+                                        Set with `GITHUB_BREAKER_THRESHOLD`.
+
+        github_breaker_reset (float): Seconds calls fail fast before a single request probes whether GitHub has recovered.
+                                      Set with `GITHUB_BREAKER_RESET`.
+
+        http_max_connections (int): Maximum number of connections in the shared HTTP client pool. Set with `HTTP_MAX_CONNECTIONS`.
+
+        http_max_keepalive_connections (int): Maximum number of idle connections kept alive in the pool. Set with `HTTP_MAX_KEEPALIVE_CONNECTIONS`.
+
+        http_keepalive_expiry (float): Seconds an idle connection is kept alive before it is closed. Set with `HTTP_KEEPALIVE_EXPIRY`.
+
+        http_timeout (float): Default timeout in seconds for reading, writing and acquiring a connection from the pool. Set with `HTTP_TIMEOUT`.
+
+        http_connect_timeout (float): Timeout in seconds for establishing a new connection. Set with `HTTP_CONNECT_TIMEOUT`.
+
+        http2 (bool): Enables HTTP/2 for the shared HTTP client. Requires the `h2` package (`pip install httpx[http2]`). Set with `HTTP2`.
+
+        cache_ttl (float): Seconds a user's cached starred repositories are served without refreshing. Set with `CACHE_TTL`.
+
+        cache_stale_ttl (float): Seconds after `cache_ttl` during which the cached list is still served while it is refreshed
+                                 in the background. Set with `CACHE_STALE_TTL`.
+
+        cache_max_entries (int): Maximum number of users whose starred repositories are cached, and whose repository
+                                 indexes for filtering and search and encoded
+                                 response bodies are kept, and of active users refreshed in the background.
+                                 Set with `CACHE_MAX_ENTRIES`.
+
+        cache_max_repositories (int): Maximum total number of repositories held in the cache, bounding its memory use.
+                                      Set with `CACHE_MAX_REPOSITORIES`.
+
+        refresh_calls_per_minute (int): Budget of GitHub calls per minute for refreshing the lists of active users in the
+                                        background before they expire. 0 disables background refreshes.
+                                        Set with `REFRESH_CALLS_PER_MINUTE`.
+
+        refresh_ahead (float): Seconds before the expiry of the cached list of an active user from which it is refreshed
+                               in the background. Set with `REFRESH_AHEAD`.
+
+        refresh_idle_after (float): Seconds after their latest request from which a user is no longer considered active.
+                                    Set with `REFRESH_IDLE_AFTER`.
+
+        refresh_min_remaining (float): Fraction of the GitHub rate limit of an access token below which the list of its
+                                       user is not refreshed in the background. Set with `REFRESH_MIN_REMAINING`.
+
+        response_compression_min_size (int): Size in bytes from which cached lists are sent compressed to clients accepting
+                                             gzip, or brotli when the `brotli` package is installed. Set with
+                                             `RESPONSE_COMPRESSION_MIN_SIZE`.
+
+        response_compression_offload_min_size (int): Size in bytes from which bodies are compressed on a thread instead of
+                                                     the event loop. Set with `RESPONSE_COMPRESSION_OFFLOAD_MIN_SIZE`.
+
+        response_body_max_bytes (int): Maximum number of bytes of the encoded and compressed bodies of cached lists kept for
+                                       sending them again, evicting the least recently used users first. Set with
+                                       `RESPONSE_BODY_MAX_BYTES`.
+
+        batch_max_users (int): Maximum number of sessions and user ids in one request to the batch endpoint. Set with `BATCH_MAX_USERS`.
+
+        batch_concurrency (int): Maximum number of users whose starred repositories are fetched from GitHub at once for
+                                 batch requests, over all batch requests of a worker process. Set with `BATCH_CONCURRENCY`.
+
+        batch_api_key (str): Key that batch requests by user id must send in the `X-API-Key` header. Empty, the default,
+                             only allows batch requests by session. Set with `BATCH_API_KEY`.
+
+        etag_store_max_users (int): Maximum number of users whose pages of starred repositories are kept with their ETags
+                                    for conditional refetching. The pages are also bounded by `cache_max_repositories`.
+                                    Set with `ETAG_STORE_MAX_USERS`.
+
+        sync_store_max_users (int): Maximum number of users whose sync state is kept for incremental sync. The states are also
+                                    bounded by `cache_max_repositories`. Set with `SYNC_STORE_MAX_USERS`.
+
+        session_secret (str): Key used to sign session tokens. Defaults to a key derived from `client_secret`. Set with `SESSION_SECRET`.
+
+        session_ttl (float): Seconds a session issued by the callback stays valid. Set with `SESSION_TTL`.
+
+        session_max_entries (int): Maximum number of sessions kept. Set with `SESSION_MAX_ENTRIES`.
+
+        session_store_path (str): Path of the SQLite database keeping the sessions, which all worker processes on the host share.
+                                  Defaults to a file in the temporary directory. Set with `SESSION_STORE_PATH`.
+
+        repository_store_path (str): Path of the SQLite database persisting fetched starred repositories across restarts.
+                                     Empty, the default, disables the store. Set with `REPOSITORY_STORE_PATH`.
+
+        repository_store_threads (int): Number of threads reading and writing the repository store. Set with `REPOSITORY_STORE_THREADS`.
+
+        repository_store_warm (bool): Whether to load the most recently saved lists from the repository store into the cache
+                                      on startup. Set with `REPOSITORY_STORE_WARM`.
+
+        server_workers (int): Number of worker processes in production. 0, the default, starts one worker per CPU
+                              available to the process. Set with `SERVER_WORKERS`.
+
+        server_max_requests (int): Number of requests after which a production worker is gracefully restarted, which bounds
+                                   memory growth of long-lived workers. 0, the default, never restarts workers. Set with `SERVER_MAX_REQUESTS`.
+
+        server_max_requests_jitter (int): Random amount of up to this many requests added to `server_max_requests` per worker,
+                                          so that workers do not all restart at once. Set with `SERVER_MAX_REQUESTS_JITTER`.
+
+        server_backlog (int): Maximum number of connections waiting to be accepted. Set with `SERVER_BACKLOG`.
+
+        server_keep_alive (int): Seconds an idle client connection is kept open. Set with `SERVER_KEEP_ALIVE`.
     """
     environment: str = "dev"
     client_id: str
     client_secret: str
     redirect_uri: str = "http://localhost:8000/api/callback"
+    github_oauth_url: str = "https://github.com"
+    github_api_url: str = "https://api.github.com"
+    github_per_page: int = Field(100, ge=1, le=100)
+    github_page_concurrency: int = Field(8, ge=1)
+    github_fetch_backend: Literal["rest", "graphql"] = "rest"
+    github_incremental_sync: bool = False
+    github_full_sweep_interval: float = Field(3600.0, ge=0)
+    github_max_retries: int = Field(3, ge=0)
+    github_retry_backoff: float = Field(0.5, ge=0)
+    github_retry_max_wait: float = Field(30.0, ge=0)
+    github_breaker_threshold: int = Field(5, ge=1)
+    github_breaker_reset: float = Field(30.0, gt=0)
+    http_max_connections: int = Field(100, ge=1)
+    http_max_keepalive_connections: int = Field(20, ge=0)
+    http_keepalive_expiry: float = Field(30.0, ge=0)
+    http_timeout: float = Field(10.0, gt=0)
+    http_connect_timeout: float = Field(5.0, gt=0)
+    http2: bool = False
+    cache_ttl: float = Field(300.0, ge=0)
+    cache_stale_ttl: float = Field(3600.0, ge=0)
+    cache_max_entries: int = Field(1000, ge=1)
+    cache_max_repositories: int = Field(1_000_000, ge=1)
+    refresh_calls_per_minute: int = Field(60, ge=0)
+    refresh_ahead: float = Field(60.0, ge=0)
+    refresh_idle_after: float = Field(3600.0, gt=0)
+    refresh_min_remaining: float = Field(0.2, ge=0, le=1)
+    response_compression_min_size: int = Field(1024, ge=0)
+    response_compression_offload_min_size: int = Field(64 * 1024, ge=0)
+    response_body_max_bytes: int = Field(256 * 1024 * 1024, ge=1)
+    batch_max_users: int = Field(500, ge=1)
+    batch_concurrency: int = Field(16, ge=1)
+    batch_api_key: str = ""
+    etag_store_max_users: int = Field(5000, ge=1)
+    sync_store_max_users: int = Field(5000, ge=1)
+    session_secret: str = ""
+    session_ttl: float = Field(8 * 3600.0, gt=0)
+    session_max_entries: int = Field(10_000, ge=1)
+    session_store_path: str = os.path.join(tempfile.gettempdir(), "star-retriever-sessions.sqlite3")
+    repository_store_path: str = ""
+    repository_store_threads: int = Field(4, ge=1)
+    repository_store_warm: bool = False
+    server_workers: int = Field(0, ge=0)
+    server_max_requests: int = Field(0, ge=0)
+    server_max_requests_jitter: int = Field(0, ge=0)
+    server_backlog: int = Field(2048, ge=1)
+    server_keep_alive: int = Field(5, ge=0)
 
     @validator("client_id", "client_secret", pre=True, always=True)
     def not_empty(cls, v):
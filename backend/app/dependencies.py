@@ -2,16 +2,41 @@
 Defines dependencies used across the FastAPI application.
 """
 
+import asyncio
+import hashlib
+import hmac
+from typing import Any, Dict, Optional
 import httpx
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from app.config import Settings
+from fastapi import Request
+from app.cache import ETagStore, StarredReposCache
+from app.compression import BodyStore
+from app.config import RateLimitSettings, Settings
+from app.metrics import UPSTREAM_RESPONSES
+# Also registers the sqlite:// storage scheme of the rate limiter
+from app.rate_limit import RateLimiter
+from app.query import IndexStore
+from app.scheduler import RefreshScheduler
+from app.search import SearchIndexStore
+from app.sessions import SessionStore
+from app.store import RepositoryStore
+from app.sync import SyncStore
+from app.upstream import CircuitBreaker, GitHubTransport, RateLimitTracker
 
 # Setup for application rate limiting
-limiter = Limiter(key_func=get_remote_address)
+rate_limit_settings = RateLimitSettings()
+limiter = RateLimiter(
+    storage_uri=rate_limit_settings.rate_limit_storage_uri,
+    strategy=rate_limit_settings.rate_limit_strategy,
+)
 """
-Rate limiter instance leveraging client IP addresses for limiting request rates.
-Utilizes `slowapi` for FastAPI compatibility.
+Rate limiter instance leveraging client IP addresses for limiting request rates, declared on routes with
+`dependencies=[Depends(limiter.limit(...))]`. By default the counters are kept in a SQLite database
+shared by all worker processes (see `app.rate_limit.SQLiteStorage`), so limits hold across workers.
+"""
+
+rate_limit_storage = limiter.storage
+"""
+The storage of the rate limit counters used by `limiter`, kept for reporting its stats.
 """
 
 def get_settings() -> Settings:
@@ -26,13 +51,234 @@ def get_settings() -> Settings:
     """
     return Settings()
 
-def get_http_client() -> httpx.AsyncClient:
+async def count_upstream_response(response: httpx.Response) -> None:
+    """
+    Response hook of the shared HTTP client counting GitHub responses by endpoint path and status code.
+
+    Args:
+        response: A response received from GitHub.
+    """
+    UPSTREAM_RESPONSES.labels(response.request.url.path, response.status_code).inc()
+
+def create_github_transport(settings: Settings, rate_limits: RateLimitTracker, breaker: CircuitBreaker) -> GitHubTransport:
+    """
+    Creates the transport of the application-wide HTTP client.
+
+    The transport keeps a pool of connections alive between requests so that repeated calls to GitHub
+    can skip the TCP and TLS handshakes. Pool size, keep-alive expiry and HTTP/2 support are read from
+    `settings`. Requests to the API go through an `app.upstream.GitHubTransport`, which tracks rate limits,
+    retries failures, fails fast while GitHub is failing and counts the requests in flight.
+
+    Args:
+        settings: The application settings.
+        rate_limits: The tracker of the rate limits of access tokens.
+        breaker: The circuit breaker of the GitHub API.
+
+    Returns:
+        A new `GitHubTransport`, closed along with the client using it.
+    """
+    limits = httpx.Limits(
+        max_connections=settings.http_max_connections,
+        max_keepalive_connections=settings.http_max_keepalive_connections,
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+    return GitHubTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=settings.http2),
+        api_url=settings.github_api_url,
+        rate_limits=rate_limits,
+        breaker=breaker,
+        max_retries=settings.github_max_retries,
+        backoff=settings.github_retry_backoff,
+        max_wait=settings.github_retry_max_wait,
+    )
+
+def create_http_client(settings: Settings, transport: GitHubTransport) -> httpx.AsyncClient:
+    """
+    Creates the application-wide `httpx.AsyncClient`.
+
+    Its base URL is the GitHub API root and its timeouts are read from `settings`. Every response is counted
+    in the `star_retriever_upstream_responses_total` metric.
+
+    Args:
+        settings: The application settings.
+        transport: The transport created by `create_github_transport`.
+
+    Returns:
+        A new instance of `httpx.AsyncClient`. The caller is responsible for closing it.
+    """
+    timeout = httpx.Timeout(settings.http_timeout, connect=settings.http_connect_timeout)
+    return httpx.AsyncClient(
+        base_url=settings.github_api_url,
+        timeout=timeout,
+        transport=transport,
+        event_hooks={'response': [count_upstream_response]},
+    )
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    """
+    Provides the shared `httpx.AsyncClient` instance.
+
+    The client is created and closed by the lifespan handler of the application in `app.server`.
+
+    Returns:
+        The `httpx.AsyncClient` stored in the application state.
+    """
+    return request.app.state.http_client
+
+def create_starred_cache(settings: Settings) -> StarredReposCache[Dict[str, Any]]:
+    """
+    Creates the cache of parsed starred repositories, sized by `settings`.
+
+    Args:
+        settings: The application settings.
+
+    Returns:
+        A new `StarredReposCache` of responses in `StarredRepositoriesResponse` shape, counting the size of an entry
+        as its number of repositories.
+    """
+    return StarredReposCache(
+        ttl=settings.cache_ttl,
+        stale_ttl=settings.cache_stale_ttl,
+        max_entries=settings.cache_max_entries,
+        max_size=settings.cache_max_repositories,
+        sizeof=lambda response: response["count"],
+    )
+
+def get_rate_limits(request: Request) -> RateLimitTracker:
+    """
+    Provides the shared tracker of the GitHub rate limits of access tokens.
+
+    Returns:
+        The `RateLimitTracker` stored in the application state.
+    """
+    return request.app.state.rate_limits
+
+def get_circuit_breaker(request: Request) -> CircuitBreaker:
+    """
+    Provides the shared circuit breaker of the GitHub API.
+
+    Returns:
+        The `CircuitBreaker` stored in the application state.
+    """
+    return request.app.state.circuit_breaker
+
+def get_starred_cache(request: Request) -> StarredReposCache[Dict[str, Any]]:
+    """
+    Provides the shared cache of starred repositories.
+
+    Returns:
+        The `StarredReposCache` stored in the application state.
+    """
+    return request.app.state.starred_cache
+
+def get_etag_store(request: Request) -> ETagStore:
+    """
+    Provides the shared store of ETags and parsed pages of starred repositories.
+
+    Returns:
+        The `ETagStore` stored in the application state.
+    """
+    return request.app.state.etag_store
+
+def create_repository_store(settings: Settings) -> Optional[RepositoryStore]:
+    """
+    Creates the persistent store of fetched starred repositories, if one is configured.
+
+    Args:
+        settings: The application settings.
+
+    Returns:
+        A new `RepositoryStore`, or None if `settings.repository_store_path` is empty.
+    """
+    if not settings.repository_store_path:
+        return None
+    return RepositoryStore(settings.repository_store_path, threads=settings.repository_store_threads)
+
+def get_repository_store(request: Request) -> Optional[RepositoryStore]:
+    """
+    Provides the persistent store of fetched starred repositories.
+
+    Returns:
+        The `RepositoryStore` stored in the application state, or None if the store is disabled.
+    """
+    return request.app.state.repository_store
+
+def get_body_store(request: Request) -> BodyStore:
+    """
+    Provides the shared store of encoded response bodies.
+
+    Returns:
+        The `BodyStore` stored in the application state.
+    """
+    return request.app.state.body_store
+
+def get_batch_semaphore(request: Request) -> asyncio.Semaphore:
+    """
+    Provides the semaphore bounding the number of users fetched at once for batch requests.
+
+    Returns:
+        The `asyncio.Semaphore` stored in the application state.
+    """
+    return request.app.state.batch_semaphore
+
+def get_refresh_scheduler(request: Request) -> RefreshScheduler:
+    """
+    Provides the scheduler of background refreshes.
+
+    Returns:
+        The `RefreshScheduler` stored in the application state.
+    """
+    return request.app.state.refresh_scheduler
+
+def get_index_store(request: Request) -> IndexStore:
+    """
+    Provides the shared store of per-user repository indexes.
+
+    Returns:
+        The `IndexStore` stored in the application state.
     """
-    Provides a factory for `httpx.AsyncClient` instances.
+    return request.app.state.index_store
 
-    Facilitates asynchronous HTTP requests within the application using `httpx`.
+def get_search_index_store(request: Request) -> SearchIndexStore:
+    """
+    Provides the shared store of per-user search indexes.
+
+    Returns:
+        The `SearchIndexStore` stored in the application state.
+    """
+    return request.app.state.search_index_store
+
+def get_sync_store(request: Request) -> SyncStore:
+    """
+    Provides the shared store of incremental sync states.
+
+    Returns:
+        The `SyncStore` stored in the application state.
+    """
+    return request.app.state.sync_store
+
+def create_session_store(settings: Settings) -> SessionStore:
+    """
+    Creates the store of sessions issued by the callback.
+
+    Sessions are kept in the database at `settings.session_store_path`, shared by all worker processes. Session
+    tokens are signed with `settings.session_secret`, or with a key derived from the client secret when no session
+    secret is configured.
+
+    Args:
+        settings: The application settings.
+
+    Returns:
+        A new `SessionStore`, closed by the lifespan handler.
+    """
+    secret = settings.session_secret.encode() or hmac.new(settings.client_secret.encode(), b"star-retriever-session", hashlib.sha256).digest()
+    return SessionStore(settings.session_store_path, secret=secret, ttl=settings.session_ttl, max_sessions=settings.session_max_entries)
+
+def get_session_store(request: Request) -> SessionStore:
+    """
+    Provides the shared store of sessions.
 
     Returns:
-        An instance of `httpx.AsyncClient`.
+        The `SessionStore` stored in the application state.
     """
-    return httpx.AsyncClient()
+    return request.app.state.session_store
@@ -0,0 +1,292 @@
+"""
+This module contains the helpers used for talking to the GitHub API.
+
+The starred repositories endpoint of GitHub is paginated. The first page is fetched on its own
+so that the number of the last page can be read from its `Link` header, after which the rest
+of the pages are fetched concurrently and assembled back in order. Pages fetched before are
+requested conditionally with their ETag, since 304 responses carry no body and do not count
+against the rate limit of GitHub.
+
+Alternatively the starred repositories can be fetched through the GraphQL API, which returns only the
+fields the application uses instead of the full repository and owner objects of the REST API. GraphQL
+pages are linked by cursors, so they are fetched one after another rather than concurrently, and they are
+not cached with ETags since GraphQL queries are POST requests.
+
+Requests are made with paths relative to the API root, so the clients passed in are expected to have
+their `base_url` set to it, as the shared client created by `app.dependencies.create_http_client` does.
+"""
+
+import asyncio
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, MutableMapping, Optional, TypeVar, Union
+import httpx
+from app.cache import CachedPage
+from app.metrics import STAGE_SECONDS
+
+T = TypeVar("T")
+
+GITHUB_USER_PATH = "/user"
+GITHUB_STARRED_PATH = "/user/starred"
+GITHUB_GRAPHQL_PATH = "/graphql"
+GITHUB_STAR_MEDIA_TYPE = "application/vnd.github.star+json"
+"""
+Media type with which `/user/starred` returns `{"starred_at": ..., "repo": {...}}` objects instead of bare repositories.
+"""
+
+STARRED_REPOSITORIES_QUERY = """
+query StarredRepositories($first: Int!, $after: String) {
+  viewer {
+    starredRepositories(first: $first, after: $after, orderBy: {field: STARRED_AT, direction: DESC}) {
+      pageInfo { hasNextPage endCursor }
+      nodes {
+        name
+        description
+        url
+        licenseInfo { name }
+        repositoryTopics(first: 20) { nodes { topic { name } } }
+      }
+    }
+  }
+}
+"""
+"""
+The GraphQL query for a page of starred repositories. It asks for the fields of `Repository` only and
+orders the repositories like the REST API does. GitHub allows at most 20 topics per repository.
+"""
+
+
+async def fetch_user_id(client: httpx.AsyncClient, access_token: str) -> int:
+    """
+    Fetches the id of the user the access token belongs to.
+
+    Args:
+        client: The HTTP client used for the request.
+        access_token: OAuth access token of the user.
+
+    Returns:
+        The GitHub user id.
+
+    Raises:
+        httpx.HTTPError: If the request fails or GitHub responds with an error status.
+    """
+    response = await client.get(GITHUB_USER_PATH, headers={'Authorization': f'token {access_token}'})
+    response.raise_for_status()
+    return response.json()['id']
+
+
+def get_last_page(response: httpx.Response) -> int:
+    """
+    Reads the number of the last page from the `Link` header of a GitHub API response.
+
+    Args:
+        response: A response to a paginated GitHub API request.
+
+    Returns:
+        The number of the last page, or 1 if the response has no `rel="last"` link.
+    """
+    last_link = response.links.get("last")
+    if not last_link:
+        return 1
+    page = httpx.URL(last_link["url"]).params.get("page")
+    return int(page) if page and page.isdigit() else 1
+
+
+async def fetch_starred_page(client: httpx.AsyncClient, access_token: str, page: int, per_page: int, etag: Optional[str] = None, media_type: Optional[str] = None) -> httpx.Response:
+    """
+    Fetches a single page of the authenticated user's starred repositories.
+
+    Args:
+        client: The HTTP client used for the request.
+        access_token: OAuth access token of the user.
+        page: Number of the page to fetch, starting from 1.
+        per_page: Number of repositories per page.
+        etag: ETag of a previously fetched copy of the page. When given, the request is made
+              conditional with `If-None-Match` and GitHub answers 304 if the page has not changed.
+        media_type: Media type requested with `Accept`. With `GITHUB_STAR_MEDIA_TYPE`, the page is explicitly
+                    sorted by the time of starring, newest first, and every item carries its `starred_at`.
+
+    Returns:
+        The response from GitHub, with status 304 if `etag` still matches.
+
+    Raises:
+        httpx.HTTPError: If the request fails or GitHub responds with an error status.
+    """
+    headers = {'Authorization': f'token {access_token}'}
+    params = {'per_page': per_page, 'page': page}
+    if etag:
+        headers['If-None-Match'] = etag
+    if media_type:
+        headers['Accept'] = media_type
+    if media_type == GITHUB_STAR_MEDIA_TYPE:
+        params.update(sort='created', direction='desc')
+    response = await client.get(GITHUB_STARRED_PATH, params=params, headers=headers)
+    if etag and response.status_code == 304:
+        return response
+    response.raise_for_status()
+    return response
+
+
+async def iter_starred_pages(
+    client: httpx.AsyncClient,
+    access_token: str,
+    per_page: int = 100,
+    concurrency: Union[int, Callable[[], int]] = 8,
+    parse_page: Callable[[List[Dict[str, Any]]], List[T]] = lambda items: items,
+    page_cache: Optional[MutableMapping[int, CachedPage]] = None,
+    media_type: Optional[str] = None,
+) -> AsyncIterator[List[T]]:
+    """
+    Fetches every page of the authenticated user's starred repositories, yielding the pages in order as they arrive.
+
+    The first page is requested alone to find out the number of pages. The remaining pages are then
+    requested concurrently through a window of at most `concurrency` requests, so that no more than
+    `concurrency` pages are held in memory waiting to be yielded.
+
+    When `page_cache` is given, pages previously stored in it are requested conditionally with their
+    ETag. A 304 response reuses the stored parsed page, so unchanged pages are neither downloaded nor parsed.
+    Freshly fetched pages are stored back into `page_cache`.
+
+    Args:
+        client: The HTTP client used for the requests.
+        access_token: OAuth access token of the user.
+        per_page: Number of repositories per page.
+        concurrency: Maximum number of page requests in flight at the same time, or a function returning it. The function
+                     is called before every request, so that the window can shrink while the pages are fetched.
+        parse_page: Function turning the raw repository objects of a page into the yielded items.
+        page_cache: Parsed pages and their ETags by page number, for the user the token belongs to.
+        media_type: Media type of the pages, see `fetch_starred_page`. `parse_page` receives the items in that form.
+
+    Yields:
+        The parsed items of each page, in the order GitHub returned them.
+
+    Raises:
+        httpx.HTTPError: If any of the page requests fails.
+    """
+    async def fetch_page(page: int) -> CachedPage:
+        cached = page_cache.get(page) if page_cache is not None else None
+        with STAGE_SECONDS.labels("page_request").time():
+            response = await fetch_starred_page(client, access_token, page, per_page, etag=cached.etag if cached else None, media_type=media_type)
+        if cached and response.status_code == 304:
+            return cached
+        with STAGE_SECONDS.labels("decode").time():
+            data = response.json()
+        with STAGE_SECONDS.labels("parse").time():
+            items = parse_page(data)
+        fetched = CachedPage(etag=response.headers.get('ETag'), last_page=get_last_page(response), items=items)
+        if page_cache is not None and fetched.etag:
+            page_cache[page] = fetched
+        return fetched
+
+    first_page = await fetch_page(1)
+    last_page = first_page.last_page
+    yield first_page.items
+
+    window = concurrency if callable(concurrency) else lambda: concurrency
+    pending: Deque[asyncio.Task] = deque()
+    next_page = 2
+    try:
+        while next_page <= last_page or pending:
+            while next_page <= last_page and len(pending) < window():
+                pending.append(asyncio.create_task(fetch_page(next_page)))
+                next_page += 1
+            page = await pending.popleft()
+            yield page.items
+    finally:
+        for task in pending:
+            task.cancel()
+
+    if page_cache is not None:
+        for page in [page for page in page_cache if page > last_page]:
+            del page_cache[page]
+
+
+async def fetch_starred_graphql_page(client: httpx.AsyncClient, access_token: str, per_page: int, after: Optional[str] = None) -> httpx.Response:
+    """
+    Fetches a single page of the authenticated user's starred repositories through the GraphQL API.
+
+    Args:
+        client: The HTTP client used for the request.
+        access_token: OAuth access token of the user.
+        per_page: Number of repositories per page, at most 100.
+        after: End cursor of the previous page, or None for the first page.
+
+    Returns:
+        The response from GitHub.
+
+    Raises:
+        httpx.HTTPError: If the request fails or GitHub responds with an error status.
+    """
+    response = await client.post(
+        GITHUB_GRAPHQL_PATH,
+        json={"query": STARRED_REPOSITORIES_QUERY, "variables": {"first": per_page, "after": after}},
+        headers={'Authorization': f'bearer {access_token}'}
+    )
+    response.raise_for_status()
+    return response
+
+
+def get_starred_connection(data: Any) -> Dict[str, Any]:
+    """
+    Extracts the `starredRepositories` connection from a GraphQL response body.
+
+    Args:
+        data: The decoded body of a response to `STARRED_REPOSITORIES_QUERY`.
+
+    Returns:
+        The connection, with its `pageInfo` and `nodes`.
+
+    Raises:
+        ValueError: If the response reports errors or lacks the connection.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Expected a JSON object from the GitHub GraphQL API.")
+    if data.get("errors"):
+        messages = "; ".join(str(error.get("message", error)) if isinstance(error, dict) else str(error) for error in data["errors"])
+        raise ValueError(f"GitHub GraphQL API returned errors: {messages}")
+    try:
+        connection = data["data"]["viewer"]["starredRepositories"]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid GitHub GraphQL response: {e!r}") from e
+    if not isinstance(connection, dict) or not isinstance(connection.get("pageInfo"), dict):
+        raise ValueError("Invalid GitHub GraphQL response: missing the starred repositories connection.")
+    return connection
+
+
+async def iter_starred_pages_graphql(
+    client: httpx.AsyncClient,
+    access_token: str,
+    per_page: int = 100,
+    parse_page: Callable[[List[Dict[str, Any]]], List[T]] = lambda items: items,
+) -> AsyncIterator[List[T]]:
+    """
+    Fetches every page of the authenticated user's starred repositories through the GraphQL API, yielding the pages in order.
+
+    Each page is requested with the end cursor of the previous one, so the pages are fetched sequentially.
+
+    Args:
+        client: The HTTP client used for the requests.
+        access_token: OAuth access token of the user.
+        per_page: Number of repositories per page, at most 100.
+        parse_page: Function turning the repository nodes of a page into the yielded items.
+
+    Yields:
+        The parsed items of each page, in the order GitHub returned them.
+
+    Raises:
+        httpx.HTTPError: If any of the page requests fails.
+        ValueError: If GitHub reports errors for the query or its response cannot be read.
+    """
+    after: Optional[str] = None
+    while True:
+        with STAGE_SECONDS.labels("page_request").time():
+            response = await fetch_starred_graphql_page(client, access_token, per_page, after)
+        with STAGE_SECONDS.labels("decode").time():
+            connection = get_starred_connection(response.json())
+        with STAGE_SECONDS.labels("parse").time():
+            items = parse_page(connection.get("nodes"))
+        yield items
+
+        page_info = connection["pageInfo"]
+        if not page_info.get("hasNextPage") or not page_info.get("endCursor"):
+            return
+        after = page_info["endCursor"]
@@ -0,0 +1,309 @@
+"""
+This module defines the metrics of the application and renders them in the Prometheus text format.
+
+The metric types follow the interface of the official Prometheus client: a metric is created once at import
+time, `labels(...)` returns the child for a combination of label values and the child is then incremented or
+observed. Children are plain Python objects updated without locks from the event loop, which keeps recording
+cheap enough to leave on in production.
+
+Each worker process keeps its own metrics, so with several workers every scrape reports the worker that
+happened to answer it.
+"""
+
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+"""
+Default histogram buckets in seconds, from one millisecond to ten seconds.
+"""
+
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """
+    Base class of the metric types.
+
+    Args:
+        name: Name of the metric.
+        documentation: Help text of the metric.
+        labelnames: Names of the labels of the metric.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterator[Sample]:
+        """
+        Yields the samples of the metric as (name, labels, value) tuples.
+        """
+
+    def render(self) -> str:
+        """
+        Renders the metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in self.samples())
+        return "\n".join(lines) + "\n"
+
+
+class _MetricWithChildren(Metric):
+    """
+    Base class of the metric types recording their values, in one child per combination of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values: str):
+        """
+        Returns the child of the metric for the given label values, creating it on first use.
+
+        Args:
+            values: Values of the labels, in the order of `labelnames`.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    @abstractmethod
+    def _new_child(self):
+        """
+        Returns a new child holding the values of one combination of label values.
+        """
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_MetricWithChildren):
+    """
+    A monotonically increasing count. Use `labels(...).inc()`, or `inc()` directly on a metric without labels.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            # Reported as zero until first incremented, rather than missing
+            self.labels()
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in self._children.items():
+            yield self.name, dict(zip(self.labelnames, key)), child.value
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down. Use `labels(...).inc()`, `dec()` or `set()`.
+    """
+
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class _HistogramValue:
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """
+        Observes the wall clock time the block takes, in seconds.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class Histogram(_MetricWithChildren):
+    """
+    A distribution of observed values in cumulative buckets. Use `labels(...).observe(value)` or `labels(...).time()`.
+
+    Args:
+        buckets: Upper bounds of the buckets, in increasing order. A `+Inf` bucket is always added.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def samples(self) -> Iterator[Sample]:
+        for key, child in self._children.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, child.sum
+            yield f"{self.name}_count", labels, cumulative
+
+
+class CallbackMetric(Metric):
+    """
+    A metric whose samples are read from a function at render time, for values owned by other objects.
+
+    Args:
+        type: The Prometheus type reported for the metric, `gauge` or `counter`.
+        function: Function returning the values of the metric keyed by tuples of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], type: str, function: Callable[[], Dict[Tuple[str, ...], float]]):
+        super().__init__(name, documentation, labelnames)
+        self.type = type
+        self.function = function
+
+    def samples(self) -> Iterator[Sample]:
+        for key, value in self.function().items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """
+    A collection of metrics rendered together.
+    """
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: M) -> M:
+        """
+        Adds `metric` to the registry and returns it.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, extra: Optional[Sequence[Metric]] = None) -> str:
+        """
+        Renders all registered metrics, followed by `extra`, in the Prometheus text format.
+        """
+        return "".join(metric.render() for metric in [*self._metrics, *(extra or [])])
+
+
+REGISTRY = Registry()
+"""
+The registry of the metrics defined in this module.
+"""
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "star_retriever_stage_seconds",
+    "Time spent in each stage of the OAuth and fetch pipeline.",
+    ["stage"],
+))
+"""
+Stages: `token_exchange` and `user` for the OAuth requests, `fetch` for fetching and parsing a whole starred list,
+`page_request`, `decode` and `parse` for each page of it, and `serialize` for encoding a response.
+"""
+
+UPSTREAM_RESPONSES = REGISTRY.register(Counter(
+    "star_retriever_upstream_responses_total",
+    "Responses received from GitHub by endpoint path and status code.",
+    ["endpoint", "status"],
+))
+
+REQUESTS_IN_PROGRESS = REGISTRY.register(Gauge(
+    "star_retriever_requests_in_progress",
+    "HTTP requests currently being handled.",
+))
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "star_retriever_request_seconds",
+    "Time taken to handle HTTP requests, by method and status code.",
+    ["method", "status"],
+))
+
+RATE_LIMIT_REJECTIONS = REGISTRY.register(Counter(
+    "star_retriever_rate_limit_rejections_total",
+    "Requests rejected by the rate limiter, by path.",
+    ["path"],
+))
+
+RATE_LIMIT_FAILED_OPEN = REGISTRY.register(Counter(
+    "star_retriever_rate_limit_failed_open_total",
+    "Requests let through without a rate limit check because the rate limit storage failed.",
+))
+
+UPSTREAM_RETRIES = REGISTRY.register(Counter(
+    "star_retriever_upstream_retries_total",
+    "Requests to GitHub retried, by reason: `server_error`, `transport_error` or `secondary_rate_limit`.",
+    ["reason"],
+))
+
+BACKGROUND_REFRESHES = REGISTRY.register(Counter(
+    "star_retriever_background_refreshes_total",
+    "Background refreshes of the lists of active users, by outcome: `refreshed`, `failed`, or `rate_limited` when skipped for a low rate limit.",
+    ["outcome"],
+))
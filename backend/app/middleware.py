@@ -1,68 +1,136 @@
 """
 This module defines the middlewares for a FastAPI application.
 
+The middlewares are pure ASGI middlewares rather than subclasses of Starlette's `BaseHTTPMiddleware`.
+They wrap the `send` callable instead of running the rest of the application in a separate task behind
+a memory stream, which saves that overhead on every request and lets streaming responses pass through untouched.
+
 Environment Variables:
     ENVIRONMENT: Determines the mode of operation ('development' or 'production'). In 'development' mode, detailed tracebacks are logged.
 
 """
 import logging
+import time
 import traceback
-from fastapi import Request
-from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 import os
-from fastapi.middleware.cors import CORSMiddleware
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from fastapi.responses import JSONResponse
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.metrics import REQUEST_SECONDS, REQUESTS_IN_PROGRESS
 
 logger = logging.getLogger("uvicorn.error")
 is_dev_mode = os.getenv("ENVIRONMENT") == "dev"
 
-class ErrorLoggingMiddleware(BaseHTTPMiddleware):
+class ErrorLoggingMiddleware:
     """
     Middleware to log exceptions and return generic error responses.
 
     Logs exceptions with detailed tracebacks in development mode and exception messages only in production.
-    Returns a JSON response with a 500 status code on unhandled exceptions.
+    Returns a JSON response with a 500 status code on unhandled exceptions. If the response has already
+    started when the exception is raised, the exception is logged and re-raised, since the status can no longer be changed.
+
+    Args:
+        app: The ASGI application to wrap.
     """
-    
-    async def dispatch(self, request: Request, call_next):
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
         """
-        Intercepts exceptions, logs them, and returns a generic error response.
+        Intercepts exceptions, logs them, and sends a generic error response.
 
         Args:
-            request: The incoming request.
-            call_next: Callable for the next request handler.
-
-        Returns:
-            A JSONResponse indicating an internal server error for unhandled exceptions.
+            scope: The ASGI connection scope.
+            receive: The ASGI receive callable.
+            send: The ASGI send callable.
         """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        response_started = False
+
+        async def send_wrapper(message: Message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
         try:
-            return await call_next(request)
+            await self.app(scope, receive, send_wrapper)
         except Exception as exc:
-            logger.error(f"Unhandled exception for request {request.method} {request.url.path}: {exc}" +
+            logger.error(f"Unhandled exception for request {scope['method']} {scope['path']}: {exc}" +
                         (f"\nTraceback: {traceback.format_exc()}" if is_dev_mode else ""))
-            return JSONResponse(
+            if response_started:
+                raise
+            response = JSONResponse(
                 content={"detail": "An unexpected error occurred.", "error": str(exc)},
                 status_code=500
             )
-        
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
+            await response(scope, receive, send)
+
+class SecurityHeadersMiddleware:
     """
     Middleware to append security headers to all outgoing responses.
 
     Enhances security by adding `X-Frame-Options` set to 'DENY' to prevent clickjacking attacks,
-    and `X-Content-Type-Options` set to 'nosniff' to prevent MIME type sniffing.
+    and `X-Content-Type-Options` set to 'nosniff' to prevent MIME type sniffing. The headers are
+    added to the `http.response.start` message as it is sent.
 
     Args:
-        request: The incoming HTTP request.
-        call_next: Function that proceeds with the request handling.
+        app: The ASGI application to wrap.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
 
-    Returns:
-        Response object with added security headers.
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers['X-Frame-Options'] = 'DENY'
+                headers['X-Content-Type-Options'] = 'nosniff'
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+class MetricsMiddleware:
+    """
+    Middleware recording the number of requests in progress and the time taken to handle each request.
+
+    Requests are counted in the `star_retriever_requests_in_progress` gauge while they are handled and
+    their duration is observed in `star_retriever_request_seconds` by method and status code. Requests
+    that fail without sending a response are recorded with status 500.
+
+    Args:
+        app: The ASGI application to wrap.
     """
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        response.headers['X-Frame-Options'] = 'DENY'
-        response.headers['X-Content-Type-Options'] = 'nosniff'
-        return response
\ No newline at end of file
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        REQUESTS_IN_PROGRESS.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            REQUEST_SECONDS.labels(scope["method"], status).observe(time.perf_counter() - start)
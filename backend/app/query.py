@@ -0,0 +1,269 @@
+"""
+This module defines the server-side filtering, sorting and pagination of starred repositories.
+
+A `RepositoryIndex` is built once per fetched list of a user. It maps every topic and license to the
+positions of the repositories that have it, so that filtering by topics and license is an intersection
+of sets rather than a scan of the list. The substring filter only scans the repositories left by the
+other filters, against lower-cased names and descriptions prepared once per list.
+
+Repositories are identified by their position in the list, which is the order of starring on GitHub,
+most recent first. Cursors are opaque tokens holding the sort order and the rank of the last returned
+repository in it.
+"""
+
+import base64
+import binascii
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Set
+
+SORT_ORDERS = ("starred", "-starred", "name", "-name")
+"""
+Supported sort orders: `starred` for the most recently starred first as GitHub returns them, `name` for
+case-insensitive alphabetical order, and a leading `-` for the reverse.
+"""
+
+
+@dataclass
+class RepositoryQuery:
+    """
+    Filters, sort order and page of a request for starred repositories.
+
+    Attributes:
+        topics: Topics every returned repository must have.
+        license: License name the returned repositories must have, compared case-insensitively.
+        q: Substring the name or description of every returned repository must contain, compared case-insensitively.
+        sort: One of `SORT_ORDERS`.
+        limit: Maximum number of repositories returned, or None for all.
+        cursor: The `next_cursor` of the previous page, or None for the first page.
+    """
+    topics: List[str] = field(default_factory=list)
+    license: Optional[str] = None
+    q: Optional[str] = None
+    sort: str = "starred"
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
+
+
+@dataclass
+class QueryResult:
+    """
+    A page of repositories matching a query.
+
+    Attributes:
+        repositories: The repositories of the page.
+        total: Number of repositories matching the filters over all pages.
+        next_cursor: Cursor of the next page, or None if this is the last page.
+    """
+    repositories: List[Dict[str, Any]]
+    total: int
+    next_cursor: Optional[str]
+
+
+def encode_cursor(sort: str, rank: int) -> str:
+    """
+    Encodes the position after which the next page starts.
+
+    Args:
+        sort: The sort order of the pages.
+        rank: Rank in that order of the last returned repository.
+
+    Returns:
+        An opaque cursor.
+    """
+    return base64.urlsafe_b64encode(f"{sort}:{rank}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> int:
+    """
+    Decodes a cursor returned by `encode_cursor`.
+
+    Args:
+        cursor: The cursor.
+        sort: The sort order of the request, which must be the one the cursor was issued for.
+
+    Returns:
+        The rank after which the next page starts.
+
+    Raises:
+        ValueError: If the cursor is malformed or was issued for another sort order.
+    """
+    try:
+        cursor_sort, _, rank = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().rpartition(":")
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if cursor_sort != sort or not rank.isdigit():
+        raise ValueError(f"Invalid cursor for sort order {sort!r}: {cursor!r}")
+    return int(rank)
+
+
+class RepositoryIndex:
+    """
+    Indexes of a list of projected repositories by topic and license, with lazily built sort orders.
+
+    Args:
+        repositories: Repositories of the `Repository` shape, in the order GitHub returned them.
+    """
+
+    def __init__(self, repositories: List[Dict[str, Any]]):
+        self.repositories = repositories
+        self.topics: Dict[str, Set[int]] = {}
+        self.licenses: Dict[str, Set[int]] = {}
+        for position, repository in enumerate(repositories):
+            for topic in repository["topics"]:
+                self.topics.setdefault(topic.lower(), set()).add(position)
+            if repository["license"]:
+                self.licenses.setdefault(repository["license"].lower(), set()).add(position)
+
+    @cached_property
+    def texts(self) -> List[str]:
+        """
+        The lower-cased name and description of every repository, for substring matching.
+        """
+        return [f"{repository['name']}\n{repository['description'] or ''}".lower() for repository in self.repositories]
+
+    @cached_property
+    def name_order(self) -> List[int]:
+        """
+        The positions of the repositories in case-insensitive name order.
+        """
+        return sorted(range(len(self.repositories)), key=lambda position: self.repositories[position]["name"].lower())
+
+    @cached_property
+    def name_ranks(self) -> List[int]:
+        """
+        The rank of every repository in case-insensitive name order.
+        """
+        ranks = [0] * len(self.repositories)
+        for rank, position in enumerate(self.name_order):
+            ranks[position] = rank
+        return ranks
+
+    def order(self, sort: str) -> Sequence[int]:
+        """
+        Returns the positions of all repositories in the given sort order.
+        """
+        if sort == "starred":
+            return range(len(self.repositories))
+        if sort == "-starred":
+            return range(len(self.repositories) - 1, -1, -1)
+        if sort == "name":
+            return self.name_order
+        return self.name_order[::-1]
+
+    def rank(self, sort: str, position: int) -> int:
+        """
+        Returns the rank of the repository at `position` in the given sort order.
+        """
+        if sort == "starred":
+            return position
+        if sort == "-starred":
+            return len(self.repositories) - 1 - position
+        if sort == "name":
+            return self.name_ranks[position]
+        return len(self.repositories) - 1 - self.name_ranks[position]
+
+    def matching(self, query: RepositoryQuery) -> Optional[Set[int]]:
+        """
+        Returns the positions of the repositories matching the filters of `query`.
+
+        Args:
+            query: The query.
+
+        Returns:
+            The matching positions, or None if the query has no filters and every repository matches.
+        """
+        sets = [self.topics.get(topic.lower(), set()) for topic in query.topics]
+        if query.license:
+            sets.append(self.licenses.get(query.license.lower(), set()))
+        sets.sort(key=len)
+        matches = set(sets[0]).intersection(*sets[1:]) if sets else None
+
+        if query.q:
+            needle = query.q.lower()
+            texts = self.texts
+            candidates = range(len(self.repositories)) if matches is None else matches
+            matches = {position for position in candidates if needle in texts[position]}
+        return matches
+
+    def search(self, query: RepositoryQuery) -> QueryResult:
+        """
+        Filters, sorts and paginates the repositories.
+
+        Args:
+            query: The query.
+
+        Returns:
+            The requested page of matching repositories.
+
+        Raises:
+            ValueError: If the sort order is unknown or the cursor is invalid.
+        """
+        if query.sort not in SORT_ORDERS:
+            raise ValueError(f"Unknown sort order: {query.sort!r}")
+        after = decode_cursor(query.cursor, query.sort) if query.cursor else -1
+        matches = self.matching(query)
+        if matches is None:
+            # Without filters the rank of a repository is its index in the precomputed order
+            order = self.order(query.sort)
+            ranks: Sequence[int] = range(len(order))
+            start = min(after + 1, len(order))
+        else:
+            ranked = sorted((self.rank(query.sort, position), position) for position in matches)
+            order = [position for _, position in ranked]
+            ranks = [rank for rank, _ in ranked]
+            start = bisect_right(ranks, after)
+
+        end = len(order) if query.limit is None else min(start + query.limit, len(order))
+        next_cursor = encode_cursor(query.sort, ranks[end - 1]) if start < end < len(order) else None
+        return QueryResult(
+            repositories=[self.repositories[position] for position in order[start:end]],
+            total=len(order),
+            next_cursor=next_cursor,
+        )
+
+
+class IndexStore:
+    """
+    Keeps the index of the latest fetched list of every user, evicting the least recently used user when full.
+
+    An index is rebuilt when the list of the user has changed. A list fetched or restored again holds the
+    same records as before as long as its repositories are unchanged, since records are shared through
+    `app.records.REPOSITORY_POOL`, so comparing it with the indexed list is mostly a pass over identical
+    references. An equal list takes the place of the indexed one, so that later requests compare by identity.
+
+    Args:
+        max_users: Maximum number of users whose index is kept.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[Hashable, RepositoryIndex]" = OrderedDict()
+        self.builds = 0
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    def get(self, user_id: Hashable, repositories: List[Dict[str, Any]]) -> RepositoryIndex:
+        """
+        Returns the index of a list of repositories, building it if the user has no index of that list.
+
+        Args:
+            user_id: The GitHub user id.
+            repositories: The current list of repositories of the user.
+
+        Returns:
+            The index of `repositories`.
+        """
+        index = self._indexes.get(user_id)
+        if index is not None and index.repositories is not repositories and index.repositories == repositories:
+            index.repositories = repositories
+        if index is None or index.repositories is not repositories:
+            index = self._indexes[user_id] = RepositoryIndex(repositories)
+            self.builds += 1
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(user_id)
+        return index
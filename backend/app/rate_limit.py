@@ -0,0 +1,263 @@
+"""
+This module defines the rate limiter of the routes and a SQLite storage backend for it.
+
+`RateLimiter` enforces limits per client address with the strategies and storages of `limits`. Its checks run
+on a thread of their own rather than on the event loop, since a storage may block, for example while another
+worker holds the write lock of the SQLite database. A check that fails lets the request through and is counted
+in the `star_retriever_rate_limit_failed_open_total` metric, so that a limit that is not enforced shows up.
+
+The in-memory storage of `limits` is private to a process, so with several workers every worker enforces
+its own copy of each limit. `SQLiteStorage` keeps the counters in a SQLite database file that all workers on
+the host share. Every check runs in a single `BEGIN IMMEDIATE` transaction, which SQLite serializes across
+processes, so concurrent workers cannot both take the last slot of a window.
+
+The storage supports the sliding window counter strategy of `limits` as well as the fixed window strategy.
+It registers itself for the `sqlite` scheme, so it is selected with a storage URI such as
+`sqlite:////tmp/star-retriever-rate-limits.sqlite3`.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from fastapi import Request
+from limits import RateLimitItem, parse
+from limits.storage import SlidingWindowCounterSupport, Storage, storage_from_string
+from limits.storage.base import TimestampedSlidingWindow
+from limits.strategies import STRATEGIES
+from slowapi.util import get_remote_address
+from app.metrics import RATE_LIMIT_FAILED_OPEN
+from app.sqlite import immediate_transaction
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class RateLimitExceeded(Exception):
+    """
+    Raised by the dependencies of `RateLimiter` for a request over its limit.
+
+    Args:
+        limit: The exceeded limit.
+        retry_after: Seconds until the limit lets a request of the client through again.
+    """
+
+    def __init__(self, limit: RateLimitItem, retry_after: float):
+        super().__init__(f"Rate limit exceeded: {limit}")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    Limits the rate of requests per client address and route, keeping the counters in a `limits` storage.
+
+    Checks run on a single thread of the limiter, one at a time, which is how the SQLite storage runs them anyway.
+
+    Args:
+        storage_uri: URI of the storage, such as `sqlite:///<path>` or `memory://`.
+        strategy: Name of a rate limiting strategy of `limits`, such as `sliding-window-counter`.
+        options: Options of the storage.
+    """
+
+    def __init__(self, storage_uri: str, strategy: str, **options: Any):
+        self.storage = storage_from_string(storage_uri, **options)
+        self.strategy = STRATEGIES[strategy](self.storage)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rate-limit")
+
+    def _hit(self, limit: RateLimitItem, key: str, scope: str) -> Optional[float]:
+        if self.strategy.hit(limit, key, scope):
+            return None
+        return max(self.strategy.get_window_stats(limit, key, scope).reset_time - time.time(), 0.0)
+
+    def limit(self, limit_value: str) -> Callable[[Request], Awaitable[None]]:
+        """
+        Returns a FastAPI dependency enforcing a limit on the routes it is declared on.
+
+        Every route counts separately, keyed by its path, and every client by its address.
+
+        Args:
+            limit_value: The limit in the notation of `limits`, such as `30/minute`.
+
+        Returns:
+            The dependency, raising `RateLimitExceeded` for a request over the limit.
+        """
+        limit = parse(limit_value)
+
+        async def check(request: Request) -> None:
+            try:
+                retry_after = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, self._hit, limit, get_remote_address(request), request.url.path
+                )
+            except Exception as e:
+                RATE_LIMIT_FAILED_OPEN.inc()
+                logger.warning(f"Rate limit check failed, letting the request through: {e}")
+                return
+            if retry_after is not None:
+                raise RateLimitExceeded(limit, retry_after)
+
+        return check
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Rate limit storage backed by a SQLite database shared between processes.
+
+    Expired counters are purged at most once every `purge_interval` seconds, so keys of clients that have
+    gone idle do not accumulate. The time spent in checks is recorded and reported by `stats`.
+
+    Calls block, for up to `timeout` seconds while another process holds the write lock, and are meant to be
+    made off the event loop, as `RateLimiter` does.
+
+    Args:
+        uri: Storage URI of the form `sqlite:///<path>`. `sqlite:///:memory:` gives a database private to the process.
+        wrap_exceptions: Whether to wrap `sqlite3` errors in `limits.errors.StorageError`.
+        purge_interval: Minimum number of seconds between purges of expired counters.
+        timeout: Seconds to wait for a lock held by another process before failing with `sqlite3.OperationalError`.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, purge_interval: float = 60.0, timeout: float = 1.0, **options: Any):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri.split("://", 1)[1].removeprefix("/") or ":memory:"
+        self.purge_interval = float(purge_interval)
+        self.timeout = float(timeout)
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._last_purge = 0.0
+        self.checks = 0
+        self.check_seconds = 0.0
+        self.purged = 0
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection to the database, opened lazily and reopened in forked processes.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            if self.path != ":memory:":
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection, self._pid = connection, os.getpid()
+        return self._connection
+
+    def _transaction(self):
+        return immediate_transaction(self.connection, self._lock)
+
+    def _get(self, key: str, now: float) -> int:
+        row = self.connection.execute("SELECT value FROM rate_limits WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        return row[0] if row else 0
+
+    def _incr(self, key: str, expiry: float, amount: int, now: float) -> int:
+        row = self.connection.execute(
+            "INSERT INTO rate_limits (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET "
+            "value = CASE WHEN expires_at <= ? THEN excluded.value ELSE value + excluded.value END, "
+            "expires_at = CASE WHEN expires_at <= ? THEN excluded.expires_at ELSE expires_at END "
+            "RETURNING value",
+            (key, amount, now + expiry, now, now),
+        ).fetchone()
+        return row[0]
+
+    def _purge(self, now: float) -> None:
+        if now - self._last_purge >= self.purge_interval:
+            self._last_purge = now
+            self.purged += self.connection.execute("DELETE FROM rate_limits WHERE expires_at <= ?", (now,)).rowcount
+
+    def _record(self, started: float) -> None:
+        self.checks += 1
+        self.check_seconds += time.perf_counter() - started
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        started = time.perf_counter()
+        now = time.time()
+        try:
+            with self._transaction():
+                self._purge(now)
+                return self._incr(key, expiry, amount, now)
+        finally:
+            self._record(started)
+
+    def get(self, key: str) -> int:
+        with self._lock:
+            return self._get(key, time.time())
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        with self._lock:
+            row = self.connection.execute("SELECT expires_at FROM rate_limits WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        with self._lock:
+            return self.connection.execute("SELECT 1").fetchone() == (1,)
+
+    def reset(self) -> Optional[int]:
+        with self._transaction():
+            return self.connection.execute("DELETE FROM rate_limits").rowcount
+
+    def clear(self, key: str) -> None:
+        with self._transaction():
+            self.connection.execute("DELETE FROM rate_limits WHERE key = ?", (key,))
+
+    def _sliding_window(self, key: str, expiry: int, now: float) -> Tuple[str, int, float, int, float]:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        previous_count = self._get(previous_key, now)
+        current_count = self._get(current_key, now)
+        previous_ttl = (1 - (((now - expiry) / expiry) % 1)) * expiry if previous_count else 0.0
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return current_key, previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        started = time.perf_counter()
+        now = time.time()
+        try:
+            with self._transaction():
+                self._purge(now)
+                current_key, previous_count, previous_ttl, current_count, _ = self._sliding_window(key, expiry, now)
+                weighted_count = previous_count * previous_ttl / expiry + current_count
+                acquired = math.floor(weighted_count) + amount <= limit
+                if acquired:
+                    self._incr(current_key, 2 * expiry, amount, now)
+                return acquired
+        finally:
+            self._record(started)
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        with self._lock:
+            return self._sliding_window(key, expiry, time.time())[1:]
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        with self._transaction():
+            for window_key in self.sliding_window_keys(key, expiry, time.time()):
+                self.connection.execute("DELETE FROM rate_limits WHERE key = ?", (window_key,))
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns the number of checks made through this process and the time they took, for monitoring.
+
+        Returns:
+            A dictionary with the number of checks, their total and mean duration in seconds and the number of purged keys.
+        """
+        return {
+            "checks": self.checks,
+            "check_seconds": self.check_seconds,
+            "mean_check_seconds": self.check_seconds / self.checks if self.checks else 0.0,
+            "purged": self.purged,
+        }
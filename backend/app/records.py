@@ -0,0 +1,157 @@
+"""
+This module defines the compact form in which projected repositories are kept in memory.
+
+A repository is a `RepositoryRecord`, a slotted dataclass instead of a dictionary, with its topics in a tuple.
+Names, licenses and topics are interned, so that the many repositories called `dotfiles`, licensed under
+"MIT License" or tagged `python` share one string each. Records are shared across users through a
+`RepositoryPool` keyed by repository URL, so that a repository starred by many users whose lists are cached
+is held once as long as it is unchanged.
+
+Records are read-only mappings with the keys of the `Repository` schema, so code reading projected
+repositories works with them as with dictionaries. They become JSON objects only when a response is
+encoded with `app.serialization.dumps`.
+"""
+
+import sys
+import weakref
+from collections.abc import Mapping
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+REPOSITORY_FIELDS = ("name", "description", "url", "license", "topics")
+"""
+The keys of a record, in the order of the `Repository` schema.
+"""
+
+_FIELD_SET = frozenset(REPOSITORY_FIELDS)
+
+
+@dataclass(slots=True, weakref_slot=True, eq=False, repr=False)
+class RepositoryRecord(Mapping):
+    """
+    A projected repository. Records are immutable by convention, since they are shared across users.
+
+    Attributes:
+        name: The name of the repository.
+        description: The description of the repository, if any.
+        url: The URL of the repository.
+        license: The name of the license of the repository, if any.
+        topics: The topics of the repository.
+    """
+    name: str
+    description: Optional[str]
+    url: str
+    license: Optional[str]
+    topics: Tuple[str, ...]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(REPOSITORY_FIELDS)
+
+    def __len__(self) -> int:
+        return len(REPOSITORY_FIELDS)
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, RepositoryRecord):
+            return self is other or (
+                self.url == other.url and self.name == other.name and self.description == other.description
+                and self.license == other.license and self.topics == other.topics
+            )
+        if isinstance(other, Mapping):
+            return self.as_dict() == {**other, "topics": list(other.get("topics") or [])}
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return f"RepositoryRecord({self.as_dict()!r})"
+
+    def as_dict(self) -> dict:
+        """
+        Returns the repository as a dictionary of the `Repository` schema, with its topics in a list.
+        """
+        return {"name": self.name, "description": self.description, "url": self.url, "license": self.license, "topics": list(self.topics)}
+
+
+class RepositoryPool:
+    """
+    Shares the records of equal repositories, keyed by URL.
+
+    The pool only refers to its records weakly, so a record is freed once no cached list, page or index
+    holds it. The references of freed records are swept out whenever the pool has doubled in size since the
+    last sweep. When a repository changes, the changed record replaces the old one in the pool and the lists
+    fetched before keep the old one until they are fetched again.
+
+    The pool is used from the threads of the repository store without a lock. Its dictionary operations are
+    atomic, and a record created by two threads at once is only shared less.
+
+    Args:
+        min_sweep_size: Size of the pool below which freed references are not swept out.
+    """
+
+    def __init__(self, min_sweep_size: int = 1024):
+        self.min_sweep_size = min_sweep_size
+        self._records: Dict[str, "weakref.ref[RepositoryRecord]"] = {}
+        self._sweep_at = min_sweep_size
+
+    def __len__(self) -> int:
+        return sum(1 for reference in list(self._records.values()) if reference() is not None)
+
+    def _sweep(self) -> None:
+        self._records = {url: reference for url, reference in list(self._records.items()) if reference() is not None}
+        self._sweep_at = max(self.min_sweep_size, 2 * len(self._records))
+
+    def get(self, name: str, description: Optional[str], url: str, license: Optional[str], topics: Iterable[str]) -> RepositoryRecord:
+        """
+        Returns the record of a repository, reusing the pooled record of its URL if it is equal.
+
+        Args:
+            name: The name of the repository.
+            description: The description of the repository, if any.
+            url: The URL of the repository.
+            license: The name of the license of the repository, if any.
+            topics: The topics of the repository.
+
+        Returns:
+            The record.
+
+        Raises:
+            ValueError: If the name, the license or a topic is not a string.
+        """
+        try:
+            topics = tuple(topics) if topics else ()
+        except TypeError as e:
+            raise ValueError(f"Invalid repository {url!r}: {e}") from e
+        reference = self._records.get(url)
+        record = reference() if reference is not None else None
+        # Most repositories are unchanged since they were last seen, so the strings are only interned for new records
+        if record is not None and record.name == name and record.description == description and record.license == license and record.topics == topics:
+            return record
+        try:
+            name = sys.intern(name)
+            license = sys.intern(license) if license is not None else None
+            topics = tuple(map(sys.intern, topics))
+        except TypeError as e:
+            raise ValueError(f"Invalid repository {url!r}: {e}") from e
+        record = RepositoryRecord(name, description, url, license, topics)
+        self._records[url] = weakref.ref(record)
+        if len(self._records) >= self._sweep_at:
+            self._sweep()
+        return record
+
+
+REPOSITORY_POOL = RepositoryPool()
+"""
+The pool shared by every list of the process.
+"""
+
+
+repository_record = REPOSITORY_POOL.get
+"""
+Returns the record of a repository from `REPOSITORY_POOL`. See `RepositoryPool.get`. Bound once, since it is
+called for every projected repository.
+"""
@@ -9,14 +9,23 @@ In development mode, the script utilizes `debugpy` to enable debugging support,
 on all network interfaces at port 5678. This allows for attaching a remote debugger to 
 the process for troubleshooting and development purposes.
 
+In production mode, Uvicorn supervises several worker processes, one per available CPU unless
+configured otherwise. Workers can be restarted gracefully after a number of requests, and the
+`uvloop` event loop and `httptools` HTTP parser are used when they are installed.
+
 Attributes:
     app (FastAPI): The FastAPI application instance, created by calling `create_app()`.
 
 Functions:
     start(): Configures and runs the FastAPI application server. In development mode, 
              it also sets up and waits for a debugger connection.
+    get_worker_count(settings): Resolves the number of production worker processes.
+    production_server_options(settings): Builds the Uvicorn options of the production mode.
 """
 
+import importlib.util
+import os
+from typing import Any, Dict
 from fastapi import FastAPI
 import uvicorn
 from app.config import Settings
@@ -41,6 +50,46 @@ def validate_env_variables():
     except ValidationError as e:
         raise RuntimeError("CLIENT_SECRET and CLIENT_ID need to be defined. Environment variable validation error: {e}")
 
+def get_worker_count(settings: Settings) -> int:
+    """
+    Resolves the number of worker processes to run in production.
+
+    Args:
+        settings: The application settings.
+
+    Returns:
+        `settings.server_workers` if set, otherwise the number of CPUs the process may run on.
+    """
+    if settings.server_workers:
+        return settings.server_workers
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def production_server_options(settings: Settings) -> Dict[str, Any]:
+    """
+    Builds the keyword arguments passed to `uvicorn.run` in production mode.
+
+    Args:
+        settings: The application settings.
+
+    Returns:
+        A dictionary of Uvicorn options.
+    """
+    return {
+        "host": "0.0.0.0",
+        "port": 8000,
+        "log_level": "info",
+        "workers": get_worker_count(settings),
+        "limit_max_requests": settings.server_max_requests or None,
+        "limit_max_requests_jitter": settings.server_max_requests_jitter,
+        "backlog": settings.server_backlog,
+        "timeout_keep_alive": settings.server_keep_alive,
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+    }
+
 def start():
     """
     Starts the FastAPI application with Uvicorn, with optional debug support.
@@ -48,7 +97,8 @@ def start():
     Validates required environment variables before starting the server.
     In development mode ('dev'), it also starts a debug server using `debugpy`, 
     which listens for incoming debugger connections. Otherwise, it runs the 
-    application in production mode without debug support.
+    application in production mode without debug support, with the worker processes
+    and server options from `production_server_options`.
     """
     try:
         validate_env_variables()
@@ -65,8 +115,7 @@ def start():
 
         uvicorn.run("app.run:app", host="0.0.0.0", port=8000, reload=True, log_level="info")
     else:
-        # TODO: replace with gunicorn
-        uvicorn.run("app.run:app", host="0.0.0.0", port=8000, log_level="info")
+        uvicorn.run("app.run:app", **production_server_options(settings))
 
 if __name__ == "__main__":
     start()
@@ -0,0 +1,260 @@
+"""
+This module defines the background refresh of the starred repositories of active users.
+
+Every request for the starred repositories of a user marks the user as active. A `RefreshScheduler` running
+for the lifetime of the application periodically refreshes the cached lists of active users that are about to
+expire, so that their next request is served from a fresh list instead of waiting for GitHub.
+
+Users are refreshed in order of how likely they are to return soon, estimated from how often and how recently
+they made requests. Refreshes spend a budget of upstream calls per minute, estimated from the number of pages
+of each list. A user is not refreshed while the rate limit of their access token is low, so that background
+refreshes do not use up the quota their own requests need, and nobody is refreshed while the circuit breaker
+is open.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+from app.cache import StarredReposCache
+from app.metrics import BACKGROUND_REFRESHES
+from app.upstream import CircuitBreaker, RateLimitTracker
+
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass
+class ActiveUser:
+    """
+    A user whose list is kept fresh.
+
+    Attributes:
+        access_token: OAuth access token of the latest request of the user.
+        last_seen: Monotonic time of the latest request of the user.
+        activity: Number of requests of the user, decayed by their age with the half-life of the scheduler.
+    """
+    access_token: str
+    last_seen: float
+    activity: float
+
+
+class CallBudget:
+    """
+    A token bucket of upstream calls, refilled continuously at a rate per minute and holding at most a minute's worth.
+
+    A refresh costing more than a minute's worth may start once the bucket is full, and leaves it in debt.
+
+    Args:
+        calls_per_minute: Calls allowed per minute.
+        clock: Function returning the current monotonic time. Overridable for tests.
+    """
+
+    def __init__(self, calls_per_minute: int, clock: Callable[[], float] = time.monotonic):
+        self.calls_per_minute = calls_per_minute
+        self._clock = clock
+        self._available = float(calls_per_minute)
+        self._updated_at = clock()
+
+    def available(self) -> float:
+        """
+        Returns the number of calls that can be made now. Negative while the bucket is in debt.
+        """
+        now = self._clock()
+        self._available = min(self.calls_per_minute, self._available + (now - self._updated_at) * self.calls_per_minute / 60)
+        self._updated_at = now
+        return self._available
+
+    def take(self, calls: int) -> bool:
+        """
+        Spends `calls` calls if the bucket holds them, or is full.
+
+        Returns:
+            Whether the calls were spent.
+        """
+        if self.available() < min(calls, self.calls_per_minute):
+            return False
+        self._available -= calls
+        return True
+
+
+class RefreshScheduler:
+    """
+    Refreshes the cached lists of recently active users before they expire.
+
+    Args:
+        cache: The starred repositories cache.
+        load: Coroutine function fetching the list of a user from GitHub given the user id and access token, as
+              `StarredRepos.load` does. Its result is cached.
+        rate_limits: The rate limits GitHub reported for every access token.
+        circuit_breaker: The circuit breaker of GitHub calls.
+        calls_per_minute: Budget of upstream calls per minute. 0 disables refreshing.
+        per_page: Number of repositories per page of GitHub, for estimating the calls of a refresh.
+        refresh_ahead: Seconds before the expiry of a list from which it is refreshed.
+        idle_after: Seconds after the latest request of a user from which the user is no longer refreshed.
+        min_remaining: Fraction of the rate limit of an access token below which its user is not refreshed.
+        max_users: Maximum number of active users tracked. The least recently seen user is dropped when full.
+        resource: The GitHub rate limit resource the refreshes count against.
+        interval: Seconds between two rounds of refreshes.
+        half_life: Seconds in which the weight of a request in the activity of a user halves.
+        clock: Function returning the current monotonic time. Overridable for tests.
+    """
+
+    def __init__(
+        self,
+        cache: StarredReposCache[Dict[str, Any]],
+        load: Callable[[int, str], Awaitable[Dict[str, Any]]],
+        rate_limits: RateLimitTracker,
+        circuit_breaker: CircuitBreaker,
+        calls_per_minute: int,
+        per_page: int,
+        refresh_ahead: float,
+        idle_after: float,
+        min_remaining: float,
+        max_users: int,
+        resource: str = "core",
+        interval: float = 5.0,
+        half_life: float = 600.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.cache = cache
+        self._load = load
+        self.rate_limits = rate_limits
+        self.circuit_breaker = circuit_breaker
+        self.budget = CallBudget(calls_per_minute, clock)
+        self.per_page = per_page
+        self.refresh_ahead = refresh_ahead
+        self.idle_after = idle_after
+        self.min_remaining = min_remaining
+        self.max_users = max_users
+        self.resource = resource
+        self.interval = interval
+        self.half_life = half_life
+        self._clock = clock
+        self._users: "OrderedDict[int, ActiveUser]" = OrderedDict()
+        self._refreshes: Set[asyncio.Future] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _decayed(self, user: ActiveUser, now: float) -> float:
+        return user.activity * 0.5 ** ((now - user.last_seen) / self.half_life)
+
+    def touch(self, user_id: int, access_token: str) -> None:
+        """
+        Records a request for the starred repositories of a user.
+
+        Args:
+            user_id: The GitHub user id.
+            access_token: OAuth access token of the user.
+        """
+        now = self._clock()
+        user = self._users.get(user_id)
+        if user is None:
+            self._users[user_id] = ActiveUser(access_token=access_token, last_seen=now, activity=1.0)
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            return
+        user.activity = self._decayed(user, now) + 1.0
+        user.access_token = access_token
+        user.last_seen = now
+        self._users.move_to_end(user_id)
+
+    def due(self) -> List[int]:
+        """
+        Returns the active users whose list expires within `refresh_ahead` and is not being loaded, most active first.
+
+        Users idle for longer than `idle_after` are forgotten. Users whose list is not cached at all are left to
+        their next request, so that refreshes do not evict the lists of other users.
+        """
+        now = self._clock()
+        while self._users:
+            user_id, user = next(iter(self._users.items()))
+            if now - user.last_seen < self.idle_after:
+                break
+            del self._users[user_id]
+        due = []
+        for user_id, user in self._users.items():
+            expires_in = self.cache.expires_in(user_id)
+            if expires_in is not None and expires_in <= self.refresh_ahead and not self.cache.loading(user_id):
+                due.append((-self._decayed(user, now), user_id))
+        return [user_id for _, user_id in sorted(due)]
+
+    def low_on_quota(self, access_token: str) -> bool:
+        """
+        Tells whether the rate limit of an access token is too low for a background refresh.
+        """
+        rate_limit = self.rate_limits.get(access_token, self.resource)
+        return rate_limit is not None and rate_limit.remaining < self.min_remaining * rate_limit.limit
+
+    def calls(self, user_id: int) -> int:
+        """
+        Estimates the upstream calls of refreshing the list of a user as the number of its pages.
+        """
+        starred_repos = self.cache.peek(user_id)
+        count = starred_repos["count"] if starred_repos is not None else 0
+        return max(1, math.ceil(count / self.per_page))
+
+    def run_once(self) -> List[int]:
+        """
+        Starts the refreshes of due users, most active first, until the call budget runs out.
+
+        Returns:
+            The users whose refresh was started.
+        """
+        if self.budget.calls_per_minute == 0 or self.circuit_breaker.state == "open":
+            return []
+        started = []
+        for user_id in self.due():
+            access_token = self._users[user_id].access_token
+            if self.low_on_quota(access_token):
+                BACKGROUND_REFRESHES.labels("rate_limited").inc()
+                continue
+            if not self.budget.take(self.calls(user_id)):
+                break
+            refresh = self.cache.load(user_id, lambda user_id=user_id, access_token=access_token: self._load(user_id, access_token))
+            self._refreshes.add(refresh)
+            refresh.add_done_callback(lambda refresh, user_id=user_id: self._finish(user_id, refresh))
+            started.append(user_id)
+        return started
+
+    def _finish(self, user_id: Hashable, refresh: asyncio.Future) -> None:
+        self._refreshes.discard(refresh)
+        if refresh.cancelled():
+            return
+        if refresh.exception() is not None:
+            BACKGROUND_REFRESHES.labels("failed").inc()
+            logger.warning(f"Background refresh of the starred repositories of user {user_id} failed: {refresh.exception()}")
+        else:
+            BACKGROUND_REFRESHES.labels("refreshed").inc()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Scheduling background refreshes failed: {e}")
+
+    def start(self) -> None:
+        """
+        Starts refreshing in the background, a round every `interval` seconds.
+        """
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def aclose(self) -> None:
+        """
+        Stops refreshing and cancels the refreshes in flight.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        refreshes = list(self._refreshes)
+        for refresh in refreshes:
+            refresh.cancel()
+        await asyncio.gather(*refreshes, return_exceptions=True)
@@ -29,8 +29,47 @@ class StarredRepositoriesResponse(BaseModel):
     A response structure for a list of starred repositories.
 
     Attributes:
-        count (int): The total number of starred repositories.
+        count (int): The total number of starred repositories, or the number of repositories in the page when the request filters or paginates.
         repositories (List[Repository]): A list of `Repository` instances representing the starred repositories.
+        total (Optional[int]): The number of repositories matching the filters over all pages. Only set when the request filters or paginates.
+        next_cursor (Optional[str]): The `cursor` of the next page, or None on the last page. Only set when the request filters or paginates.
     """
     count: int
     repositories: List[Repository]
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+class SearchResult(Repository):
+    """
+    A repository matching a search.
+
+    Attributes:
+        score (float): The BM25 relevance of the repository to the search. Higher is more relevant.
+    """
+    score: float
+
+class SearchResponse(BaseModel):
+    """
+    A response structure for a page of search results.
+
+    Attributes:
+        count (int): The number of results in the page.
+        total (int): The number of repositories matching the search over all pages.
+        next_cursor (Optional[str]): The `cursor` of the next page, or None on the last page.
+        repositories (List[SearchResult]): The results of the page, best matches first.
+    """
+    count: int
+    total: int
+    next_cursor: Optional[str] = None
+    repositories: List[SearchResult]
+
+class BatchRequest(BaseModel):
+    """
+    A request for the starred repositories of many users at once.
+
+    Attributes:
+        sessions (List[str]): Session tokens issued by `/callback`.
+        user_ids (List[int]): GitHub user ids. Requires the batch API key.
+    """
+    sessions: List[str] = []
+    user_ids: List[int] = []
@@ -0,0 +1,229 @@
+"""
+This module defines the full-text search over the starred repositories of a user.
+
+Every user who searches gets an in-process inverted index from tokens of the name, description and topics
+of their repositories to the repositories containing them. Results contain every token of the query and are
+ranked with BM25, with matches in names and topics weighing more than matches in descriptions. Ties are
+broken by the order of starring, most recent first.
+
+Documents are keyed by repository URL, so when the list of a user is fetched again the index is updated
+with the repositories that were added, changed or removed, instead of being rebuilt.
+"""
+
+import heapq
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+FIELD_WEIGHTS = {"name": 3.0, "topics": 2.0, "description": 1.0}
+"""
+Weight of an occurrence of a token in each field of a repository.
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lower-cased word tokens. Punctuation, including the hyphens of names and topics, separates tokens.
+
+    Args:
+        text: The text.
+
+    Returns:
+        The tokens in order of appearance.
+    """
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def repository_terms(repository: Dict[str, Any]) -> Dict[str, float]:
+    """
+    Returns the field-weighted frequency of every token of a repository.
+
+    Args:
+        repository: A projected repository.
+
+    Returns:
+        The weighted frequencies keyed by token.
+    """
+    terms: Dict[str, float] = {}
+    fields = [
+        ("name", repository["name"]),
+        ("description", repository["description"] or ""),
+        ("topics", " ".join(repository["topics"])),
+    ]
+    for field, text in fields:
+        weight = FIELD_WEIGHTS[field]
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0.0) + weight
+    return terms
+
+
+class SearchIndex:
+    """
+    An inverted index of the starred repositories of a user, ranked with BM25.
+
+    Args:
+        k1: BM25 term frequency saturation.
+        b: BM25 document length normalization.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.repositories: Optional[List[Dict[str, Any]]] = None
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self._ids: Dict[str, int] = {}
+        self._documents: Dict[int, Dict[str, Any]] = {}
+        self._terms: Dict[int, Dict[str, float]] = {}
+        self._lengths: Dict[int, float] = {}
+        self._positions: Dict[int, int] = {}
+        self._norms: Dict[int, float] = {}
+        self._total_length = 0.0
+        self._next_id = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def _add(self, repository: Dict[str, Any]) -> None:
+        document_id = self._next_id
+        self._next_id += 1
+        terms = repository_terms(repository)
+        self._ids[repository["url"]] = document_id
+        self._documents[document_id] = repository
+        self._terms[document_id] = terms
+        self._lengths[document_id] = length = sum(terms.values())
+        self._total_length += length
+        for token, frequency in terms.items():
+            self.postings.setdefault(token, {})[document_id] = frequency
+
+    def _remove(self, url: str) -> None:
+        document_id = self._ids.pop(url)
+        del self._documents[document_id]
+        self._positions.pop(document_id, None)
+        self._total_length -= self._lengths.pop(document_id)
+        for token in self._terms.pop(document_id):
+            documents = self.postings[token]
+            del documents[document_id]
+            if not documents:
+                del self.postings[token]
+
+    def update(self, repositories: List[Dict[str, Any]]) -> Tuple[int, int]:
+        """
+        Brings the index in line with a newly fetched list, reindexing only the repositories that changed.
+
+        Args:
+            repositories: The projected repositories, in the order GitHub returned them.
+
+        Returns:
+            The number of documents added and removed. A changed repository counts as both.
+        """
+        by_url = {repository["url"]: repository for repository in repositories}
+        stale = [url for url, document_id in self._ids.items() if by_url.get(url) != self._documents[document_id]]
+        for url in stale:
+            self._remove(url)
+        added = 0
+        for position, repository in enumerate(repositories):
+            if repository["url"] not in self._ids:
+                self._add(repository)
+                added += 1
+            self._positions[self._ids[repository["url"]]] = position
+        # The length normalization of BM25 depends on the average length, so it is recomputed for every document
+        average_length = self._total_length / len(self._lengths) if self._lengths else 1.0
+        self._norms = {
+            document_id: self.k1 * (1 - self.b + self.b * length / average_length) for document_id, length in self._lengths.items()
+        }
+        self.repositories = repositories
+        return added, len(stale)
+
+    def search(self, text: str, limit: int, offset: int = 0) -> Tuple[List[Tuple[float, Dict[str, Any]]], int]:
+        """
+        Finds the repositories containing every token of `text`, best matches first.
+
+        Args:
+            text: The search text.
+            limit: Maximum number of results returned.
+            offset: Number of best results skipped, for pagination.
+
+        Returns:
+            The page of results as (score, repository) pairs, and the total number of matching repositories.
+        """
+        tokens = list(dict.fromkeys(tokenize(text)))
+        postings = [self.postings.get(token) for token in tokens]
+        if not postings or not all(postings):
+            return [], 0
+        postings.sort(key=len)
+        candidates = postings[0].keys()
+        for documents in postings[1:]:
+            candidates = candidates & documents.keys()
+
+        # BM25, with the (k1 + 1) factor folded into the inverse document frequency of every term
+        count = len(self._documents)
+        weights = [(documents, (self.k1 + 1) * math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))) for documents in postings]
+        norms, positions = self._norms, self._positions
+        scored = (
+            (-sum(weight * documents[document_id] / (documents[document_id] + norms[document_id]) for documents, weight in weights), positions[document_id], document_id)
+            for document_id in candidates
+        )
+        best = heapq.nsmallest(offset + limit, scored)
+        return [(-score, self._documents[document_id]) for score, _, document_id in best[offset:]], len(candidates)
+
+
+class SearchIndexStore:
+    """
+    Keeps the search index of every user who has searched, evicting the least recently used user when full.
+
+    An index is updated when the list of the user has changed, compared as in `app.query.IndexStore`.
+
+    Args:
+        max_users: Maximum number of users whose index is kept.
+    """
+
+    def __init__(self, max_users: int):
+        self.max_users = max_users
+        self._indexes: "OrderedDict[Hashable, SearchIndex]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._indexes)
+
+    @staticmethod
+    def _update(index: SearchIndex, repositories: List[Dict[str, Any]]) -> None:
+        if index.repositories is repositories:
+            return
+        if index.repositories == repositories:
+            index.repositories = repositories
+        else:
+            index.update(repositories)
+
+    def get(self, user_id: Hashable, repositories: List[Dict[str, Any]]) -> SearchIndex:
+        """
+        Returns the index of a user, creating it or updating it to `repositories` as needed.
+
+        Args:
+            user_id: The GitHub user id.
+            repositories: The current list of repositories of the user.
+
+        Returns:
+            The index of `repositories`.
+        """
+        index = self._indexes.get(user_id)
+        if index is None:
+            index = self._indexes[user_id] = SearchIndex()
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        self._update(index, repositories)
+        self._indexes.move_to_end(user_id)
+        return index
+
+    def refresh(self, user_id: Hashable, repositories: List[Dict[str, Any]]) -> None:
+        """
+        Updates the index of a user to a newly fetched list, if the user has an index.
+
+        Args:
+            user_id: The GitHub user id.
+            repositories: The newly fetched repositories of the user.
+        """
+        index = self._indexes.get(user_id)
+        if index is not None:
+            self._update(index, repositories)
@@ -0,0 +1,212 @@
+"""
+This module defines the fast path for turning GitHub repository objects into API responses.
+
+Instead of building a `Repository` model for every repository and letting FastAPI validate and serialize
+the whole `StarredRepositoriesResponse` again through `response_model`, the five returned fields are
+projected straight from the GitHub JSON into the compact records of `app.records` and encoded with `orjson`
+when it is installed. The models in `app.schemas` still describe the responses in the OpenAPI schema.
+"""
+
+import json
+from typing import Any, Dict, List, Tuple
+from fastapi.responses import JSONResponse
+from app.metrics import STAGE_SECONDS
+from app.records import RepositoryRecord, repository_record
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, RepositoryRecord):
+        return {"name": value.name, "description": value.description, "url": value.url, "license": value.license, "topics": value.topics}
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _records_as_dicts(values: List[Any]) -> List[Any]:
+    return [
+        {"name": value.name, "description": value.description, "url": value.url, "license": value.license, "topics": value.topics}
+        if value.__class__ is RepositoryRecord else value
+        for value in values
+    ]
+
+
+def _encodable(content: Any) -> Any:
+    """
+    Converts the records of `content` to dictionaries in bulk, where the responses hold them: `content` itself,
+    a list or a dictionary value.
+    """
+    if isinstance(content, RepositoryRecord):
+        return _default(content)
+    if isinstance(content, list):
+        return _records_as_dicts(content)
+    if isinstance(content, dict):
+        return {key: _records_as_dicts(value) if isinstance(value, list) else value for key, value in content.items()}
+    return content
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encodes `content` as compact UTF-8 JSON, using `orjson` when it is available.
+
+    Repository records are encoded as objects of the `Repository` schema. The lists of records of a response
+    are converted in one pass before encoding, since a conversion called back by the encoder for every
+    record costs more than the encoding itself. Records nested deeper are converted through the callback.
+
+    Args:
+        content: A JSON serializable object.
+
+    Returns:
+        The encoded JSON.
+    """
+    content = _encodable(content)
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSON response rendered with `dumps`. The time spent rendering is recorded as the `serialize` stage.
+    """
+
+    def render(self, content: Any) -> bytes:
+        with STAGE_SECONDS.labels("serialize").time():
+            return dumps(content)
+
+
+def project_repository(repo: Dict[str, Any]) -> RepositoryRecord:
+    """
+    Projects the fields of a `Repository` from a repository object returned by GitHub.
+
+    Only the checks needed to keep the output within the `Repository` schema are made.
+
+    Args:
+        repo: A repository object as returned by GitHub.
+
+    Returns:
+        The record of the repository from the shared pool, with the `name`, `description`, `url`, `license` and `topics`
+        of the repository.
+
+    Raises:
+        ValueError: If the repository object lacks a name or a valid URL, or has an invalid description or license.
+    """
+    try:
+        name = repo['name']
+        url = repo['html_url']
+        description = repo.get('description')
+        license = repo.get('license')
+        license = license.get('name') if license else None
+        topics = repo.get('topics') or []
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid repository object: {e!r}") from e
+    if not isinstance(name, str) or not isinstance(url, str) or not url.startswith(("https://", "http://")):
+        raise ValueError(f"Invalid repository object: name={name!r}, html_url={url!r}")
+    if not isinstance(description, (str, type(None))):
+        raise ValueError(f"Invalid repository object: description={description!r}")
+    return repository_record(name, description, url, license, topics)
+
+
+def project_repositories(starred_repos_data: List[Dict[str, Any]]) -> List[RepositoryRecord]:
+    """
+    Projects a page of repository objects returned by GitHub with `project_repository`.
+
+    Args:
+        starred_repos_data: Repository objects as returned by GitHub.
+
+    Returns:
+        The projected repositories.
+
+    Raises:
+        ValueError: If the page is not a list or any repository object is invalid.
+    """
+    if not isinstance(starred_repos_data, list):
+        raise ValueError("Expected a list of repositories from GitHub.")
+    return [project_repository(repo) for repo in starred_repos_data]
+
+
+def project_starred_repositories(starred_data: List[Dict[str, Any]]) -> List[Tuple[str, RepositoryRecord]]:
+    """
+    Projects a page of stars returned by GitHub with the `application/vnd.github.star+json` media type.
+
+    Args:
+        starred_data: Objects with the `starred_at` time and the `repo` object of each star.
+
+    Returns:
+        The `starred_at` time and the repository projected with `project_repository` of each star.
+
+    Raises:
+        ValueError: If the page is not a list or any star is invalid.
+    """
+    if not isinstance(starred_data, list):
+        raise ValueError("Expected a list of stars from GitHub.")
+    try:
+        stars = [(star['starred_at'], star['repo']) for star in starred_data]
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid star object: {e!r}") from e
+    for starred_at, _ in stars:
+        if not isinstance(starred_at, str):
+            raise ValueError(f"Invalid star object: starred_at={starred_at!r}")
+    return [(starred_at, project_repository(repo)) for starred_at, repo in stars]
+
+
+def project_graphql_repository(node: Dict[str, Any]) -> RepositoryRecord:
+    """
+    Projects the fields of a `Repository` from a repository node returned by the GraphQL API.
+
+    Args:
+        node: A repository node as returned for `app.github.STARRED_REPOSITORIES_QUERY`.
+
+    Returns:
+        A record like the one returned by `project_repository`.
+
+    Raises:
+        ValueError: If the repository node lacks a name or a valid URL, or has an invalid description or license.
+    """
+    try:
+        name = node['name']
+        url = node['url']
+        description = node.get('description')
+        license = node.get('licenseInfo')
+        license = license.get('name') if license else None
+        topics = [topic['topic']['name'] for topic in (node.get('repositoryTopics') or {}).get('nodes') or []]
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f"Invalid repository node: {e!r}") from e
+    if not isinstance(name, str) or not isinstance(url, str) or not url.startswith(("https://", "http://")):
+        raise ValueError(f"Invalid repository node: name={name!r}, url={url!r}")
+    if not isinstance(description, (str, type(None))):
+        raise ValueError(f"Invalid repository node: description={description!r}")
+    return repository_record(name, description, url, license, topics)
+
+
+def project_graphql_repositories(nodes: List[Dict[str, Any]]) -> List[RepositoryRecord]:
+    """
+    Projects a page of repository nodes returned by the GraphQL API with `project_graphql_repository`.
+
+    Args:
+        nodes: Repository nodes as returned by GitHub.
+
+    Returns:
+        The projected repositories.
+
+    Raises:
+        ValueError: If the page is not a list or any repository node is invalid.
+    """
+    if not isinstance(nodes, list):
+        raise ValueError("Expected a list of repository nodes from GitHub.")
+    return [project_graphql_repository(node) for node in nodes]
+
+
+def starred_repositories_response(repositories: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Builds a response of the `StarredRepositoriesResponse` shape from projected repositories.
+
+    Args:
+        repositories: Repositories as returned by `project_repository`.
+
+    Returns:
+        A dictionary with the `count` and the `repositories`.
+    """
+    return {"count": len(repositories), "repositories": repositories}
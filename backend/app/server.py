@@ -6,29 +6,112 @@ This module defines a function to create and configure an instance of the FastAP
 Functions:
     create_app() -> FastAPI: Creates and returns a configured FastAPI application instance.
 """
+import asyncio
+import math
 import os
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Request
 from contextlib import asynccontextmanager
-from fastapi.responses import FileResponse
-
-from app.dependencies import get_settings
-from .api.endpoints.starred_repos import starred_repos_router as starred_repos_router
+from fastapi.responses import FileResponse, JSONResponse
+
+from app.cache import ETagStore
+from app.compression import BodyStore
+from app.query import IndexStore
+from app.scheduler import RefreshScheduler
+from app.search import SearchIndexStore
+from app.store import warm_cache
+from app.sync import SyncStore
+from app.upstream import CircuitBreaker, RateLimitTracker
+from app.dependencies import create_github_transport, create_http_client, create_repository_store, create_session_store, create_starred_cache, get_settings
+from .api.endpoints.starred_repos import refresh_loader, starred_repos_router as starred_repos_router
+from .api.endpoints.metrics import metrics_router
 import httpx
-from .middleware import ErrorLoggingMiddleware, SecurityHeadersMiddleware
+from .metrics import RATE_LIMIT_REJECTIONS
+from .middleware import ErrorLoggingMiddleware, MetricsMiddleware, SecurityHeadersMiddleware
 import logging
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
+from .rate_limit import RateLimitExceeded
 
 # Configure the logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("uvicorn.error")
 
+def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    """
+    Counts the rejection in the `star_retriever_rate_limit_rejections_total` metric and responds with 429.
+
+    Args:
+        request: The rejected request.
+        exc: The rate limit error.
+
+    Returns:
+        A 429 response naming the exceeded limit, with a `Retry-After` header.
+    """
+    RATE_LIMIT_REJECTIONS.labels(request.url.path).inc()
+    return JSONResponse(
+        {"error": f"Rate limit exceeded: {exc.limit}"},
+        status_code=429,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Manages resources that live as long as the application.
+
+    On startup, creates the shared state the routes read through `app.dependencies`: the HTTP client and its
+    GitHub transport, the caches and stores of every user, the session store and the refresh scheduler. The
+    cache is warmed from the repository store if configured. On shutdown, stops background work, waits for
+    pending saves and closes the HTTP client.
+
+    Args:
+        app: The FastAPI application instance.
+    """
+    settings = get_settings()
+    app.state.rate_limits = RateLimitTracker()
+    app.state.circuit_breaker = CircuitBreaker(settings.github_breaker_threshold, settings.github_breaker_reset)
+    app.state.github_transport = create_github_transport(settings, app.state.rate_limits, app.state.circuit_breaker)
+    app.state.http_client = create_http_client(settings, app.state.github_transport)
+    app.state.starred_cache = create_starred_cache(settings)
+    app.state.etag_store = ETagStore(max_users=settings.etag_store_max_users, max_size=settings.cache_max_repositories)
+    app.state.sync_store = SyncStore(max_users=settings.sync_store_max_users, max_size=settings.cache_max_repositories)
+    app.state.index_store = IndexStore(max_users=settings.cache_max_entries)
+    app.state.search_index_store = SearchIndexStore(max_users=settings.cache_max_entries)
+    app.state.body_store = BodyStore(max_users=settings.cache_max_entries, max_bytes=settings.response_body_max_bytes)
+    app.state.batch_semaphore = asyncio.Semaphore(settings.batch_concurrency)
+    app.state.refresh_scheduler = RefreshScheduler(
+        app.state.starred_cache,
+        refresh_loader(app),
+        app.state.rate_limits,
+        app.state.circuit_breaker,
+        calls_per_minute=settings.refresh_calls_per_minute,
+        per_page=settings.github_per_page,
+        refresh_ahead=settings.refresh_ahead,
+        idle_after=settings.refresh_idle_after,
+        min_remaining=settings.refresh_min_remaining,
+        max_users=settings.cache_max_entries,
+        resource="graphql" if settings.github_fetch_backend == "graphql" else "core",
+    )
+    app.state.session_store = create_session_store(settings)
+    app.state.repository_store = create_repository_store(settings)
+    try:
+        if app.state.repository_store is not None and settings.repository_store_warm:
+            warmed = await warm_cache(app.state.repository_store, app.state.starred_cache, settings.cache_max_entries)
+            logger.info(f"Loaded the starred repositories of {warmed} users from the repository store")
+        app.state.refresh_scheduler.start()
+        yield
+    finally:
+        await app.state.refresh_scheduler.aclose()
+        await app.state.starred_cache.aclose()
+        await app.state.session_store.aclose()
+        if app.state.repository_store is not None:
+            await app.state.repository_store.aclose()
+        await app.state.http_client.aclose()
+
 def create_app() -> FastAPI:
     """
     Creates and configures an instance of the FastAPI application.
 
-    Sets up CORS middleware, security headers, error logging, rate limiting, and includes API routers for handling specific paths. Additionally, defines a route for serving the favicon.
+    Sets up CORS middleware, security headers, error logging, request metrics, rate limiting, the lifespan handler owning the shared state, and includes API routers for handling specific paths. Additionally, defines a route for serving the favicon.
 
     Returns:
         FastAPI: The configured FastAPI application instance.
@@ -46,6 +129,7 @@ def create_app() -> FastAPI:
         }],
         docs_url=None if is_prod else "/docs",
         redoc_url=None if is_prod else "/redoc",
+        lifespan=lifespan,
     )
 
     # Configure CORS. This app is for demonstration only, so everything is allowed.
@@ -61,13 +145,17 @@ def create_app() -> FastAPI:
     app.add_middleware(SecurityHeadersMiddleware)
 
     # Register the rate limit exceeded exception handler
-    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
     # Add error logging middleware to the application
     app.add_middleware(ErrorLoggingMiddleware)
 
+    # Add metrics middleware outermost, so that it also times the error responses
+    app.add_middleware(MetricsMiddleware)
+
     # Include API routers
     app.include_router(starred_repos_router, prefix="/api")
+    app.include_router(metrics_router)
 
     # Define favicon route
     @app.get('/favicon.ico', include_in_schema=False)
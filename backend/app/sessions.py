@@ -0,0 +1,225 @@
+"""
+This module defines the server-side sessions issued by the callback endpoint.
+
+A session remembers the GitHub user id and access token of a user who has gone through the OAuth flow,
+so that later requests can fetch the starred repositories without a new authorization code and token exchange.
+Clients only ever see an opaque token: a random session id followed by its HMAC signature, which lets forged
+tokens be rejected before the store is consulted.
+
+Sessions are kept in a SQLite database file in WAL mode, which all worker processes on the host share, so a
+session is known to every worker whichever worker issued it. The file holds access tokens and is only readable
+by its owner. SQLite calls block, so they run on a thread of the store, never on the event loop.
+"""
+
+import asyncio
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Optional
+from app.sqlite import immediate_transaction
+
+SESSION_COOKIE_NAME = "star_retriever_session"
+"""
+Name of the cookie carrying the session token.
+"""
+
+SESSION_HEADER_NAME = "X-Session-Token"
+"""
+Name of the header carrying the session token, for clients that do not keep cookies.
+"""
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    access_token TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sessions_user_id ON sessions (user_id, expires_at);
+CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at);
+"""
+
+
+@dataclass
+class Session:
+    """
+    A server-side session.
+
+    Attributes:
+        user_id: The GitHub user id.
+        access_token: OAuth access token of the user.
+        expires_at: Wall clock time after which the session is no longer valid.
+    """
+    user_id: int
+    access_token: str
+    expires_at: float
+
+
+class SessionStore:
+    """
+    A SQLite store of sessions shared between processes, with expiry and a bound on the number of sessions.
+
+    When a session is created, expired sessions are dropped, and the sessions closest to expiry are dropped
+    while the store holds more than `max_sessions`.
+
+    Args:
+        path: Path of the database file. `:memory:` gives a database private to the store.
+        secret: Key used to sign session tokens.
+        ttl: Seconds a session stays valid after it is created.
+        max_sessions: Maximum number of sessions kept.
+        timeout: Seconds to wait for a lock held by another process before failing.
+        clock: Function returning the current wall clock time. Overridable for tests.
+    """
+
+    def __init__(self, path: str, secret: bytes, ttl: float, max_sessions: int, timeout: float = 5.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self._secret = secret
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.timeout = timeout
+        self._clock = clock
+        # A single thread, so that the connection is never used by two threads at once
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection to the database, opened on first use.
+        """
+        if self._connection is None:
+            if self.path != ":memory:":
+                # Created before SQLite opens it, so that the access tokens are not readable by other users
+                os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _sign(self, session_id: str) -> str:
+        digest = hmac.new(self._secret, session_id.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def _session_id(self, token: str) -> Optional[str]:
+        session_id, _, signature = token.partition(".")
+        if not session_id or not hmac.compare_digest(signature, self._sign(session_id)):
+            return None
+        return session_id
+
+    def create_sync(self, user_id: int, access_token: str) -> str:
+        """
+        Creates a session and returns its signed token. Blocks, see `create`.
+        """
+        session_id = secrets.token_urlsafe(32)
+        now = self._clock()
+        with immediate_transaction(self.connection) as connection:
+            connection.execute(
+                "INSERT INTO sessions (session_id, user_id, access_token, expires_at) VALUES (?, ?, ?, ?)",
+                (session_id, user_id, access_token, now + self.ttl),
+            )
+            connection.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            connection.execute(
+                "DELETE FROM sessions WHERE session_id IN (SELECT session_id FROM sessions ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,),
+            )
+        return f"{session_id}.{self._sign(session_id)}"
+
+    def get_sync(self, token: str) -> Optional[Session]:
+        """
+        Returns the session of a token if the token is authentic and the session has not expired. Blocks, see `get`.
+        """
+        session_id = self._session_id(token)
+        if session_id is None:
+            return None
+        row = self.connection.execute(
+            "SELECT user_id, access_token, expires_at FROM sessions WHERE session_id = ? AND expires_at > ?", (session_id, self._clock())
+        ).fetchone()
+        return Session(*row) if row else None
+
+    def latest_sync(self, user_id: int) -> Optional[Session]:
+        """
+        Returns the most recently created valid session of a user. Blocks, see `latest`.
+        """
+        row = self.connection.execute(
+            "SELECT user_id, access_token, expires_at FROM sessions WHERE user_id = ? AND expires_at > ? ORDER BY expires_at DESC LIMIT 1",
+            (user_id, self._clock()),
+        ).fetchone()
+        return Session(*row) if row else None
+
+    def revoke_sync(self, token: str) -> None:
+        """
+        Ends the session of a token, if any. Blocks, see `revoke`.
+        """
+        session_id = self._session_id(token)
+        if session_id is not None:
+            self.connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def create(self, user_id: int, access_token: str) -> str:
+        """
+        Creates a session on the thread of the store and returns its signed token.
+
+        Args:
+            user_id: The GitHub user id.
+            access_token: OAuth access token of the user.
+
+        Returns:
+            The opaque session token to hand to the client.
+        """
+        return await self._run(self.create_sync, user_id, access_token)
+
+    async def get(self, token: str) -> Optional[Session]:
+        """
+        Returns the session of a token if the token is authentic and the session has not expired.
+
+        Forged tokens are rejected without reading the database.
+
+        Args:
+            token: A session token returned by `create`.
+
+        Returns:
+            The session, or None.
+        """
+        if self._session_id(token) is None:
+            return None
+        return await self._run(self.get_sync, token)
+
+    async def latest(self, user_id: int) -> Optional[Session]:
+        """
+        Returns the most recently created session of a user, if it is still valid.
+
+        Args:
+            user_id: The GitHub user id.
+
+        Returns:
+            The session, or None if the user has no valid session.
+        """
+        return await self._run(self.latest_sync, user_id)
+
+    async def revoke(self, token: str) -> None:
+        """
+        Ends the session of a token, if any.
+
+        Args:
+            token: A session token returned by `create`.
+        """
+        await self._run(self.revoke_sync, token)
+
+    async def aclose(self) -> None:
+        """
+        Stops the thread of the store and closes the connection.
+        """
+        self._executor.shutdown(wait=True)
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
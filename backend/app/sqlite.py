@@ -0,0 +1,34 @@
+"""
+This module defines the SQLite helpers shared by the rate limit storage and the repository store.
+"""
+
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Iterator, Optional
+
+
+@contextmanager
+def immediate_transaction(connection: sqlite3.Connection, lock: Optional[threading.Lock] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Runs a block in a `BEGIN IMMEDIATE` transaction, committed if the block succeeds and rolled back otherwise.
+
+    The transaction takes the write lock of the database up front, so that the reads in the block cannot race
+    with writes of other connections. Waiting for the write lock is bounded by the busy timeout of the connection,
+    after which `sqlite3.OperationalError` is raised.
+
+    Args:
+        connection: A connection opened with `isolation_level=None`, so that it does not manage transactions itself.
+        lock: A lock held for the whole transaction, for a connection shared between threads.
+
+    Yields:
+        The connection.
+    """
+    with lock if lock is not None else nullcontext():
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
@@ -0,0 +1,285 @@
+"""
+This module defines the persistent store of fetched starred repositories.
+
+The in-process cache is lost on every restart, so a rollout would otherwise be followed by a burst of full
+fetches from GitHub. The store keeps the last fetched list of every user in a local SQLite database in WAL
+mode, which all worker processes on the host share and which survives restarts. A list read back from the
+store is served like a cached one, and refreshed from GitHub once it is older than the cache TTL.
+
+The data is normalized: a repository starred by many users is stored once, topics are stored once and
+linked to repositories, and the stars of a user are rows linking the user to repositories in the order
+GitHub returned them. Repositories are identified by their URL. Every save runs in a single transaction,
+and is stamped with the time the list was fetched, so that a save finishing after a newer one is dropped.
+
+SQLite calls block, so reads and writes run on a pool of threads with a connection each, never on the event loop.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from app.cache import StarredReposCache
+from app.records import repository_record
+from app.serialization import starred_repositories_response
+from app.sqlite import immediate_transaction
+
+logger = logging.getLogger("uvicorn.error")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS repositories (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    description TEXT,
+    license TEXT
+);
+CREATE TABLE IF NOT EXISTS topics (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS repository_topics (
+    repository_id INTEGER NOT NULL REFERENCES repositories (id) ON DELETE CASCADE,
+    topic_id INTEGER NOT NULL REFERENCES topics (id),
+    position INTEGER NOT NULL,
+    PRIMARY KEY (repository_id, position)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS stars (
+    user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    repository_id INTEGER NOT NULL REFERENCES repositories (id),
+    PRIMARY KEY (user_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS stars_repository ON stars (repository_id);
+CREATE INDEX IF NOT EXISTS users_synced_at ON users (synced_at);
+"""
+
+
+class RepositoryStore:
+    """
+    A SQLite store of the starred repositories of users, accessed through a thread pool.
+
+    Args:
+        path: Path of the database file.
+        threads: Number of threads running the queries.
+        timeout: Seconds to wait for a lock held by another process before failing.
+        clock: Function returning the current wall clock time. Overridable for tests.
+    """
+
+    def __init__(self, path: str, threads: int = 4, timeout: float = 5.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.timeout = timeout
+        self._clock = clock
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="repository-store")
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._saves: Set[asyncio.Task] = set()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """
+        The connection of the calling thread, opened on first use.
+        """
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA foreign_keys=ON")
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    def save_sync(self, user_id: int, repositories: List[Dict[str, Any]], synced_at: Optional[float] = None) -> bool:
+        """
+        Replaces the stored list of a user in a single transaction, unless a newer list is stored. Blocks, see `save`.
+
+        Args:
+            user_id: The GitHub user id.
+            repositories: The projected repositories, in the order GitHub returned them.
+            synced_at: Wall clock time the list was fetched at. Defaults to now.
+
+        Returns:
+            Whether the list was stored, False if the stored list was fetched after it.
+        """
+        synced_at = self._clock() if synced_at is None else synced_at
+        urls = [repository["url"] for repository in repositories]
+        topic_names = sorted({topic for repository in repositories for topic in repository["topics"]})
+        with immediate_transaction(self.connection) as connection:
+            stored = connection.execute("SELECT synced_at FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            if stored is not None and stored[0] > synced_at:
+                return False
+            previous_ids = [row[0] for row in connection.execute("SELECT repository_id FROM stars WHERE user_id = ?", (user_id,))]
+            connection.executemany(
+                "INSERT INTO repositories (url, name, description, license) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET name = excluded.name, description = excluded.description, license = excluded.license",
+                [(repository["url"], repository["name"], repository["description"], repository["license"]) for repository in repositories],
+            )
+            repository_ids = dict(connection.execute("SELECT url, id FROM repositories WHERE url IN (SELECT value FROM json_each(?))", (json.dumps(urls),)))
+            connection.executemany("INSERT OR IGNORE INTO topics (name) VALUES (?)", [(name,) for name in topic_names])
+            topic_ids = dict(connection.execute("SELECT name, id FROM topics WHERE name IN (SELECT value FROM json_each(?))", (json.dumps(topic_names),)))
+
+            ids = list(repository_ids.values())
+            connection.execute("DELETE FROM repository_topics WHERE repository_id IN (SELECT value FROM json_each(?))", (json.dumps(ids),))
+            connection.executemany(
+                "INSERT OR IGNORE INTO repository_topics (repository_id, topic_id, position) VALUES (?, ?, ?)",
+                [
+                    (repository_ids[repository["url"]], topic_ids[topic], position)
+                    for repository in repositories
+                    for position, topic in enumerate(repository["topics"])
+                ],
+            )
+            connection.execute(
+                "INSERT INTO users (user_id, synced_at) VALUES (?, ?) ON CONFLICT(user_id) DO UPDATE SET synced_at = excluded.synced_at",
+                (user_id, synced_at),
+            )
+            connection.execute("DELETE FROM stars WHERE user_id = ?", (user_id,))
+            connection.executemany(
+                "INSERT OR IGNORE INTO stars (user_id, position, repository_id) VALUES (?, ?, ?)",
+                [(user_id, position, repository_ids[url]) for position, url in enumerate(urls)],
+            )
+            # Repositories the user unstarred and nobody else has starred are no longer needed
+            connection.execute(
+                "DELETE FROM repositories WHERE id IN (SELECT value FROM json_each(?)) "
+                "AND NOT EXISTS (SELECT 1 FROM stars WHERE stars.repository_id = repositories.id)",
+                (json.dumps(previous_ids),),
+            )
+        return True
+
+    def load_sync(self, user_id: int) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        Reads the stored list of a user. Blocks, see `load`.
+
+        Args:
+            user_id: The GitHub user id.
+
+        Returns:
+            The projected repositories and the wall clock time they were saved at, or None if nothing is stored for the user.
+        """
+        connection = self.connection
+        row = connection.execute("SELECT synced_at FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        topics: Dict[int, List[str]] = {}
+        for repository_id, name in connection.execute(
+            "SELECT rt.repository_id, t.name FROM stars s "
+            "JOIN repository_topics rt ON rt.repository_id = s.repository_id JOIN topics t ON t.id = rt.topic_id "
+            "WHERE s.user_id = ? ORDER BY rt.repository_id, rt.position",
+            (user_id,),
+        ):
+            topics.setdefault(repository_id, []).append(name)
+        repositories = [
+            repository_record(name, description, url, license, topics.get(repository_id, ()))
+            for repository_id, name, description, url, license in connection.execute(
+                "SELECT r.id, r.name, r.description, r.url, r.license FROM stars s JOIN repositories r ON r.id = s.repository_id "
+                "WHERE s.user_id = ? ORDER BY s.position",
+                (user_id,),
+            )
+        ]
+        return repositories, row[0]
+
+    def recent_users_sync(self, limit: int, max_age: float) -> List[int]:
+        """
+        Returns the users saved most recently, within `max_age` seconds, newest first. Blocks, see `recent_users`.
+        """
+        return [row[0] for row in self.connection.execute(
+            "SELECT user_id FROM users WHERE synced_at > ? ORDER BY synced_at DESC LIMIT ?", (self._clock() - max_age, limit)
+        )]
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def load(self, user_id: int) -> Optional[Tuple[List[Dict[str, Any]], float]]:
+        """
+        Reads the stored list of a user on the thread pool.
+
+        Args:
+            user_id: The GitHub user id.
+
+        Returns:
+            The projected repositories and their age in seconds, or None if nothing is stored for the user.
+        """
+        stored = await self._run(self.load_sync, user_id)
+        if stored is None:
+            return None
+        repositories, synced_at = stored
+        return repositories, max(self._clock() - synced_at, 0.0)
+
+    async def recent_users(self, limit: int, max_age: float) -> List[int]:
+        """
+        Returns the users saved most recently, within `max_age` seconds, newest first.
+
+        Args:
+            limit: Maximum number of users returned.
+            max_age: Maximum age in seconds of the saved lists.
+        """
+        return await self._run(self.recent_users_sync, limit, max_age)
+
+    def save(self, user_id: int, repositories: List[Dict[str, Any]]) -> None:
+        """
+        Saves the list of a user on the thread pool in the background. Failures are logged.
+
+        The list is stamped with the current time, so it is to be saved as soon as it is fetched. Saves may run
+        concurrently and finish in any order, and a list is only stored if no list fetched later is stored already.
+
+        Args:
+            user_id: The GitHub user id.
+            repositories: The projected repositories, in the order GitHub returned them.
+        """
+        synced_at = self._clock()
+
+        async def save():
+            try:
+                await self._run(self.save_sync, user_id, repositories, synced_at)
+            except Exception as e:
+                logger.warning(f"Saving the starred repositories of user {user_id} failed: {e}")
+
+        task = asyncio.create_task(save())
+        self._saves.add(task)
+        task.add_done_callback(self._saves.discard)
+
+    async def aclose(self) -> None:
+        """
+        Waits for pending saves, then stops the thread pool and closes the connections.
+        """
+        await asyncio.gather(*self._saves, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+async def warm_cache(store: RepositoryStore, cache: StarredReposCache, limit: int) -> int:
+    """
+    Loads the most recently saved lists from the store into the cache.
+
+    Only lists young enough to be served from the cache are loaded, with their age, so that stale
+    lists are refreshed from GitHub on their first request.
+
+    Args:
+        store: The repository store.
+        cache: The cache of starred repositories.
+        limit: Maximum number of users loaded.
+
+    Returns:
+        The number of users loaded.
+    """
+    loaded = 0
+    for user_id in reversed(await store.recent_users(limit, cache.ttl + cache.stale_ttl)):
+        stored = await store.load(user_id)
+        if stored is not None:
+            repositories, age = stored
+            cache.set(user_id, starred_repositories_response(repositories), age=age)
+            loaded += 1
+    return loaded
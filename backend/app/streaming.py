@@ -0,0 +1,103 @@
+"""
+This module defines the streaming output formats of the callback endpoint.
+
+Repositories are written out page by page as they are fetched, so that the time to the first byte and the
+memory used for serializing a response do not depend on how many repositories the user has starred.
+
+Formats:
+    ndjson: One JSON encoded repository of the `Repository` schema per line, with the `application/x-ndjson` media type.
+    json: A single JSON document of the `StarredRepositoriesResponse` shape, written incrementally.
+          The repositories come first and the `count` last, since it is only known at the end.
+"""
+
+import logging
+from typing import Any, AsyncIterator, Dict, List
+from app.serialization import dumps
+
+logger = logging.getLogger("uvicorn.error")
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "json": "application/json",
+}
+"""
+Media types of the supported streaming formats, keyed by the value of the `stream` query parameter.
+"""
+
+
+async def ndjson_chunks(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """
+    Encodes pages of repositories as newline delimited JSON.
+
+    If fetching a page fails midway, the error is logged and a final line with a `detail` key is written
+    in place of the remaining repositories, since the status code has already been sent.
+
+    Args:
+        pages: Pages of repositories in order.
+
+    Yields:
+        One chunk of lines per page.
+    """
+    try:
+        async for page in pages:
+            if page:
+                yield b"".join(dumps(repo) + b"\n" for repo in page)
+    except Exception as e:
+        logger.error(f"Streaming starred repositories failed: {e}")
+        yield dumps({"detail": "Failed to fetch starred repositories from GitHub."}) + b"\n"
+
+
+async def json_chunks(pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """
+    Encodes pages of repositories as one JSON object of the `StarredRepositoriesResponse` shape.
+
+    If fetching a page fails midway, the error is logged and the document is left unterminated,
+    so that clients see an invalid JSON document rather than a silently truncated list.
+
+    Args:
+        pages: Pages of repositories in order.
+
+    Yields:
+        The opening of the document, one chunk per page and the closing with the count.
+    """
+    count = 0
+    yield b'{"repositories":['
+    try:
+        async for page in pages:
+            if page:
+                separator = b"," if count else b""
+                yield separator + b",".join(dumps(repo) for repo in page)
+                count += len(page)
+    except Exception as e:
+        logger.error(f"Streaming starred repositories failed: {e}")
+        return
+    yield f'],"count":{count}}}'.encode()
+
+
+def stream_chunks(stream: str, pages: AsyncIterator[List[Dict[str, Any]]]) -> AsyncIterator[bytes]:
+    """
+    Encodes pages of repositories in the given streaming format.
+
+    Args:
+        stream: Name of the format, one of the keys of `STREAM_MEDIA_TYPES`.
+        pages: Pages of repositories in order.
+
+    Returns:
+        An asynchronous iterator of encoded chunks.
+    """
+    return ndjson_chunks(pages) if stream == "ndjson" else json_chunks(pages)
+
+
+async def iter_pages(repositories: List[Dict[str, Any]], page_size: int) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Splits an already fetched list of repositories into pages for streaming.
+
+    Args:
+        repositories: The repositories.
+        page_size: Number of repositories per page.
+
+    Yields:
+        Consecutive slices of `repositories`.
+    """
+    for start in range(0, len(repositories), page_size):
+        yield repositories[start:start + page_size]
@@ -0,0 +1,213 @@
+"""
+This module defines the incremental sync of starred repositories.
+
+GitHub lists the stars of a user newest first, and with the `application/vnd.github.star+json` media type
+every item carries the time it was starred. Once the whole list has been fetched once, a refresh only has to
+page through the stars newer than the newest one already known and put them in front of the stored list.
+For a user who has not starred anything since, that is a single conditional request for the first page.
+
+An incremental refresh cannot see repositories that were unstarred, so a full sweep replaces the stored list
+every `full_sweep_interval` seconds. A repository starred again after being unstarred shows up as a new star
+and is moved to the front.
+"""
+
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional, Union
+import httpx
+from app.cache import CachedPage
+from app.github import GITHUB_STAR_MEDIA_TYPE, fetch_starred_page, get_last_page, iter_starred_pages
+from app.metrics import STAGE_SECONDS
+from app.serialization import project_starred_repositories
+
+
+@dataclass
+class StarredSync:
+    """
+    What is known of the starred repositories of a user after a sync.
+
+    Attributes:
+        repositories: The projected repositories, most recently starred first.
+        newest_starred_at: The `starred_at` time of the most recent star, or None if the user has no stars.
+        etag: The `ETag` of the first page of stars, for refreshing it conditionally.
+        swept_at: Monotonic time of the last full sweep.
+    """
+    repositories: List[Dict[str, Any]]
+    newest_starred_at: Optional[str]
+    etag: Optional[str]
+    swept_at: float
+
+
+class SyncStore:
+    """
+    Stores the sync state of users, evicting the least recently used users while the store holds the state of
+    more than `max_users` users or more than `max_size` repositories over all states.
+
+    Args:
+        max_users: Maximum number of users whose sync state is kept.
+        max_size: Maximum number of repositories in the states kept. The state of the most recent user is kept even if it holds more.
+    """
+
+    def __init__(self, max_users: int, max_size: int):
+        self.max_users = max_users
+        self.max_size = max_size
+        self._users: "OrderedDict[Hashable, StarredSync]" = OrderedDict()
+        self.size = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __contains__(self, user_id: Hashable) -> bool:
+        return user_id in self._users
+
+    def get(self, user_id: Hashable) -> Optional[StarredSync]:
+        """
+        Returns the sync state of a user, or None if the user has not been synced.
+
+        Args:
+            user_id: The GitHub user id.
+        """
+        state = self._users.get(user_id)
+        if state is not None:
+            self._users.move_to_end(user_id)
+        return state
+
+    def set(self, user_id: Hashable, state: StarredSync) -> None:
+        """
+        Stores the sync state of a user.
+
+        Args:
+            user_id: The GitHub user id.
+            state: The state after a sync.
+        """
+        replaced = self._users.pop(user_id, None)
+        if replaced is not None:
+            self.size -= len(replaced.repositories)
+        self._users[user_id] = state
+        self.size += len(state.repositories)
+        while len(self._users) > 1 and (len(self._users) > self.max_users or self.size > self.max_size):
+            _, evicted = self._users.popitem(last=False)
+            self.size -= len(evicted.repositories)
+            self.evictions += 1
+
+
+async def full_sweep(client: httpx.AsyncClient, access_token: str, per_page: int, concurrency: Union[int, Callable[[], int]], now: float) -> StarredSync:
+    """
+    Fetches every page of stars of a user concurrently with `app.github.iter_starred_pages`.
+
+    Args:
+        client: The HTTP client used for the requests.
+        access_token: OAuth access token of the user.
+        per_page: Number of stars per page.
+        concurrency: Maximum number of page requests in flight at the same time, or a function returning it.
+        now: Monotonic time recorded as the time of the sweep.
+
+    Returns:
+        The new sync state of the user.
+
+    Raises:
+        httpx.HTTPError: If any of the page requests fails.
+        ValueError: If a page cannot be parsed.
+    """
+    fetched_pages: Dict[int, CachedPage] = {}
+    pages = iter_starred_pages(client, access_token, per_page, concurrency, project_starred_repositories, fetched_pages, GITHUB_STAR_MEDIA_TYPE)
+    stars = [star async for page in pages for star in page]
+    first_page = fetched_pages.get(1)
+    return StarredSync(
+        repositories=[repository for _, repository in stars],
+        newest_starred_at=stars[0][0] if stars else None,
+        etag=first_page.etag if first_page else None,
+        swept_at=now,
+    )
+
+
+async def incremental_sync(client: httpx.AsyncClient, access_token: str, per_page: int, state: StarredSync) -> StarredSync:
+    """
+    Fetches the stars newer than the newest known one and merges them into the stored list.
+
+    Pages are requested one at a time, starting with a conditional request for the first page, and paging
+    stops at the first star older than `state.newest_starred_at`. Stars made in the same second as the newest
+    known star are taken as new, and repositories already in the list are moved to the front rather than duplicated.
+
+    Args:
+        client: The HTTP client used for the requests.
+        access_token: OAuth access token of the user.
+        per_page: Number of stars per page.
+        state: The sync state of the user.
+
+    Returns:
+        The new sync state of the user, or `state` itself if the first page has not changed.
+
+    Raises:
+        httpx.HTTPError: If any of the page requests fails.
+        ValueError: If a page cannot be parsed.
+    """
+    new_stars = []
+    etag = state.etag
+    page = 1
+    while True:
+        with STAGE_SECONDS.labels("page_request").time():
+            response = await fetch_starred_page(client, access_token, page, per_page, etag=state.etag if page == 1 else None, media_type=GITHUB_STAR_MEDIA_TYPE)
+        if page == 1:
+            if response.status_code == 304:
+                return state
+            etag = response.headers.get('ETag')
+        with STAGE_SECONDS.labels("decode").time():
+            data = response.json()
+        with STAGE_SECONDS.labels("parse").time():
+            stars = project_starred_repositories(data)
+
+        reached_known = False
+        for starred_at, repository in stars:
+            if state.newest_starred_at is not None and starred_at < state.newest_starred_at:
+                reached_known = True
+                break
+            new_stars.append((starred_at, repository))
+        if reached_known or page >= get_last_page(response):
+            break
+        page += 1
+
+    new_repositories = [repository for _, repository in new_stars]
+    new_urls = {repository["url"] for repository in new_repositories}
+    return StarredSync(
+        repositories=new_repositories + [repository for repository in state.repositories if repository["url"] not in new_urls],
+        newest_starred_at=new_stars[0][0] if new_stars else state.newest_starred_at,
+        etag=etag,
+        swept_at=state.swept_at,
+    )
+
+
+async def sync_starred_repos(
+    client: httpx.AsyncClient,
+    access_token: str,
+    state: Optional[StarredSync],
+    per_page: int = 100,
+    concurrency: Union[int, Callable[[], int]] = 8,
+    full_sweep_interval: float = 3600.0,
+    clock: Callable[[], float] = time.monotonic,
+) -> StarredSync:
+    """
+    Brings the sync state of a user up to date, with a full sweep when none has been made within `full_sweep_interval`.
+
+    Args:
+        client: The HTTP client used for the requests.
+        access_token: OAuth access token of the user.
+        state: The sync state of the user, or None if the user has not been synced.
+        per_page: Number of stars per page.
+        concurrency: Maximum number of page requests in flight during a full sweep, or a function returning it.
+        full_sweep_interval: Seconds after which the next sync is a full sweep.
+        clock: Function returning the current monotonic time. Overridable for tests.
+
+    Returns:
+        The new sync state of the user.
+
+    Raises:
+        httpx.HTTPError: If any of the page requests fails.
+        ValueError: If a page cannot be parsed.
+    """
+    now = clock()
+    if state is None or now - state.swept_at >= full_sweep_interval:
+        return await full_sweep(client, access_token, per_page, concurrency, now)
+    return await incremental_sync(client, access_token, per_page, state)
@@ -0,0 +1,447 @@
+"""
+This module defines the layer every call to the GitHub API goes through.
+
+`GitHubTransport` wraps the transport of the shared HTTP client, so the fetchers in `app.github` need not
+know about it. For every request to the API it:
+
+- Reads the `X-RateLimit-Limit`, `X-RateLimit-Remaining` and `X-RateLimit-Reset` headers of the response into a
+  `RateLimitTracker`, per access token and rate limit resource. A token whose quota is used up fails fast until
+  its reset, instead of making calls GitHub would reject. A token hitting a secondary rate limit likewise fails
+  fast for as long as GitHub asked it to wait.
+- Retries server errors, connection failures and secondary rate limits with exponentially growing, jittered
+  delays, honouring `Retry-After` when GitHub sends it.
+- Counts calls failing with server or connection errors in a `CircuitBreaker`. After enough consecutive failures
+  the breaker opens and calls fail fast for a while, after which a single call probes whether GitHub has recovered.
+  Rate limits apply to one token, so they never count against the breaker shared by all users.
+
+Calls failing fast raise `GitHubUnavailableError`, which the routes turn into a 503 response with a
+`Retry-After` header, or a 429 response for `GitHubRateLimitedError`.
+
+`GitHubTransport` also counts the GitHub requests of the shared client from the moment they are sent until their
+response is closed. This is a count of requests, not of the connections of the pool: requests waiting for a
+connection are counted, and HTTP/2 requests sharing a connection are counted separately.
+"""
+
+import asyncio
+import hashlib
+import random
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+import httpx
+from app.metrics import UPSTREAM_RETRIES
+
+
+class GitHubUnavailableError(httpx.TransportError):
+    """
+    Raised instead of calling GitHub while it is known to be unable to serve the call.
+
+    Args:
+        message: Description of the error.
+        retry_after: Seconds after which the call may succeed.
+        request: The request that was not sent.
+    """
+
+    def __init__(self, message: str, retry_after: float, request: Optional[httpx.Request] = None):
+        super().__init__(message, request=request)
+        self.retry_after = retry_after
+
+
+class GitHubRateLimitedError(GitHubUnavailableError):
+    """
+    Raised instead of calling GitHub while the rate limit of the access token is exhausted.
+    """
+
+
+@dataclass
+class RateLimit:
+    """
+    The rate limit of an access token for one resource, as last reported by GitHub.
+
+    Attributes:
+        limit: Calls allowed per window.
+        remaining: Calls left in the current window.
+        reset_at: Wall clock time at which the window resets.
+    """
+    limit: int
+    remaining: int
+    reset_at: float
+
+
+def rate_limit_resource(request: httpx.Request) -> str:
+    """
+    Returns the GitHub rate limit resource a request counts against, `graphql` or `core`.
+    """
+    return "graphql" if request.url.path.endswith("/graphql") else "core"
+
+
+def access_token_of(request: httpx.Request) -> Optional[str]:
+    """
+    Returns the access token in the `Authorization` header of a request, or None if it has none.
+    """
+    authorization = request.headers.get("Authorization")
+    return authorization.split()[-1] if authorization else None
+
+
+class RateLimitTracker:
+    """
+    Remembers the rate limits GitHub reports for every access token, evicting the least recently updated token when full.
+
+    Besides the quota reported in the headers of every response, a token can be throttled for the time GitHub asked
+    it to wait after a secondary rate limit. Tokens are only kept as hashes.
+
+    Args:
+        max_tokens: Maximum number of tokens whose rate limits are kept.
+        clock: Function returning the current wall clock time. Overridable for tests.
+    """
+
+    def __init__(self, max_tokens: int = 10_000, clock: Callable[[], float] = time.time):
+        self.max_tokens = max_tokens
+        self._clock = clock
+        self._limits: "OrderedDict[Tuple[str, str], RateLimit]" = OrderedDict()
+        self._throttled_until: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._limits)
+
+    @staticmethod
+    def _key(access_token: str, resource: str) -> Tuple[str, str]:
+        return hashlib.sha256(access_token.encode()).hexdigest(), resource
+
+    def update(self, access_token: str, resource: str, response: httpx.Response) -> None:
+        """
+        Records the rate limit headers of a response. Responses without them are ignored.
+
+        Args:
+            access_token: The access token the request was made with.
+            resource: The rate limit resource of the request.
+            response: The response from GitHub.
+        """
+        try:
+            rate_limit = RateLimit(
+                limit=int(response.headers["X-RateLimit-Limit"]),
+                remaining=int(response.headers["X-RateLimit-Remaining"]),
+                reset_at=float(response.headers["X-RateLimit-Reset"]),
+            )
+        except (KeyError, ValueError):
+            return
+        key = self._key(access_token, resource)
+        self._limits[key] = rate_limit
+        self._limits.move_to_end(key)
+        while len(self._limits) > self.max_tokens:
+            self._limits.popitem(last=False)
+
+    def throttle(self, access_token: str, resource: str, seconds: float) -> None:
+        """
+        Records that GitHub asked a token to wait before its next call, as it does with a secondary rate limit.
+
+        Args:
+            access_token: The access token the request was made with.
+            resource: The rate limit resource of the request.
+            seconds: Seconds the token has to wait.
+        """
+        key = self._key(access_token, resource)
+        self._throttled_until[key] = self._clock() + seconds
+        self._throttled_until.move_to_end(key)
+        while len(self._throttled_until) > self.max_tokens:
+            self._throttled_until.popitem(last=False)
+
+    def get(self, access_token: str, resource: str = "core") -> Optional[RateLimit]:
+        """
+        Returns the rate limit of a token, or None if it is unknown or its window has reset since it was reported.
+
+        Args:
+            access_token: The access token.
+            resource: The rate limit resource.
+        """
+        rate_limit = self._limits.get(self._key(access_token, resource))
+        if rate_limit is None or rate_limit.reset_at <= self._clock():
+            return None
+        return rate_limit
+
+    def retry_after(self, access_token: str, resource: str = "core") -> Optional[float]:
+        """
+        Returns the seconds until a token may call GitHub again, or None if calls are allowed.
+
+        A token has to wait until its quota resets if it is exhausted, and until the end of the wait GitHub asked
+        for if it is throttled.
+
+        Args:
+            access_token: The access token.
+            resource: The rate limit resource.
+        """
+        now = self._clock()
+        waits = []
+        rate_limit = self.get(access_token, resource)
+        if rate_limit is not None and rate_limit.remaining <= 0:
+            waits.append(rate_limit.reset_at - now)
+        throttled_until = self._throttled_until.get(self._key(access_token, resource))
+        if throttled_until is not None and throttled_until > now:
+            waits.append(throttled_until - now)
+        return max(waits) if waits else None
+
+    def concurrency(self, access_token: str, maximum: int) -> int:
+        """
+        Returns how many page requests a token may have in flight, given the REST quota it has left.
+
+        The concurrency shrinks in proportion to the fraction of the quota left, and never exceeds the number of calls left.
+
+        Args:
+            access_token: The access token.
+            maximum: The concurrency with the whole quota left.
+
+        Returns:
+            A concurrency between 1 and `maximum`.
+        """
+        rate_limit = self.get(access_token)
+        if rate_limit is None or rate_limit.limit <= 0:
+            return maximum
+        scaled = -(-maximum * rate_limit.remaining // rate_limit.limit)
+        return max(1, min(maximum, rate_limit.remaining, scaled))
+
+
+class CircuitBreaker:
+    """
+    Stops calls to GitHub after consecutive failures, and lets a single probe through once `reset_timeout` has passed.
+
+    Args:
+        failure_threshold: Number of consecutive failures that opens the breaker.
+        reset_timeout: Seconds the breaker stays open before a probe is let through.
+        clock: Function returning the current monotonic time. Overridable for tests.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        """
+        `closed` while calls go through, `open` while they fail fast and `half_open` once a probe may go through.
+        """
+        if self._opened_at is None:
+            return "closed"
+        return "open" if self._probing or self._clock() - self._opened_at < self.reset_timeout else "half_open"
+
+    def allow(self) -> bool:
+        """
+        Tells whether a call may be made. In the half-open state only the first caller is allowed, as the probe.
+        """
+        state = self.state
+        if state == "half_open":
+            self._probing = True
+            return True
+        return state == "closed"
+
+    def retry_after(self) -> float:
+        """
+        Returns the seconds until the breaker lets a probe through.
+        """
+        if self._opened_at is None:
+            return 0.0
+        return max(self._opened_at + self.reset_timeout - self._clock(), 0.0) or self.reset_timeout
+
+    def record_success(self) -> None:
+        """
+        Records a call GitHub answered, which closes the breaker.
+        """
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self) -> None:
+        """
+        Records a failed call. Opens the breaker at the threshold, or again if the call was the probe.
+        """
+        self._failures += 1
+        if self._probing or (self._opened_at is None and self._failures >= self.failure_threshold):
+            self._opened_at = self._clock()
+            self._probing = False
+            self.trips += 1
+
+    def release(self) -> None:
+        """
+        Records a call that ended without an answer or a failure, such as a cancelled one, so that another probe can go through.
+        """
+        self._probing = False
+
+
+def retry_after_header(response: httpx.Response) -> Optional[float]:
+    """
+    Reads the `Retry-After` header of a response in seconds, or None if it is missing or not a number of seconds.
+    """
+    value = response.headers.get("Retry-After", "")
+    return float(value) if value.isdigit() else None
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """
+    Wraps the body of a response to call `release` once when the body is closed.
+    """
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class GitHubTransport(httpx.AsyncBaseTransport):
+    """
+    A transport adding rate limit tracking, retries and a circuit breaker to the requests sent to the GitHub API.
+
+    Requests to other hosts, such as the OAuth token exchange, are passed through untouched. The requests in
+    flight through the wrapped transport, whose responses are not closed yet, are counted in `in_flight`.
+
+    Args:
+        transport: The transport sending the requests.
+        api_url: Root URL of the GitHub API.
+        rate_limits: Tracker of the rate limits of access tokens.
+        breaker: The circuit breaker of the API.
+        max_retries: Maximum number of retries of a request.
+        backoff: Upper bound in seconds of the delay before the first retry, doubled for every further retry.
+        max_wait: Longest delay in seconds waited before a retry. Requests GitHub asks to delay longer are not retried.
+        sleep: Coroutine function waiting for a number of seconds. Overridable for tests.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport,
+        api_url: str,
+        rate_limits: RateLimitTracker,
+        breaker: CircuitBreaker,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_wait: float = 30.0,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+    ):
+        self.transport = transport
+        self.api_url = httpx.URL(api_url)
+        self.rate_limits = rate_limits
+        self.breaker = breaker
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self._sleep = sleep
+        self.in_flight = 0
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        self.in_flight += 1
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.in_flight -= 1
+            raise
+        response.stream = _ReleasingStream(response.stream, self._release)
+        return response
+
+    def _is_api_request(self, request: httpx.Request) -> bool:
+        return request.url.host == self.api_url.host and request.url.port == self.api_url.port
+
+    async def _classify(self, response: httpx.Response, access_token: Optional[str], resource: str) -> Tuple[Optional[str], Optional[float]]:
+        """
+        Decides whether a response is retried.
+
+        Returns:
+            The reason for retrying, or None if the response is final, and the delay GitHub asked for, if any.
+
+        Raises:
+            GitHubRateLimitedError: If the primary rate limit of the token is exhausted.
+        """
+        if response.status_code >= 500:
+            return "server_error", retry_after_header(response)
+        if response.status_code not in (403, 429):
+            return None, None
+        if response.headers.get("X-RateLimit-Remaining") == "0":
+            await response.aclose()
+            retry_after = self.rate_limits.retry_after(access_token, resource) if access_token else None
+            raise GitHubRateLimitedError("The GitHub rate limit of the access token is exhausted.", retry_after=retry_after or 60.0)
+        retry_after = retry_after_header(response)
+        if response.status_code == 403 and retry_after is None:
+            # A 403 without Retry-After is a secondary rate limit only if its message says so
+            await response.aread()
+            if b"secondary rate limit" not in response.content.lower():
+                return None, None
+        # GitHub asks to wait at least a minute after a secondary rate limit that comes without Retry-After
+        return "secondary_rate_limit", 60.0 if retry_after is None else retry_after
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not self._is_api_request(request):
+            return await self._send(request)
+
+        access_token = access_token_of(request)
+        resource = rate_limit_resource(request)
+        attempt = 0
+        while True:
+            exhausted_for = self.rate_limits.retry_after(access_token, resource) if access_token else None
+            if exhausted_for is not None:
+                raise GitHubRateLimitedError("The GitHub rate limit of the access token is exhausted or throttled.", retry_after=exhausted_for, request=request)
+            if not self.breaker.allow():
+                raise GitHubUnavailableError("GitHub is failing, calls are paused.", retry_after=self.breaker.retry_after(), request=request)
+
+            response: Optional[httpx.Response] = None
+            error: Optional[httpx.TransportError] = None
+            requested_delay: Optional[float] = None
+            try:
+                response = await self._send(request)
+                if access_token:
+                    self.rate_limits.update(access_token, resource, response)
+                reason, requested_delay = await self._classify(response, access_token, resource)
+            except GitHubRateLimitedError:
+                self.breaker.record_success()
+                raise
+            except httpx.TransportError as e:
+                reason, error = "transport_error", e
+            except BaseException:
+                self.breaker.release()
+                raise
+
+            if reason is None:
+                self.breaker.record_success()
+                return response
+
+            delay = self.backoff * 2 ** attempt * random.random()
+            if requested_delay is not None:
+                delay += requested_delay
+            if reason == "secondary_rate_limit":
+                # GitHub answered, and throttles this token only, so other users keep calling it
+                self.breaker.record_success()
+                if access_token:
+                    self.rate_limits.throttle(access_token, resource, delay)
+            else:
+                self.breaker.record_failure()
+            if attempt >= self.max_retries or delay > self.max_wait or self.breaker.state != "closed":
+                if error is not None:
+                    raise error
+                if reason == "secondary_rate_limit":
+                    await response.aclose()
+                    raise GitHubRateLimitedError("GitHub is throttling calls with a secondary rate limit.", retry_after=delay, request=request)
+                return response
+
+            if response is not None:
+                await response.aclose()
+            UPSTREAM_RETRIES.labels(reason).inc()
+            await self._sleep(delay)
+            attempt += 1
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
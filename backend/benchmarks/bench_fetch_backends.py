@@ -0,0 +1,74 @@
+"""
+Compares the REST and GraphQL backends for fetching starred repositories by bytes transferred and parse time.
+
+The pages are the ones `benchmarks.fake_github` serves for a user with the given number of stars: REST pages
+carry the full repository objects GitHub returns, including the `owner` object, while GraphQL pages carry only
+the fields of `Repository`. Bytes are reported both as sent and gzip compressed, as GitHub compresses
+responses for clients that accept it. Parse time covers decoding the JSON of every page and projecting it
+with `app.serialization`, which is what the application does with each page it receives.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_fetch_backends [--stars 5000] [--per-page 100] [--rounds 10]
+"""
+
+import argparse
+import gzip
+import json
+import time
+from typing import Any, Callable, Dict, List
+from app.github import get_starred_connection
+from app.serialization import project_graphql_repositories, project_repositories
+from benchmarks.fake_github import starred_graphql_page, starred_page
+
+
+def rest_pages(stars: int, per_page: int) -> List[bytes]:
+    return [starred_page(stars, page, per_page) for page in range(1, (stars + per_page - 1) // per_page + 1)]
+
+
+def graphql_pages(stars: int, per_page: int) -> List[bytes]:
+    return [starred_graphql_page(stars, start, per_page) for start in range(0, stars, per_page)]
+
+
+def parse_rest(pages: List[bytes]) -> List[Dict[str, Any]]:
+    return [repo for page in pages for repo in project_repositories(json.loads(page))]
+
+
+def parse_graphql(pages: List[bytes]) -> List[Dict[str, Any]]:
+    return [repo for page in pages for repo in project_graphql_repositories(get_starred_connection(json.loads(page))["nodes"])]
+
+
+def measure(function: Callable[[List[bytes]], List[Dict[str, Any]]], pages: List[bytes], rounds: int) -> float:
+    """
+    Returns the best wall clock time of `rounds` runs of `function`, in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(pages)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, default=5000, help="Number of starred repositories.")
+    parser.add_argument("--per-page", type=int, default=100, help="Number of repositories per page.")
+    parser.add_argument("--rounds", type=int, default=10, help="Number of timed runs per backend.")
+    args = parser.parse_args()
+
+    backends = {
+        "rest": (rest_pages(args.stars, args.per_page), parse_rest),
+        "graphql": (graphql_pages(args.stars, args.per_page), parse_graphql),
+    }
+    assert parse_rest(backends["rest"][0]) == parse_graphql(backends["graphql"][0])
+
+    print(f"{args.stars} repositories, {args.per_page} per page, best of {args.rounds} runs")
+    print(f"  {'backend':<8} {'pages':>6} {'bytes':>12} {'gzip bytes':>12} {'parse ms':>10}")
+    for name, (pages, parse) in backends.items():
+        raw = sum(len(page) for page in pages)
+        compressed = sum(len(gzip.compress(page)) for page in pages)
+        print(f"  {name:<8} {len(pages):>6} {raw:>12,} {compressed:>12,} {measure(parse, pages, args.rounds):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
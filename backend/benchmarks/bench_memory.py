@@ -0,0 +1,106 @@
+"""
+Measures the memory held per cached repository by the dictionaries the cache used to keep and by the compact records.
+
+Synthetic users star repositories drawn from a shared set of distinct repositories, popular ones more often.
+The pages of every user are encoded as GitHub would send them and parsed, so that each user gets its own
+strings like in the application, then projected and kept the way the cache keeps them. The memory still
+allocated once the pages are gone is measured with `tracemalloc` and divided by the number of cached repositories.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_memory [--repos 1000000] [--users 1000] [--distinct 200000]
+"""
+
+import argparse
+import gc
+import json
+import random
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+from app.serialization import project_repositories, starred_repositories_response
+
+LICENSES = ["MIT License", "Apache License 2.0", "GNU General Public License v3.0", "BSD 3-Clause \"New\" or \"Revised\" License", None]
+TOPICS = ["python", "javascript", "rust", "go", "cli", "machine-learning", "react", "docker", "api", "database", "linux", "awesome"]
+
+
+def make_distinct_repos(count: int, seed: int) -> List[Dict[str, Any]]:
+    """
+    Builds `count` distinct GitHub repository objects with the fields the projection reads.
+    """
+    rng = random.Random(seed)
+    return [
+        {
+            "name": f"repo-{i}",
+            "html_url": f"https://github.com/owner-{i % 997}/repo-{i}",
+            "description": f"Description of repository {i} " + "x" * rng.randrange(0, 80) if rng.random() < 0.85 else None,
+            "license": {"name": license} if (license := rng.choice(LICENSES)) else None,
+            "topics": rng.sample(TOPICS, rng.randrange(0, 5)),
+        }
+        for i in range(count)
+    ]
+
+
+def dict_projection(repos: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The projection the cache used to keep: a dictionary per repository, holding the strings of the parsed page.
+    """
+    return [
+        {
+            "name": repo["name"],
+            "description": repo.get("description"),
+            "url": repo["html_url"],
+            "license": repo["license"]["name"] if repo.get("license") else None,
+            "topics": repo.get("topics") or [],
+        }
+        for repo in repos
+    ]
+
+
+def cached_bytes_per_repo(project: Callable[[List[Dict[str, Any]]], List[Any]], pages: List[bytes]) -> float:
+    """
+    Parses and projects the page of every user, keeps the results like the cache does and returns the bytes held per repository.
+    """
+    gc.collect()
+    tracemalloc.start()
+    cache: Dict[int, Dict[str, Any]] = {}
+    repositories = 0
+    for user_id, page in enumerate(pages):
+        cache[user_id] = starred_repositories_response(project(json.loads(page)))
+        repositories += cache[user_id]["count"]
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del cache
+    gc.collect()
+    return held / repositories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, default=1_000_000, help="Total number of cached repositories over all users.")
+    parser.add_argument("--users", type=int, default=1000, help="Number of users sharing the cached repositories equally.")
+    parser.add_argument("--distinct", type=int, default=200_000, help="Number of distinct repositories the users star.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the synthetic data.")
+    args = parser.parse_args()
+
+    distinct = make_distinct_repos(args.distinct, args.seed)
+    rng = random.Random(args.seed)
+    # Popularity follows a power law, so a few repositories are starred by many users
+    weights = [1 / (rank + 1) for rank in range(args.distinct)]
+    per_user = args.repos // args.users
+    pages = []
+    for _ in range(args.users):
+        starred = {id(repo): repo for repo in rng.choices(distinct, weights, k=per_user * 2)}
+        pages.append(json.dumps(list(starred.values())[:per_user]).encode())
+    del distinct
+    total = sum(len(json.loads(page)) for page in pages)
+
+    print(f"{total} cached repositories of {args.users} users, {args.distinct} distinct")
+    for label, project in [("dictionaries", dict_projection), ("records", project_repositories)]:
+        start = time.perf_counter()
+        bytes_per_repo = cached_bytes_per_repo(project, pages)
+        print(f"  {label:<13} {bytes_per_repo:7.1f} bytes per repository ({time.perf_counter() - start:5.1f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares the per-request latency of the pure ASGI middlewares with equivalent `BaseHTTPMiddleware` ones.
+
+Both stacks wrap the same endpoint with an error logging and a security headers middleware and are driven
+in process through `httpx.ASGITransport`, so the difference is the middleware overhead alone. The endpoint
+awaits a sleep standing for the GitHub call of a real endpoint. Without it a request through the pure ASGI
+stack would never yield to the event loop under `httpx.ASGITransport`, so requests would run one after the
+other instead of concurrently and their latencies would not be comparable with the other stack.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_middleware [--requests 5000] [--concurrency 50] [--delay 0.001]
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+import httpx
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+from app.middleware import ErrorLoggingMiddleware, SecurityHeadersMiddleware
+
+
+class BaseHTTPErrorLoggingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        try:
+            return await call_next(request)
+        except Exception as exc:
+            return JSONResponse(content={"detail": "An unexpected error occurred.", "error": str(exc)}, status_code=500)
+
+
+class BaseHTTPSecurityHeadersMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers['X-Frame-Options'] = 'DENY'
+        response.headers['X-Content-Type-Options'] = 'nosniff'
+        return response
+
+
+def make_app(security_headers_middleware, error_logging_middleware, delay: float) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        await asyncio.sleep(delay)
+        return {"ok": True}
+
+    app.add_middleware(security_headers_middleware)
+    app.add_middleware(error_logging_middleware)
+    return app
+
+
+async def drive(app: FastAPI, requests: int, concurrency: int) -> List[float]:
+    """
+    Sends `requests` requests to `app` with `concurrency` requests in flight and returns their latencies in seconds.
+    """
+    latencies: List[float] = []
+    queue = iter(range(requests))
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        async def worker():
+            for _ in queue:
+                start = time.perf_counter()
+                response = await client.get("/ping")
+                latencies.append(time.perf_counter() - start)
+                assert response.headers["X-Frame-Options"] == "DENY"
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], elapsed: float):
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"  {name:<18} {len(latencies) / elapsed:8.0f} req/s  "
+          f"mean {statistics.mean(latencies) * 1000:6.2f} ms  p50 {quantiles[49] * 1000:6.2f} ms  p99 {quantiles[98] * 1000:6.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000, help="Number of requests per stack.")
+    parser.add_argument("--concurrency", type=int, default=50, help="Number of requests in flight.")
+    parser.add_argument("--delay", type=float, default=0.001, help="Seconds the endpoint awaits.")
+    args = parser.parse_args()
+
+    stacks = {
+        "BaseHTTPMiddleware": make_app(BaseHTTPSecurityHeadersMiddleware, BaseHTTPErrorLoggingMiddleware, args.delay),
+        "pure ASGI": make_app(SecurityHeadersMiddleware, ErrorLoggingMiddleware, args.delay),
+    }
+    print(f"{args.requests} requests, concurrency {args.concurrency}, endpoint awaiting {args.delay * 1000:g} ms")
+    for name, app in stacks.items():
+        await drive(app, min(args.requests, 500), args.concurrency)  # warm up
+        start = time.perf_counter()
+        latencies = await drive(app, args.requests, args.concurrency)
+        report(name, latencies, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
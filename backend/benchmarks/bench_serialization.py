@@ -0,0 +1,92 @@
+"""
+Compares the validated and the fast serialization paths of the callback endpoint.
+
+The validated path is the one the endpoint used to take: a `Repository` model per repository, a
+`StarredRepositoriesResponse` around them and the revalidation and encoding FastAPI does for a
+`response_model`. The fast path projects the fields with `app.serialization` and encodes them directly.
+It is measured twice: with new repositories, whose records are created, and with repositories whose
+records are already held by a cached list, as when a list is refreshed.
+
+Usage (from the backend directory):
+    python -m benchmarks.bench_serialization [--repos 5000] [--rounds 20]
+"""
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+from app.schemas import Repository, StarredRepositoriesResponse
+from app.serialization import dumps, orjson, project_repositories, starred_repositories_response
+
+MOCK_DATA_PATH = Path(__file__).resolve().parent.parent / "tests" / "mock_test_data.json"
+
+
+def make_repos(count: int) -> List[Dict[str, Any]]:
+    """
+    Builds `count` GitHub repository objects from the repositories of the test data.
+    """
+    with open(MOCK_DATA_PATH) as file:
+        templates = json.load(file)["successful_response"]
+    return [
+        dict(templates[i % len(templates)], name=f"repo-{i}", html_url=f"https://github.com/owner/repo-{i}")
+        for i in range(count)
+    ]
+
+
+def validated_path(repos: List[Dict[str, Any]]) -> bytes:
+    repositories = [
+        Repository(
+            name=repo['name'],
+            description=repo.get('description'),
+            url=repo['html_url'],
+            license=repo['license']['name'] if repo.get('license') else None,
+            topics=repo.get('topics', [])
+        ) for repo in repos
+    ]
+    response = StarredRepositoriesResponse(count=len(repositories), repositories=repositories)
+    # What FastAPI does with a returned model when `response_model` is set
+    validated = StarredRepositoriesResponse.model_validate(response.model_dump())
+    return json.dumps(validated.model_dump(mode="json"), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(repos: List[Dict[str, Any]]) -> bytes:
+    return dumps(starred_repositories_response(project_repositories(repos)))
+
+
+def measure(function: Callable[[List[Dict[str, Any]]], bytes], repos: List[Dict[str, Any]], rounds: int) -> float:
+    """
+    Returns the best wall clock time of `rounds` runs of `function`, in milliseconds.
+    """
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        function(repos)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repos", type=int, default=5000, help="Number of repositories per response.")
+    parser.add_argument("--rounds", type=int, default=20, help="Number of timed runs per path.")
+    args = parser.parse_args()
+
+    repos = make_repos(args.repos)
+    validated_response, fast_response = json.loads(validated_path(repos)), json.loads(fast_path(repos))
+    # The validated path also writes the pagination fields of the model, as nulls
+    assert {key: validated_response[key] for key in fast_response} == fast_response
+
+    validated = measure(validated_path, repos, args.rounds)
+    fast = measure(fast_path, repos, args.rounds)
+    cached = project_repositories(repos)
+    pooled = measure(fast_path, repos, args.rounds)
+    del cached
+    print(f"{args.repos} repositories, best of {args.rounds} runs, encoder: {'orjson' if orjson else 'json'}")
+    print(f"  validated path:          {validated:8.2f} ms")
+    print(f"  fast path, new records:  {fast:8.2f} ms ({validated / fast:.1f}x faster)")
+    print(f"  fast path, held records: {pooled:8.2f} ms ({validated / pooled:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
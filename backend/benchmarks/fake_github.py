@@ -0,0 +1,197 @@
+"""
+A fake GitHub serving the endpoints Star Retriever calls, for load tests and benchmarks.
+
+Synthetic users are encoded in the OAuth code: the code `<user id>-<stars>`, for example `17-5000`,
+logs in user 17 who has starred 5000 repositories. The code is handed back as the access token, so
+every later request knows which user it is for without any state on the server.
+
+Served endpoints:
+    POST /login/oauth/access_token: Exchanges a code for an access token.
+    GET /user: Returns the id of the user.
+    GET /user/starred: Returns a page of starred repositories with a GitHub style `Link` header and
+                       an `ETag`, answering 304 to a matching `If-None-Match`. With the
+                       `application/vnd.github.star+json` media type, every repository is wrapped with
+                       its `starred_at` time, repository 0 being the most recent star.
+    POST /graphql: Answers the starred repositories query of `app.github` with the same repositories,
+                   paginated by cursor.
+
+Every response is delayed by the configured latency to imitate the round-trip to GitHub.
+
+Usage (from the backend directory):
+    python -m benchmarks.fake_github [--port 9100] [--latency 0.05]
+"""
+
+import argparse
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+from urllib.parse import parse_qs
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+MOCK_DATA_PATH = Path(__file__).resolve().parent.parent / "tests" / "mock_test_data.json"
+STARRED_AT_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@lru_cache(maxsize=1)
+def repository_templates() -> List[Dict[str, Any]]:
+    """
+    Returns the GitHub repository objects of the test data, used as templates for synthetic repositories.
+    """
+    with open(MOCK_DATA_PATH) as file:
+        return json.load(file)["successful_response"]
+
+
+def make_repository(index: int) -> Dict[str, Any]:
+    """
+    Builds the synthetic repository number `index` in the shape GitHub returns it.
+    """
+    templates = repository_templates()
+    name = f"repo-{index}"
+    return dict(
+        templates[index % len(templates)],
+        id=index,
+        name=name,
+        full_name=f"owner/{name}",
+        html_url=f"https://github.com/owner/{name}",
+        description=f"Synthetic repository number {index}",
+        topics=[f"topic-{index % 50}", f"topic-{index % 7}"],
+    )
+
+
+def starred_at(index: int) -> str:
+    """
+    Returns the time the synthetic repository number `index` was starred, one minute before repository `index - 1`.
+    """
+    return (STARRED_AT_EPOCH - timedelta(minutes=index)).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@lru_cache(maxsize=1024)
+def starred_page(stars: int, page: int, per_page: int, with_starred_at: bool = False) -> bytes:
+    """
+    Returns the encoded page of starred repositories of a user with `stars` stars.
+    """
+    start = (page - 1) * per_page
+    indices = range(start, min(start + per_page, stars))
+    if with_starred_at:
+        return json.dumps([{"starred_at": starred_at(index), "repo": make_repository(index)} for index in indices]).encode()
+    return json.dumps([make_repository(index) for index in indices]).encode()
+
+
+def make_repository_node(index: int) -> Dict[str, Any]:
+    """
+    Builds the synthetic repository number `index` in the shape the GraphQL API returns it.
+    """
+    repository = make_repository(index)
+    license = repository.get("license")
+    return {
+        "name": repository["name"],
+        "description": repository["description"],
+        "url": repository["html_url"],
+        "licenseInfo": {"name": license["name"]} if license else None,
+        "repositoryTopics": {"nodes": [{"topic": {"name": topic}} for topic in repository["topics"]]},
+    }
+
+
+@lru_cache(maxsize=1024)
+def starred_graphql_page(stars: int, start: int, per_page: int) -> bytes:
+    """
+    Returns the encoded GraphQL response with the starred repositories of a user with `stars` stars from index `start` on.
+    """
+    end = min(start + per_page, stars)
+    return json.dumps({"data": {"viewer": {"starredRepositories": {
+        "pageInfo": {"hasNextPage": end < stars, "endCursor": str(end) if end > start else None},
+        "nodes": [make_repository_node(index) for index in range(start, end)],
+    }}}}).encode()
+
+
+def parse_token(request: Request) -> Tuple[int, int]:
+    """
+    Reads the user id and star count from the access token in the `Authorization` header.
+    """
+    token = request.headers.get("Authorization", "").removeprefix("token ").removeprefix("bearer ").removeprefix("Bearer ")
+    user_id, _, stars = token.partition("-")
+    return int(user_id), int(stars or 0)
+
+
+def link_header(request: Request, page: int, last_page: int) -> str:
+    """
+    Builds the `Link` header GitHub sends with a page of a paginated list.
+    """
+    links = {"first": 1, "prev": page - 1, "next": page + 1, "last": last_page}
+    return ", ".join(
+        f'<{request.url.include_query_params(page=target)}>; rel="{rel}"'
+        for rel, target in links.items()
+        if 1 <= target <= last_page and target != page
+    )
+
+
+def create_fake_github(latency: float = 0.0) -> Starlette:
+    """
+    Creates the fake GitHub application.
+
+    Args:
+        latency: Seconds every response is delayed by.
+
+    Returns:
+        The ASGI application.
+    """
+    async def access_token(request: Request) -> Response:
+        await asyncio.sleep(latency)
+        code = parse_qs((await request.body()).decode()).get("code", [""])[0]
+        return JSONResponse({"access_token": code, "token_type": "bearer", "scope": "read:user,user:email"})
+
+    async def user(request: Request) -> Response:
+        await asyncio.sleep(latency)
+        user_id, _ = parse_token(request)
+        return JSONResponse({"id": user_id, "login": f"user-{user_id}"})
+
+    async def starred(request: Request) -> Response:
+        await asyncio.sleep(latency)
+        _, stars = parse_token(request)
+        per_page = min(int(request.query_params.get("per_page", 30)), 100)
+        page = max(int(request.query_params.get("page", 1)), 1)
+        last_page = max((stars + per_page - 1) // per_page, 1)
+        with_starred_at = request.headers.get("Accept") == "application/vnd.github.star+json"
+        etag = f'W/"{stars}-{per_page}-{page}{"-star" if with_starred_at else ""}"'
+        headers = {"ETag": etag}
+        if last_page > 1:
+            headers["Link"] = link_header(request, page, last_page)
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=304, headers=headers)
+        return Response(starred_page(stars, page, per_page, with_starred_at), media_type="application/json", headers=headers)
+
+    async def graphql(request: Request) -> Response:
+        await asyncio.sleep(latency)
+        _, stars = parse_token(request)
+        variables = (await request.json()).get("variables") or {}
+        per_page = min(int(variables.get("first", 100)), 100)
+        start = int(variables.get("after") or 0)
+        return Response(starred_graphql_page(stars, start, per_page), media_type="application/json")
+
+    return Starlette(routes=[
+        Route("/login/oauth/access_token", access_token, methods=["POST"]),
+        Route("/user", user),
+        Route("/user/starred", starred),
+        Route("/graphql", graphql, methods=["POST"]),
+    ])
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every response is delayed by.")
+    args = parser.parse_args()
+    uvicorn.run(create_fake_github(args.latency), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Load tests the callback endpoint against a local fake GitHub.
+
+The fake GitHub of `benchmarks.fake_github` and the application are started as separate Uvicorn processes,
+with the application pointed at the fake through `GITHUB_OAUTH_URL` and `GITHUB_API_URL` and with rate
+limiting disabled. For every star count, the callback is then driven with the given number of requests and
+concurrency, and throughput, latency percentiles and the peak RSS of the application process are reported.
+
+By default every request logs in a different synthetic user, which measures the uncached fetch path.
+`--users` reuses a smaller pool of users so that repeat logins are served from the cache.
+
+Usage (from the backend directory):
+    python -m benchmarks.load_test [--stars 10 100 1000 10000] [--requests 200] [--concurrency 20]
+                                   [--latency 0.05] [--users N] [--query stream=ndjson] [--backend graphql]
+                                   [--output results.json] [--verbose]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process serving {url} exited with status {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up in {timeout} seconds")
+
+
+@contextmanager
+def serve(args: List[str], url: str, env: Optional[Dict[str, str]] = None, quiet: bool = True) -> Iterator[subprocess.Popen]:
+    """
+    Runs a server process from the backend directory until the block exits, discarding its output if `quiet`.
+    """
+    output = subprocess.DEVNULL if quiet else None
+    process = subprocess.Popen([sys.executable, *args], cwd=BACKEND_DIR, env={**os.environ, **(env or {})}, stdout=output, stderr=output)
+    try:
+        wait_until_up(url, process)
+        yield process
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def peak_rss_mb(pid: int) -> Optional[float]:
+    """
+    Returns the peak resident set size of a process in MiB, or None where `/proc` is not available.
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def drive(base_url: str, stars: int, requests: int, concurrency: int, users: int, query: str, user_offset: int) -> Dict[str, Any]:
+    """
+    Sends `requests` callback requests for users with `stars` stars, `concurrency` at a time.
+
+    Returns:
+        The throughput, latency percentiles and status code counts of the run.
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    queue = iter(range(requests))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+        async def worker():
+            for i in queue:
+                code = f"{user_offset + i % users}-{stars}"
+                start = time.perf_counter()
+                response = await client.get(f"/api/callback?code={code}{'&' + query if query else ''}")
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        "stars": stars,
+        "requests": requests,
+        "concurrency": concurrency,
+        "throughput": requests / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+        "statuses": statuses,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stars", type=int, nargs="+", default=[10, 100, 1000, 10000], help="Star counts of the synthetic users.")
+    parser.add_argument("--requests", type=int, default=200, help="Number of requests per star count.")
+    parser.add_argument("--concurrency", type=int, default=20, help="Number of requests in flight.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds the fake GitHub delays every response by.")
+    parser.add_argument("--users", type=int, default=0, help="Number of distinct users per star count. Defaults to one per request.")
+    parser.add_argument("--query", default="", help="Extra query string for the callback, for example stream=ndjson.")
+    parser.add_argument("--backend", choices=["rest", "graphql"], default="rest", help="GitHub API the application fetches the starred repositories with.")
+    parser.add_argument("--output", help="Write the results as JSON to this file, for comparing runs.")
+    parser.add_argument("--verbose", action="store_true", help="Show the logs of the application and the fake GitHub.")
+    args = parser.parse_args()
+
+    github_port, app_port = free_port(), free_port()
+    github_url, app_url = f"http://127.0.0.1:{github_port}", f"http://127.0.0.1:{app_port}"
+    app_env = {
+        "CLIENT_ID": "load-test",
+        "CLIENT_SECRET": "load-test",
+        "ENVIRONMENT": "prod",
+        "GITHUB_OAUTH_URL": github_url,
+        "GITHUB_API_URL": github_url,
+        "RATELIMIT_ENABLED": "false",
+        "RATE_LIMIT_STORAGE_URI": "memory://",
+        "GITHUB_FETCH_BACKEND": args.backend,
+    }
+
+    results = []
+    with serve(["-m", "benchmarks.fake_github", "--port", str(github_port), "--latency", str(args.latency)], f"{github_url}/user", quiet=not args.verbose), \
+         serve(["-m", "uvicorn", "app.server:create_app", "--factory", "--port", str(app_port), "--log-level", "warning"], f"{app_url}/favicon.ico", app_env, quiet=not args.verbose) as app_process:
+        print(f"{args.requests} requests per star count, concurrency {args.concurrency}, GitHub latency {args.latency * 1000:.0f} ms, {args.backend} backend")
+        for index, stars in enumerate(args.stars):
+            result = asyncio.run(drive(app_url, stars, args.requests, args.concurrency, args.users or args.requests, args.query, index * args.requests))
+            result["peak_rss_mb"] = peak_rss_mb(app_process.pid)
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:7.1f} MiB" if result["peak_rss_mb"] is not None else "    n/a"
+            print(f"  {stars:>6} stars: {result['throughput']:8.1f} req/s  p50 {result['p50_ms']:8.1f} ms  "
+                  f"p95 {result['p95_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  peak RSS {rss}  statuses {result['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,6 @@
+import os
+
+# Keep the rate limit counters and sessions of the tests in databases private to the test process,
+# so that they do not leak between test runs through the default database files.
+os.environ.setdefault('RATE_LIMIT_STORAGE_URI', 'sqlite:///:memory:')
+os.environ.setdefault('SESSION_STORE_PATH', ':memory:')
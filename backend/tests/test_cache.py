@@ -0,0 +1,129 @@
+import asyncio
+from app.cache import CachedPage, ETagStore, StarredReposCache
+
+class FakeClock:
+    """
+    A manually advanced clock for controlling cache expiry in tests.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_cache(clock, **kwargs):
+    options = dict(ttl=10, stale_ttl=10, max_entries=10, max_size=100, sizeof=len, clock=clock)
+    options.update(kwargs)
+    return StarredReposCache(**options)
+
+def test_evicts_least_recently_used_entries():
+    """
+    Test that the least recently used entry is evicted when the size bound is exceeded.
+    """
+    cache = make_cache(FakeClock(), max_size=5)
+    cache.set("a", "aa")
+    cache.set("b", "bb")
+    cache.get("a")
+    cache.set("c", "cc")
+
+    assert cache.get("a") == "aa"
+    assert cache.get("b") is None
+    assert cache.get("c") == "cc"
+    assert cache.evictions == 1
+
+def test_serves_stale_value_while_refreshing():
+    """
+    Test that an expired entry is served at once while a background refresh replaces it.
+    """
+    clock = FakeClock()
+    cache = make_cache(clock)
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        return f"v{len(loads)}"
+
+    async def scenario():
+        assert await cache.get_or_load("user", loader) == "v1"
+        clock.now = 15
+        assert await cache.get_or_load("user", loader) == "v1"
+        await asyncio.sleep(0)
+        assert await cache.get_or_load("user", loader) == "v2"
+        clock.now = 100
+        assert await cache.get_or_load("user", loader) == "v3"
+
+    asyncio.run(scenario())
+    assert cache.stats()["misses"] == 2
+    assert cache.stats()["stale_hits"] == 1
+    assert cache.stats()["hits"] == 1
+
+def test_concurrent_misses_share_one_load():
+    """
+    Test that concurrent misses of a key share a single load, and that a failed load is not shared with later callers.
+    """
+    cache = make_cache(FakeClock())
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        if len(loads) == 1:
+            raise RuntimeError("upstream failed")
+        return "value"
+
+    async def scenario():
+        failed = await asyncio.gather(*[cache.get_or_load("user", loader) for _ in range(3)], return_exceptions=True)
+        loaded = await asyncio.gather(*[cache.get_or_load("user", loader) for _ in range(3)])
+        return failed, loaded
+
+    failed, loaded = asyncio.run(scenario())
+    assert [str(error) for error in failed] == ["upstream failed"] * 3
+    assert loaded == ["value"] * 3
+    assert len(loads) == 2
+    assert cache.stats()["coalesced"] == 4
+
+def test_cancelled_caller_does_not_cancel_shared_load():
+    """
+    Test that cancelling the caller that started a load leaves the load running for the other callers.
+    """
+    cache = make_cache(FakeClock())
+    loads = []
+
+    async def loader():
+        loads.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    async def scenario():
+        leader = asyncio.create_task(cache.get_or_load("user", loader))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(cache.get_or_load("user", loader))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(scenario()) == ("value", True)
+    assert len(loads) == 1
+    assert cache.get("user") == "value"
+
+def test_etag_store_is_bounded_by_the_repositories_on_its_pages():
+    """
+    Test that the pages of the least recently used users are evicted once the pages hold too many repositories,
+    counting pages as they are stored and replaced, and no longer counting the pages of an evicted user.
+    """
+    store = ETagStore(max_users=10, max_size=5)
+    first = store.pages(1)
+    first[1] = CachedPage(etag='"a"', last_page=2, items=[{}, {}])
+    first[2] = CachedPage(etag='"b"', last_page=2, items=[{}])
+    second = store.pages(2)
+    second[1] = CachedPage(etag='"c"', last_page=1, items=[{}, {}])
+    first[1] = CachedPage(etag='"d"', last_page=2, items=[{}])
+    assert store.size == 4
+
+    store.pages(1)
+    second[1] = CachedPage(etag='"e"', last_page=1, items=[{}, {}, {}, {}])
+    assert (len(store), store.size, store.evictions) == (1, 2, 1)
+    del second[1]
+    assert store.size == 2
+    assert store.pages(1) is first
+    assert store.pages(2) is not second
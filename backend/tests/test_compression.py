@@ -0,0 +1,73 @@
+import asyncio
+import gzip
+from app.compression import ENCODINGS, BodyStore, EncodedBody, negotiate_encoding
+
+CONTENT = {"count": 1, "repositories": [{"name": "repo", "description": "x" * 2000, "url": "https://github.com/owner/repo", "license": None, "topics": []}]}
+
+def test_negotiates_encoding_by_quality():
+    """
+    Test that the accepted encoding with the highest quality is chosen, and that refused or unknown encodings are not.
+    """
+    preferred = ENCODINGS[0]
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("gzip;q=0.5, br;q=1.0") == ("br" if "br" in ENCODINGS else "gzip")
+    assert negotiate_encoding("*") == preferred
+    assert negotiate_encoding("*, gzip;q=0") == ("br" if "br" in ENCODINGS else None)
+    assert negotiate_encoding("deflate, identity") is None
+    assert negotiate_encoding("") is None
+
+def test_compresses_once_and_matches_etags():
+    """
+    Test that a variant is compressed once, also when the compression runs on a thread, and that every variant's ETag matches.
+    """
+    encoded = EncodedBody(CONTENT)
+
+    async def scenario():
+        first, second = await asyncio.gather(encoded.encoded("gzip", offload_min_size=0), encoded.encoded("gzip", offload_min_size=0))
+        return first, second, await encoded.encoded("gzip", offload_min_size=0)
+
+    first, second, third = asyncio.run(scenario())
+    assert first is second is third
+    assert gzip.decompress(first) == encoded.body
+    assert encoded.size() == len(encoded.body) + len(first)
+    assert encoded.etag("gzip") != encoded.etag(None)
+    assert encoded.matches(f'"other", {encoded.etag("gzip")}')
+    assert encoded.matches(f'W/{encoded.etag(None)}')
+    assert not encoded.matches('"other"')
+
+def test_body_store_encodes_each_list_once():
+    """
+    Test that the body of a user is reused until the list of the user changes, including for an equal new list.
+    """
+    store = BodyStore(max_users=1, max_bytes=1024 * 1024)
+    starred_repos = dict(CONTENT)
+
+    first = store.get(1, starred_repos)
+    assert store.get(1, starred_repos) is first
+    assert store.get(1, dict(CONTENT)) is first
+    replaced = store.get(1, {**CONTENT, "count": 0, "repositories": []})
+    assert replaced is not first and replaced.etag(None) != first.etag(None)
+    store.get(2, starred_repos)
+    assert len(store) == 1
+
+def test_body_store_evicts_by_bytes_held():
+    """
+    Test that the store evicts the least recently used users once the bodies and their compressed variants exceed the byte budget.
+    """
+    body_size = len(EncodedBody(CONTENT).body)
+    store = BodyStore(max_users=10, max_bytes=2 * body_size)
+
+    async def scenario():
+        first = store.get(1, dict(CONTENT))
+        store.get(2, dict(CONTENT))
+        assert len(store) == 2
+        # The compressed variant of the most recent user pushes the store over its budget
+        compressed = await store.get(2, dict(CONTENT)).encoded("gzip", offload_min_size=0)
+        await asyncio.sleep(0)
+        return first, compressed
+
+    first, compressed = asyncio.run(scenario())
+    assert len(store) == 1
+    assert store.size == body_size + len(compressed)
+    assert store.evictions == 1
+    assert store.get(1, dict(CONTENT)) is not first
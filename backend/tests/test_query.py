@@ -0,0 +1,78 @@
+import pytest
+from app.query import IndexStore, RepositoryIndex, RepositoryQuery
+
+def repository(name, topics=(), license=None, description=None):
+    return {"name": name, "description": description, "url": f"https://github.com/owner/{name}", "license": license, "topics": list(topics)}
+
+REPOSITORIES = [
+    repository("delta", ["python", "cli"], "MIT License", "Command line tool"),
+    repository("Alpha", ["python"], "MIT License", "Web framework"),
+    repository("charlie", ["rust", "cli"], "Apache License 2.0"),
+    repository("bravo", ["python", "cli"], None, "Another command line tool"),
+]
+
+def names(result):
+    return [repo["name"] for repo in result.repositories]
+
+def test_filters_intersect_topic_and_license_indexes():
+    """
+    Test that topics and license are combined, case-insensitively, and narrowed further by the substring filter.
+    """
+    index = RepositoryIndex(REPOSITORIES)
+
+    assert names(index.search(RepositoryQuery(topics=["python", "CLI"]))) == ["delta", "bravo"]
+    assert names(index.search(RepositoryQuery(topics=["python"], license="mit license"))) == ["delta", "Alpha"]
+    assert names(index.search(RepositoryQuery(topics=["cli"], q="COMMAND"))) == ["delta", "bravo"]
+    assert names(index.search(RepositoryQuery(q="alp"))) == ["Alpha"]
+    assert index.search(RepositoryQuery(topics=["go"])).total == 0
+
+def test_paginates_with_cursors_in_every_sort_order():
+    """
+    Test that following the cursors returns every matching repository once, in the requested order.
+    """
+    index = RepositoryIndex(REPOSITORIES)
+    expected = {
+        "starred": ["delta", "Alpha", "charlie", "bravo"],
+        "-starred": ["bravo", "charlie", "Alpha", "delta"],
+        "name": ["Alpha", "bravo", "charlie", "delta"],
+        "-name": ["delta", "charlie", "bravo", "Alpha"],
+    }
+    for sort, order in expected.items():
+        seen, cursor = [], None
+        while True:
+            result = index.search(RepositoryQuery(sort=sort, limit=3, cursor=cursor))
+            assert result.total == 4
+            seen += names(result)
+            cursor = result.next_cursor
+            if cursor is None:
+                break
+        assert seen == order
+
+def test_rejects_cursor_of_another_sort_order():
+    """
+    Test that a cursor is only accepted with the sort order it was issued for.
+    """
+    index = RepositoryIndex(REPOSITORIES)
+    cursor = index.search(RepositoryQuery(sort="name", limit=1)).next_cursor
+
+    with pytest.raises(ValueError):
+        index.search(RepositoryQuery(sort="starred", limit=1, cursor=cursor))
+    with pytest.raises(ValueError):
+        index.search(RepositoryQuery(cursor="not a cursor"))
+
+def test_index_store_rebuilds_only_for_new_lists():
+    """
+    Test that the index of a user is reused until the list of the user changes, including for an equal new list.
+    """
+    store = IndexStore(max_users=1)
+    repositories = list(REPOSITORIES)
+
+    first = store.get(1, repositories)
+    assert store.get(1, repositories) is first
+    refetched = list(REPOSITORIES)
+    assert store.get(1, refetched) is first
+    assert first.repositories is refetched
+    assert store.get(1, REPOSITORIES[1:]) is not first
+    store.get(2, repositories)
+    assert len(store) == 1
+    assert store.builds == 3
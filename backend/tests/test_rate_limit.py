@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+import pytest
+from fastapi import Request
+from limits import parse
+from limits.strategies import SlidingWindowCounterRateLimiter
+from limits.storage import storage_from_string
+from app.metrics import RATE_LIMIT_FAILED_OPEN
+from app.rate_limit import RateLimiter, RateLimitExceeded, SQLiteStorage
+
+def test_limit_is_shared_between_storages_of_the_same_database(tmp_path):
+    """
+    Test that two storages on the same database file, as in two worker processes, enforce one limit together.
+    """
+    uri = f"sqlite:///{tmp_path / 'limits.sqlite3'}"
+    workers = [SlidingWindowCounterRateLimiter(storage_from_string(uri)) for _ in range(2)]
+    limit = parse("5/minute")
+
+    results = [workers[i % 2].hit(limit, "127.0.0.1") for i in range(8)]
+
+    assert results == [True] * 5 + [False] * 3
+    assert isinstance(workers[0].storage, SQLiteStorage)
+    assert workers[0].storage.stats()["checks"] + workers[1].storage.stats()["checks"] == 8
+
+def test_expired_keys_are_purged(tmp_path):
+    """
+    Test that counters of idle keys are removed once they have expired.
+    """
+    storage = SQLiteStorage(f"sqlite:///{tmp_path / 'limits.sqlite3'}", purge_interval=0)
+    storage.incr("idle", expiry=0)
+    storage.incr("active", expiry=60)
+
+    keys = [row[0] for row in storage.connection.execute("SELECT key FROM rate_limits")]
+
+    assert keys == ["active"]
+    assert storage.purged == 1
+
+def test_checks_fail_open_off_the_event_loop_while_the_database_is_locked(tmp_path):
+    """
+    Test that a check waiting for the write lock of another process leaves the event loop running, and lets the
+    request through and counts it once the lock is not acquired in time.
+    """
+    path = tmp_path / 'limits.sqlite3'
+    limiter = RateLimiter(f"sqlite:///{path}", "sliding-window-counter", timeout=0.2)
+    check = limiter.limit("1/minute")
+    request = Request({"type": "http", "method": "GET", "path": "/api/starred", "query_string": b"", "headers": [], "client": ("127.0.0.1", 50000), "server": ("testserver", 80), "scheme": "http"})
+    failed_open = RATE_LIMIT_FAILED_OPEN.labels().value
+
+    async def scenario():
+        await check(request)
+        other_process = sqlite3.connect(path, isolation_level=None)
+        other_process.execute("BEGIN IMMEDIATE")
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await check(request)
+        ticker.cancel()
+        other_process.execute("ROLLBACK")
+        with pytest.raises(RateLimitExceeded) as exceeded:
+            await check(request)
+        return ticks, exceeded.value
+
+    ticks, exceeded = asyncio.run(scenario())
+
+    assert ticks >= 5
+    assert RATE_LIMIT_FAILED_OPEN.labels().value == failed_open + 1
+    assert 0 < exceeded.retry_after <= 60
@@ -0,0 +1,54 @@
+import gc
+import json
+from app import serialization
+from app.records import RepositoryPool, RepositoryRecord
+
+def test_pool_shares_equal_repositories():
+    """
+    Test that equal repositories share one record with interned strings, and that a changed repository gets a new one.
+    """
+    pool = RepositoryPool()
+    url = "https://github.com/owner/repo"
+    first = pool.get("repo", "A repository", url, "MIT License", ["py" + "thon"])
+    second = pool.get("repo", "A repository", url, "".join(["MIT ", "License"]), ["python"])
+    changed = pool.get("repo", "A renamed repository", url, "MIT License", ["python"])
+
+    assert first is second
+    assert second.topics == ("python",)
+    assert changed is not first
+    assert pool.get("repo", "A renamed repository", url, "MIT License", ["python"]) is changed
+    other = pool.get("other", None, "https://github.com/owner/other", "".join(["MIT ", "License"]), ["".join(["pyt", "hon"])])
+    assert other.license is first.license
+    assert other.topics[0] is first.topics[0]
+    assert pool.get("empty", None, "https://github.com/owner/empty", None, []).topics == ()
+
+def test_pool_frees_unused_records():
+    """
+    Test that the pool does not keep records alive once no list holds them.
+    """
+    pool = RepositoryPool()
+    record = pool.get("repo", None, "https://github.com/owner/repo", None, [])
+    assert len(pool) == 1
+
+    del record
+    gc.collect()
+    assert len(pool) == 0
+
+def test_records_read_and_encode_like_dictionaries(monkeypatch):
+    """
+    Test that a record reads, compares and encodes as the dictionary of the `Repository` schema, in lists and nested deeper, with and without orjson.
+    """
+    as_dict = {"name": "repo", "description": None, "url": "https://github.com/owner/repo", "license": "MIT License", "topics": ["cli"]}
+    record = RepositoryRecord("repo", None, "https://github.com/owner/repo", "MIT License", ("cli",))
+
+    assert record["license"] == "MIT License"
+    assert record.get("stars") is None
+    assert {**record, "score": 1.0} == {**as_dict, "topics": ("cli",), "score": 1.0}
+    assert record == as_dict
+    assert [record] == [as_dict]
+    nested = {"count": 1, "repositories": [record], "results": [{"repository": record, "score": 1.0}]}
+    expected = {"count": 1, "repositories": [as_dict], "results": [{"repository": as_dict, "score": 1.0}]}
+    assert json.loads(serialization.dumps(nested)) == expected
+    assert json.loads(serialization.dumps(record)) == as_dict
+    monkeypatch.setattr(serialization, "orjson", None)
+    assert json.loads(serialization.dumps(nested)) == expected
@@ -0,0 +1,20 @@
+import os
+
+# `app.run` creates the application on import, which needs the OAuth credentials
+os.environ.setdefault('CLIENT_ID', '12345')
+os.environ.setdefault('CLIENT_SECRET', '67890')
+
+from app.config import Settings
+from app.run import production_server_options
+
+def test_production_server_options():
+    """
+    Test that the production server options come from the settings and default to one worker per CPU.
+    """
+    settings = Settings(client_id="id", client_secret="secret", server_max_requests=1000, server_backlog=512)
+    options = production_server_options(settings)
+
+    assert options["workers"] == len(os.sched_getaffinity(0))
+    assert options["limit_max_requests"] == 1000
+    assert options["backlog"] == 512
+    assert production_server_options(Settings(client_id="id", client_secret="secret", server_workers=3))["workers"] == 3
@@ -0,0 +1,118 @@
+import asyncio
+import httpx
+from app.cache import StarredReposCache
+from app.scheduler import CallBudget, RefreshScheduler
+from app.upstream import CircuitBreaker, RateLimitTracker
+
+class FakeClock:
+    """
+    A manually advanced clock for controlling expiry, activity and the call budget in tests.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def starred(count):
+    return {"count": count, "repositories": [{}] * count}
+
+def make_scheduler(clock, load, **kwargs):
+    cache = StarredReposCache(ttl=100, stale_ttl=100, max_entries=100, max_size=10_000, clock=clock)
+    rate_limits = RateLimitTracker()
+    options = dict(
+        calls_per_minute=3, per_page=100, refresh_ahead=10, idle_after=1000, min_remaining=0.2, max_users=100, clock=clock,
+    )
+    options.update(kwargs)
+    return RefreshScheduler(cache, load, rate_limits, CircuitBreaker(5, 30, clock=clock), **options)
+
+def test_call_budget_refills_over_a_minute():
+    """
+    Test that the budget holds a minute's worth of calls, refills continuously and lets a large refresh start when full.
+    """
+    clock = FakeClock()
+    budget = CallBudget(60, clock=clock)
+
+    assert budget.take(50)
+    assert not budget.take(20)
+    clock.now += 10
+    assert budget.take(20)
+    clock.now += 60
+    assert budget.take(100)
+    assert budget.available() == -40
+
+def test_refreshes_most_active_due_users_within_budget():
+    """
+    Test that only active users about to expire are refreshed, most active first, and that the budget and low quotas hold refreshes back.
+    """
+    clock = FakeClock()
+    loads = []
+
+    async def load(user_id, access_token):
+        loads.append((user_id, access_token))
+        return starred(1)
+
+    async def scenario():
+        scheduler = make_scheduler(clock, load)
+        for user_id, requests in [(1, 1), (2, 3), (3, 2), (4, 1), (5, 1)]:
+            scheduler.cache.set(user_id, starred(150 if user_id == 1 else 1))
+            for _ in range(requests):
+                scheduler.touch(user_id, f"token-{user_id}")
+        scheduler.cache.set(6, starred(1))
+        scheduler.rate_limits.update("token-4", "core", httpx.Response(200, headers={"X-RateLimit-Limit": "5000", "X-RateLimit-Remaining": "100", "X-RateLimit-Reset": "9999999999"}))
+        clock.now = 50
+        scheduler.touch(5, "token-5")
+        scheduler.cache.set(5, starred(1))
+
+        assert scheduler.run_once() == []
+        clock.now = 95
+        assert scheduler.due() == [2, 3, 1, 4]
+        started = scheduler.run_once()
+        await asyncio.gather(*scheduler._refreshes)
+        # A minute later the budget has refilled, and user 1 costs two calls
+        clock.now = 155
+        scheduler.cache.set(5, starred(1))
+        later = scheduler.due()
+        started_later = scheduler.run_once()
+        await asyncio.gather(*scheduler._refreshes)
+        await scheduler.aclose()
+        return started, later, started_later
+
+    started, later, started_later = asyncio.run(scenario())
+    assert started == [2, 3]
+    assert later == [1, 4]
+    # The quota of the token of user 4 is below the fifth that background refreshes leave alone
+    assert started_later == [1]
+    assert loads == [(2, "token-2"), (3, "token-3"), (1, "token-1")]
+
+def test_forgets_idle_users_and_stops_cleanly():
+    """
+    Test that idle users are no longer refreshed, and that closing the scheduler stops its loop and cancels refreshes in flight.
+    """
+    clock = FakeClock()
+    started = asyncio.Event()
+
+    async def load(user_id, access_token):
+        started.set()
+        await asyncio.sleep(60)
+
+    async def scenario():
+        scheduler = make_scheduler(clock, load, interval=0.01)
+        scheduler.cache.set(1, starred(1))
+        scheduler.cache.set(2, starred(1))
+        scheduler.touch(1, "token-1")
+        clock.now = 995
+        scheduler.touch(2, "token-2")
+        clock.now = 1001
+        assert scheduler.due() == [2]
+        assert len(scheduler) == 1
+
+        scheduler.start()
+        await asyncio.wait_for(started.wait(), 1)
+        refreshes = list(scheduler._refreshes)
+        await scheduler.aclose()
+        return refreshes
+
+    refreshes = asyncio.run(scenario())
+    assert len(refreshes) == 1
+    assert refreshes[0].cancelled()
@@ -0,0 +1,73 @@
+from app.search import SearchIndex, SearchIndexStore, tokenize
+
+def repository(name, topics=(), description=None):
+    return {"name": name, "description": description, "url": f"https://github.com/owner/{name}", "license": None, "topics": list(topics)}
+
+REPOSITORIES = [
+    repository("fast-parser", ["json"], "A JSON parser written in Rust"),
+    repository("json-tools", ["cli", "json"], "Command line tools"),
+    repository("webapp", ["python"], "Parses JSON requests in a web framework"),
+    repository("notes", [], None),
+]
+
+def names(results):
+    return [repo["name"] for _, repo in results]
+
+def test_tokenizes_on_punctuation():
+    """
+    Test that names and topics are split into lower-cased words.
+    """
+    assert tokenize("Fast-Parser for JSON_5, v2") == ["fast", "parser", "for", "json_5", "v2"]
+
+def test_ranks_matches_of_every_term():
+    """
+    Test that only repositories with every term match, and that names weigh more than descriptions.
+    """
+    index = SearchIndex()
+    index.update(REPOSITORIES)
+
+    results, total = index.search("JSON", limit=10)
+    assert total == 3
+    assert names(results)[:2] == ["json-tools", "fast-parser"]
+    assert names(results)[-1] == "webapp"
+    assert names(index.search("json parser", limit=10)[0]) == ["fast-parser"]
+    assert index.search("json golang", limit=10) == ([], 0)
+    assert index.search("!!", limit=10) == ([], 0)
+
+def test_paginates_with_offsets():
+    """
+    Test that consecutive pages return every result once, in ranking order.
+    """
+    index = SearchIndex()
+    index.update(REPOSITORIES)
+    everything = names(index.search("json", limit=10)[0])
+
+    assert names(index.search("json", limit=2)[0]) + names(index.search("json", limit=2, offset=2)[0]) == everything
+
+def test_updates_only_changed_repositories():
+    """
+    Test that updating to a new list reindexes the added and changed repositories and drops the removed ones.
+    """
+    index = SearchIndex()
+    index.update(REPOSITORIES)
+    changed = [repository("fast-parser", ["json"], "A YAML parser"), repository("yaml-lint", ["yaml"])] + REPOSITORIES[1:3]
+
+    assert index.update(changed) == (2, 2)
+    assert len(index) == 4
+    assert "notes" not in index.postings
+    assert names(index.search("yaml", limit=10)[0]) == ["yaml-lint", "fast-parser"]
+    assert names(index.search("rust", limit=10)[0]) == []
+
+def test_store_refreshes_only_existing_indexes():
+    """
+    Test that a refetched list only updates users who already have an index, and that the store is bounded.
+    """
+    store = SearchIndexStore(max_users=1)
+    index = store.get(1, REPOSITORIES)
+    store.refresh(2, REPOSITORIES)
+    assert len(store) == 1
+
+    store.refresh(1, REPOSITORIES[:1])
+    assert len(index) == 1
+    store.get(2, REPOSITORIES)
+    assert len(store) == 1
@@ -0,0 +1,58 @@
+import asyncio
+import os
+import stat
+from app.sessions import SessionStore
+
+class FakeClock:
+    """
+    A manually advanced wall clock.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_sessions_are_shared_between_stores_of_the_same_database(tmp_path):
+    """
+    Test that a session created by one store, as in one worker process, is known to another store on the same file.
+    """
+    async def scenario():
+        path = str(tmp_path / "sessions.sqlite3")
+        workers = [SessionStore(path, secret=b"secret", ttl=60, max_sessions=10) for _ in range(2)]
+        token = await workers[0].create(1, "access_token")
+        found = await workers[1].get(token)
+        latest = await workers[1].latest(1)
+        await workers[1].revoke(token)
+        revoked = await workers[0].get(token)
+        for worker in workers:
+            await worker.aclose()
+        return path, found, latest, revoked
+
+    path, found, latest, revoked = asyncio.run(scenario())
+
+    assert (found.user_id, found.access_token) == (latest.user_id, latest.access_token) == (1, "access_token")
+    assert revoked is None
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+def test_sessions_expire_and_are_bounded(tmp_path):
+    """
+    Test that expired sessions are rejected, and that the sessions closest to expiry are dropped when the store is full.
+    """
+    clock = FakeClock()
+    store = SessionStore(str(tmp_path / "sessions.sqlite3"), secret=b"secret", ttl=60, max_sessions=2, clock=clock)
+    expiring = store.create_sync(1, "first_token")
+    clock.now += 30
+    oldest = store.create_sync(2, "second_token")
+    clock.now += 40
+    assert store.get_sync(expiring) is None
+    assert store.latest_sync(1) is None
+
+    store.create_sync(3, "third_token")
+    newest = store.create_sync(4, "fourth_token")
+
+    assert store.get_sync(oldest) is None
+    assert store.get_sync(newest).user_id == 4
+    assert store.get_sync(newest.partition(".")[0] + ".forged") is None
+    assert store.connection.execute("SELECT count(*) FROM sessions").fetchone()[0] == 2
+    asyncio.run(store.aclose())
@@ -0,0 +1,91 @@
+import asyncio
+from app.cache import StarredReposCache
+from app.store import RepositoryStore, warm_cache
+
+def repository(name, topics=(), license=None):
+    return {"name": name, "description": f"About {name}", "url": f"https://github.com/owner/{name}", "license": license, "topics": list(topics)}
+
+class FakeClock:
+    """
+    A manually advanced wall clock.
+    """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_saves_shared_repositories_once(tmp_path):
+    """
+    Test that lists round-trip in order and that a repository starred by several users is stored once.
+    """
+    async def scenario():
+        store = RepositoryStore(str(tmp_path / "store.sqlite3"), threads=2)
+        shared = repository("shared", ["python", "cli"], "MIT License")
+        store.save(1, [shared, repository("first")])
+        store.save(2, [repository("second", ["python"]), shared])
+        await store.aclose()
+
+        reopened = RepositoryStore(str(tmp_path / "store.sqlite3"))
+        first, _ = await reopened.load(1)
+        second, _ = await reopened.load(2)
+        missing = await reopened.load(3)
+        counts = [reopened.connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in ["repositories", "topics"]]
+        await reopened.aclose()
+        return first, second, missing, counts
+
+    first, second, missing, counts = asyncio.run(scenario())
+
+    assert first == [repository("shared", ["python", "cli"], "MIT License"), repository("first")]
+    assert second == [repository("second", ["python"]), repository("shared", ["python", "cli"], "MIT License")]
+    assert missing is None
+    assert counts == [3, 2]
+
+def test_removes_unstarred_repositories(tmp_path):
+    """
+    Test that saving a list drops repositories the user no longer stars, unless another user stars them.
+    """
+    store = RepositoryStore(str(tmp_path / "store.sqlite3"))
+    store.save_sync(1, [repository("kept"), repository("dropped"), repository("shared")])
+    store.save_sync(2, [repository("shared")])
+    store.save_sync(1, [repository("kept")])
+
+    urls = {row[0] for row in store.connection.execute("SELECT url FROM repositories")}
+    assert urls == {"https://github.com/owner/kept", "https://github.com/owner/shared"}
+    assert [repo["name"] for repo in store.load_sync(1)[0]] == ["kept"]
+    asyncio.run(store.aclose())
+
+def test_warms_cache_with_recent_lists(tmp_path):
+    """
+    Test that warming loads the lists still within the stale window of the cache, keeping their age.
+    """
+    clock = FakeClock()
+    store = RepositoryStore(str(tmp_path / "store.sqlite3"), clock=clock)
+    store.save_sync(1, [repository("old")])
+    clock.now += 15
+    store.save_sync(2, [repository("stale")])
+    clock.now += 10
+    store.save_sync(3, [repository("fresh")])
+    clock.now += 1
+
+    cache = StarredReposCache(ttl=5, stale_ttl=20, max_entries=10, max_size=100)
+    loaded = asyncio.run(warm_cache(store, cache, limit=10))
+
+    assert loaded == 2
+    assert cache.get(3)["repositories"] == [repository("fresh")]
+    assert cache.get(2) is None and cache.has(2)
+    assert not cache.has(1)
+    asyncio.run(store.aclose())
+
+def test_keeps_the_list_fetched_last(tmp_path):
+    """
+    Test that a save finishing after a save of a list fetched later does not replace that list.
+    """
+    store = RepositoryStore(str(tmp_path / "store.sqlite3"))
+
+    assert store.save_sync(1, [repository("newer")], synced_at=2000.0)
+    assert not store.save_sync(1, [repository("older")], synced_at=1000.0)
+
+    repositories, _ = store.load_sync(1)
+    assert [repo["name"] for repo in repositories] == ["newer"]
+    asyncio.run(store.aclose())
@@ -0,0 +1,109 @@
+import asyncio
+import httpx
+import respx
+from app.github import GITHUB_STAR_MEDIA_TYPE
+from app.sync import StarredSync, SyncStore, sync_starred_repos
+
+API_URL = "https://api.github.com"
+STARRED_URL = f"{API_URL}/user/starred"
+
+def star(index, minute):
+    name = f"repo-{index}"
+    return {"starred_at": f"2024-01-01T00:{minute:02d}:00Z", "repo": {"name": name, "html_url": f"https://github.com/owner/{name}"}}
+
+def names(state):
+    return [repository["name"] for repository in state.repositories]
+
+def mock_pages(pages, etag='"v1"'):
+    """
+    Mocks the pages of stars, newest first, with a `Link` header to the last page and an ETag on the first page.
+    """
+    routes = []
+    for number, items in enumerate(pages, start=1):
+        headers = {"Link": f'<{STARRED_URL}?page={len(pages)}>; rel="last"'} if len(pages) > 1 else {}
+        if number == 1:
+            headers["ETag"] = etag
+        routes.append(respx.get(STARRED_URL, params={"page": str(number)}, headers={"Accept": GITHUB_STAR_MEDIA_TYPE}).respond(200, json=items, headers=headers))
+    return routes
+
+def test_incremental_sync_stops_at_known_stars():
+    """
+    Test that a refresh only fetches pages until the newest known star and puts the new stars in front.
+    """
+    async def scenario():
+        async with httpx.AsyncClient(base_url=API_URL) as client:
+            with respx.mock:
+                mock_pages([[star(3, 30), star(2, 20)], [star(1, 10)]])
+                swept = await sync_starred_repos(client, "token", None, per_page=2, clock=lambda: 0.0)
+
+            with respx.mock:
+                first, second, third = mock_pages([[star(5, 50), star(4, 40)], [star(3, 30), star(2, 20)], [star(1, 10)]], etag='"v2"')
+                synced = await sync_starred_repos(client, "token", swept, per_page=2, clock=lambda: 10.0)
+
+        assert names(swept) == ["repo-3", "repo-2", "repo-1"]
+        assert names(synced) == ["repo-5", "repo-4", "repo-3", "repo-2", "repo-1"]
+        assert synced.newest_starred_at == "2024-01-01T00:50:00Z"
+        assert synced.etag == '"v2"'
+        assert [first.call_count, second.call_count, third.call_count] == [1, 1, 0]
+        assert first.calls[0].request.headers["If-None-Match"] == '"v1"'
+
+    asyncio.run(scenario())
+
+def test_incremental_sync_keeps_state_when_first_page_is_unchanged():
+    """
+    Test that a 304 for the first page keeps the stored list with no further requests.
+    """
+    async def scenario():
+        async with httpx.AsyncClient(base_url=API_URL) as client:
+            with respx.mock:
+                mock_pages([[star(2, 20), star(1, 10)]])
+                swept = await sync_starred_repos(client, "token", None, per_page=2, clock=lambda: 0.0)
+
+            with respx.mock:
+                route = respx.get(STARRED_URL, headers={"If-None-Match": '"v1"'}).respond(304)
+                synced = await sync_starred_repos(client, "token", swept, per_page=2, clock=lambda: 10.0)
+
+        assert synced is swept
+        assert route.call_count == 1
+
+    asyncio.run(scenario())
+
+def test_full_sweep_removes_unstarred_repositories():
+    """
+    Test that once the sweep interval has passed, every page is fetched again and unstarred repositories disappear.
+    """
+    async def scenario():
+        async with httpx.AsyncClient(base_url=API_URL) as client:
+            with respx.mock:
+                mock_pages([[star(3, 30), star(2, 20)], [star(1, 10)]])
+                swept = await sync_starred_repos(client, "token", None, per_page=2, clock=lambda: 0.0)
+
+            with respx.mock:
+                mock_pages([[star(3, 30), star(1, 10)]], etag='"v2"')
+                resynced = await sync_starred_repos(client, "token", swept, per_page=2, full_sweep_interval=60, clock=lambda: 60.0)
+
+        assert names(resynced) == ["repo-3", "repo-1"]
+        assert resynced.swept_at == 60.0
+
+    asyncio.run(scenario())
+
+def test_sync_store_is_bounded_by_the_repositories_of_its_states():
+    """
+    Test that the states of the least recently used users are evicted once the states hold too many repositories.
+    """
+    def state(size):
+        return StarredSync(repositories=[{"url": f"https://github.com/{i}"} for i in range(size)], newest_starred_at=None, etag=None, swept_at=0.0)
+
+    store = SyncStore(max_users=10, max_size=5)
+    store.set(1, state(2))
+    store.set(2, state(2))
+    store.set(1, state(3))
+    assert (len(store), store.size) == (2, 5)
+
+    store.get(2)
+    store.set(3, state(3))
+
+    assert 1 not in store and 2 in store and 3 in store
+    assert (store.size, store.evictions) == (5, 1)
+    store.set(3, state(9))
+    assert (len(store), store.size) == (1, 9)
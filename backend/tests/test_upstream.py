@@ -0,0 +1,196 @@
+import asyncio
+import httpx
+import pytest
+from app.upstream import CircuitBreaker, GitHubRateLimitedError, GitHubTransport, GitHubUnavailableError, RateLimitTracker
+
+API_URL = "https://api.github.com"
+
+class FakeClock:
+    """
+    A manually advanced clock.
+    """
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def make_client(responses, breaker=None, rate_limits=None, **kwargs):
+    """
+    Creates a client whose requests to GitHub are answered with `responses` in order, recording the requests and retry delays.
+
+    Waiting for a retry advances the clock of the default rate limit tracker.
+    """
+    requests, delays = [], []
+    clock = FakeClock()
+
+    def handler(request):
+        requests.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def sleep(delay):
+        delays.append(delay)
+        clock.now += delay
+
+    transport = GitHubTransport(
+        httpx.MockTransport(handler),
+        api_url=API_URL,
+        rate_limits=RateLimitTracker(clock=clock) if rate_limits is None else rate_limits,
+        breaker=CircuitBreaker(failure_threshold=10, reset_timeout=30) if breaker is None else breaker,
+        sleep=sleep,
+        **kwargs,
+    )
+    return httpx.AsyncClient(base_url=API_URL, transport=transport, headers={"Authorization": "token secret"}), requests, delays
+
+def rate_limit_headers(remaining, limit=5000, reset=2000):
+    return {"X-RateLimit-Limit": str(limit), "X-RateLimit-Remaining": str(remaining), "X-RateLimit-Reset": str(reset)}
+
+def test_retries_server_errors_with_backoff():
+    """
+    Test that server errors and connection failures are retried with growing delays until GitHub answers.
+    """
+    client, requests, delays = make_client(
+        [httpx.Response(502), httpx.ConnectError("refused"), httpx.Response(200, json={"id": 1})], backoff=1.0, max_wait=10.0
+    )
+    response = asyncio.run(client.get("/user"))
+
+    assert response.status_code == 200
+    assert len(requests) == 3
+    assert len(delays) == 2 and 0 <= delays[0] <= 1 and 0 <= delays[1] <= 2
+
+def test_gives_up_after_max_retries():
+    """
+    Test that the last failing response is returned once the retries are used up, and that client errors are not retried.
+    """
+    client, requests, _ = make_client([httpx.Response(500)] * 3 + [httpx.Response(404)], max_retries=2)
+
+    assert asyncio.run(client.get("/user")).status_code == 500
+    assert len(requests) == 3
+    assert asyncio.run(client.get("/user")).status_code == 404
+    assert len(requests) == 4
+
+def test_retries_secondary_rate_limits_after_retry_after():
+    """
+    Test that a secondary rate limit is retried after the delay GitHub asks for, and not retried when it asks for too long.
+    """
+    client, requests, delays = make_client(
+        [httpx.Response(403, headers={"Retry-After": "2"}), httpx.Response(200), httpx.Response(429, headers={"Retry-After": "120"})], backoff=0.0
+    )
+
+    assert asyncio.run(client.get("/user/starred")).status_code == 200
+    assert delays == [2.0]
+    with pytest.raises(GitHubRateLimitedError):
+        asyncio.run(client.get("/user/starred"))
+    assert len(requests) == 3
+
+def test_secondary_rate_limit_of_one_token_leaves_the_breaker_closed():
+    """
+    Test that a token throttled by a secondary rate limit fails fast on its own, without opening the breaker for other tokens.
+    """
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    client, requests, _ = make_client(
+        [httpx.Response(403, json={"message": "You have exceeded a secondary rate limit."}), httpx.Response(200)], breaker=breaker, max_wait=10.0
+    )
+
+    with pytest.raises(GitHubRateLimitedError) as throttled:
+        asyncio.run(client.get("/user/starred"))
+    assert throttled.value.retry_after >= 60
+    assert breaker.state == "closed" and breaker.trips == 0
+    assert asyncio.run(client.get("/user/starred", headers={"Authorization": "token other"})).status_code == 200
+    with pytest.raises(GitHubRateLimitedError):
+        asyncio.run(client.get("/user/starred"))
+    assert len(requests) == 2
+
+def test_fails_fast_while_rate_limit_is_exhausted():
+    """
+    Test that a token whose quota is exhausted is not used until its window resets, and that concurrency shrinks with the quota.
+    """
+    clock = FakeClock()
+    rate_limits = RateLimitTracker(clock=clock)
+    client, requests, _ = make_client(
+        [httpx.Response(200, headers=rate_limit_headers(1000)), httpx.Response(403, headers=rate_limit_headers(0)), httpx.Response(200)],
+        rate_limits=rate_limits,
+    )
+
+    asyncio.run(client.get("/user/starred"))
+    assert rate_limits.concurrency("secret", 8) == 2
+    assert rate_limits.concurrency("other", 8) == 8
+    with pytest.raises(GitHubRateLimitedError) as exhausted:
+        asyncio.run(client.get("/user/starred"))
+    assert exhausted.value.retry_after == 1000
+    with pytest.raises(GitHubRateLimitedError):
+        asyncio.run(client.get("/user/starred"))
+    assert len(requests) == 2
+
+    clock.now = 2000
+    assert asyncio.run(client.get("/user/starred")).status_code == 200
+
+def test_circuit_breaker_opens_and_probes():
+    """
+    Test that consecutive failures open the breaker, that calls then fail fast, and that a successful probe closes it.
+    """
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock)
+    client, requests, _ = make_client([httpx.Response(503), httpx.Response(503), httpx.Response(503), httpx.Response(200)], breaker=breaker, max_retries=5)
+
+    assert asyncio.run(client.get("/user")).status_code == 503
+    assert len(requests) == 2 and breaker.state == "open"
+    with pytest.raises(GitHubUnavailableError) as unavailable:
+        asyncio.run(client.get("/user"))
+    assert unavailable.value.retry_after == 30
+
+    clock.now += 30
+    assert breaker.state == "half_open"
+    assert asyncio.run(client.get("/user")).status_code == 503
+    assert breaker.state == "open" and breaker.trips == 2
+
+    clock.now += 30
+    assert asyncio.run(client.get("/user")).status_code == 200
+    assert breaker.state == "closed"
+
+def test_passes_other_hosts_through():
+    """
+    Test that requests outside the API, such as the OAuth token exchange, are neither retried nor stopped by the breaker.
+    """
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    client, requests, _ = make_client([httpx.Response(500)], breaker=breaker)
+
+    assert asyncio.run(client.post("https://github.com/login/oauth/access_token")).status_code == 500
+    assert len(requests) == 1
+
+class StreamedBody(httpx.AsyncByteStream):
+    """
+    A response body streamed like one read from a connection, unlike the bodies of responses built from bytes.
+    """
+    async def __aiter__(self):
+        yield b'{"id": 1}'
+
+def test_counts_requests_in_flight_until_their_response_is_closed():
+    """
+    Test that a request is counted in flight while its body streams, and no longer after retried responses and failures.
+    """
+    client, requests, _ = make_client([
+        httpx.Response(200, stream=StreamedBody()), httpx.Response(502, stream=StreamedBody()),
+        httpx.Response(200, stream=StreamedBody()), httpx.ConnectError("refused"), httpx.ConnectError("refused"),
+    ], max_retries=1)
+    transport = client._transport
+
+    async def scenario():
+        counts = []
+        async with client.stream("GET", "/user") as response:
+            counts.append(transport.in_flight)
+            await response.aread()
+        counts.append(transport.in_flight)
+        await client.get("/user")
+        counts.append(transport.in_flight)
+        with pytest.raises(httpx.ConnectError):
+            await client.get("/user")
+        counts.append(transport.in_flight)
+        return counts
+
+    assert asyncio.run(scenario()) == [1, 0, 0, 0]
+    assert len(requests) == 5